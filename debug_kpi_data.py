@@ -12,7 +12,8 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Import the KPI calculation function
-from factuurcontrole_dashboard import calculate_kpi_scores
+from factuurcontrole_db import load_facturen
+from factuurcontrole_kpi import calculate_kpi_scores, compileer_kpi_parameters
 
 def debug_kpi_data():
     """Debug the KPI data collection and calculation process"""
@@ -22,16 +23,16 @@ def debug_kpi_data():
     # Connect to database
     conn = sqlite3.connect('factuurcontrole.db')
     
-    # Get facturen data
-    facturen_df = pd.read_sql_query("SELECT * FROM facturen", conn)
+    # Get facturen data (met afwijkingen)
+    facturen_df = load_facturen(conn)
     print(f"📊 Found {len(facturen_df)} facturen")
     
     # Get KPI parameters
     kpi_params_df = pd.read_sql_query("SELECT * FROM kpi_parameters", conn)
     print(f"📋 Found {len(kpi_params_df)} KPI parameters")
     
-    # Use DataFrame directly
-    kpi_params = kpi_params_df
+    # Eén keer omzetten naar de opzoektabel
+    kpi_params = compileer_kpi_parameters(kpi_params_df)
     
     # Debug each factuur
     kpi_data = []
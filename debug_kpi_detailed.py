@@ -11,6 +11,8 @@ import os
 # Add the current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from factuurcontrole_kpi import calculate_kpi_scores, compileer_kpi_parameters
+
 def debug_detailed_kpi():
     """Debug the KPI data collection with actual calculations"""
     
@@ -29,6 +31,8 @@ def debug_detailed_kpi():
         f.vervoerder,
         f.ritten_besteld,
         f.ritten_uitgevoerd,
+        f.ritten_geannuleerd,
+        f.ritten_loos,
         f.routes,
         a.controle_bestelling_sw,
         a.controle_gegevens_levering,
@@ -49,17 +53,8 @@ def debug_detailed_kpi():
     kpi_params = pd.read_sql_query("SELECT * FROM kpi_parameters", conn)
     print(f"📋 Found {len(kpi_params)} KPI parameters")
     
-    # Map KPI parameters to columns
-    kpi_mapping = {
-        'controle_bestelling_sw': 'Bestelling Sw',
-        'controle_gegevens_levering': 'Gegevens Levering',
-        'controle_stiptheid': 'Stiptheid',
-        'controle_indicaties': 'Indicaties',
-        'controle_reistijd': 'Reistijd',
-        'controle_dubbel_factuur': 'Dubbel Factuur',
-        'controle_lege_routes': 'Lege Routes',
-        'controle_afwezig_melding': 'Afwezig Melding'
-    }
+    # Eén keer omzetten naar de opzoektabel (afwijking -> doel en grondslag)
+    parameters = compileer_kpi_parameters(kpi_params)
     
     # Calculate KPI values
     kpi_results = []
@@ -68,31 +63,20 @@ def debug_detailed_kpi():
         print(f"\n--- Factuur ID {row['factuur_id']} ---")
         print(f"Jaar: {row['jaar']}, Maand: {row['maand']}, Percel: {row['perceel']}")
         
-        for _, kpi_param in kpi_params.iterrows():
-            kpi_column = kpi_param['afwijking_type']
-            if kpi_column in kpi_mapping:
-                actual_count = row[kpi_column]
-                basis_value = row['ritten_uitgevoerd'] if 'ritten' in kpi_param['berekenings_basis'] else row['routes']
-                
-                # Calculate percentage
-                if basis_value > 0:
-                    percentage = round((actual_count / basis_value) * 100, 1)
-                else:
-                    percentage = 0.0
-                
-                kpi_name = kpi_mapping[kpi_column]
-                
-                print(f"  - {kpi_name}: {percentage}% ({actual_count}/{basis_value})")
-                
-                kpi_results.append({
-                    'factuur_id': row['factuur_id'],
-                    'jaar': row['jaar'],
-                    'maand': row['maand'],
-                    'kpi_type': kpi_name,
-                    'percentage': percentage,
-                    'aantal': actual_count,
-                    'basis': basis_value
-                })
+        for kpi in calculate_kpi_scores(row, parameters):
+            percentage = round(kpi['percentage'], 1)
+            
+            print(f"  - {kpi['naam']}: {percentage}% ({kpi['aantal']}/{kpi['basis']})")
+            
+            kpi_results.append({
+                'factuur_id': row['factuur_id'],
+                'jaar': row['jaar'],
+                'maand': row['maand'],
+                'kpi_type': kpi['naam'],
+                'percentage': percentage,
+                'aantal': kpi['aantal'],
+                'basis': kpi['basis']
+            })
     
     conn.close()
     
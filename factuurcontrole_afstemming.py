@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Automatische controle "Bestelling ook in SW": staat elke gefactureerde rit
+in de export van het bestelsysteem?
+
+Een rit en een bestelling horen bij elkaar als datum, perceel, klant,
+herkomst en bestemming (genormaliseerd) gelijk zijn; meerdere ritten met
+dezelfde sleutel hebben elk een eigen bestelling nodig (de eerst
+ingelezen rit krijgt de bestelling).
+
+Beide kanten worden gestreamd en als gehashte sleutels in partities op
+schijf gezet; de partitie volgt uit (datum, perceel). Per partitie komt
+een hashtabel op de kleinste kant en gaat de andere kant er in chunks
+langs (grace hash join), zodat ook exports groter dan het geheugen passen.
+
+Alleen facturen van een maand en perceel die in de export voorkomen worden
+afgestemd: een export van een deel van de percelen laat de rest staan.
+Per factuur komt het aantal ritten zonder bestelling in
+afwijkingen.controle_bestelling_sw; de ritten zelf staan in
+ontbrekende_bestellingen.
+
+Gebruik:
+    python factuurcontrole_afstemming.py sw_export.csv [--db factuurcontrole.db] [--partities 64]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+from factuurcontrole_db import DB_FILE, init_db, connect, refresh_kpi_scores
+from factuurcontrole_dubbel import normaliseer_sleutel
+from factuurcontrole_import import lees_chunks, normaliseer_kolomnaam
+from factuurcontrole_ritten import KOLOM_ALIASSEN, TEKST_KOLOMMEN, lees_datum_tijd
+
+# === Configuratie ===
+CHUNK_SIZE = 100_000
+
+# Aantal partities op schijf; meer partities = kleinere hashtabellen
+PARTITIES = 64
+
+# Kolommen die naast datum en perceel een rit aan een bestelling koppelen
+SLEUTEL_KOLOMMEN = ["klant", "herkomst", "bestemming"]
+
+# Records in de partitiebestanden
+RIT_RECORD = np.dtype([("rit_id", "i8"), ("factuur_id", "i8"), ("sleutel", "u8")])
+BESTELLING_RECORD = np.dtype([("sleutel", "u8")])
+
+# === Partitioneren ===
+def _hash(dag, perceel, waarden, sleutel, partities):
+    """(partitie, sleutel) per rij: de partitie hangt alleen van dag en perceel af"""
+    basis = pd.DataFrame({
+        "dag": dag.to_numpy(dtype="datetime64[D]").astype("int64"),
+        "perceel": perceel.to_numpy(dtype="int64"),
+    })
+    partitie = pd.util.hash_pandas_object(basis, index=False).to_numpy() % partities
+    for kolom in sleutel:
+        basis[kolom] = normaliseer_sleutel(waarden[kolom]).to_numpy(dtype=object)
+    return partitie.astype(np.intp), pd.util.hash_pandas_object(basis, index=False).to_numpy()
+
+def _schrijf_partities(map_, naam, partitie, records, partities):
+    """Voeg de records per partitie toe aan naam_<partitie>.bin"""
+    volgorde = np.argsort(partitie, kind="stable")
+    grenzen = np.searchsorted(partitie[volgorde], np.arange(partities + 1))
+    for p in np.flatnonzero(np.diff(grenzen)):
+        with open(os.path.join(map_, f"{naam}_{p}.bin"), "ab") as f:
+            records[volgorde[grenzen[p]:grenzen[p + 1]]].tofile(f)
+
+def _lees_records(pad, dtype, chunk_size):
+    """Lees een partitiebestand in chunks van maximaal chunk_size records"""
+    if not os.path.exists(pad):
+        return
+    with open(pad, "rb") as f:
+        while True:
+            chunk = np.fromfile(f, dtype=dtype, count=chunk_size)
+            if not len(chunk):
+                return
+            yield chunk
+
+def _bestellingen(chunk, sleutel):
+    """Genormaliseerde datum, perceel en sleutelkolommen van een chunk uit de export (ongeldige rijen vallen af)"""
+    chunk = chunk.copy()
+    chunk.columns = [normaliseer_kolomnaam(k) for k in chunk.columns]
+    chunk = chunk.rename(columns={k: v for k, v in KOLOM_ALIASSEN.items() if v not in chunk.columns})
+    chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+    ontbrekend = [k for k in ["datum", "perceel"] + sleutel if k not in chunk.columns]
+    if ontbrekend:
+        raise ValueError(f"Kolom(men) {', '.join(ontbrekend)} ontbreken in de export")
+
+    dag = lees_datum_tijd(chunk["datum"].astype("string").str.strip()).dt.normalize()
+    perceel = pd.to_numeric(chunk["perceel"], errors="coerce")
+    geldig = dag.notna() & perceel.notna()
+    return dag[geldig], perceel[geldig], chunk.loc[geldig, sleutel]
+
+# === Afstemmen ===
+def _stem_partitie_af(ritten_pad, bestellingen_pad, ritten_kleiner, chunk_size):
+    """Ritten (RIT_RECORD) van één partitie waarvoor geen bestelling over is.
+
+    De kleinste kant gaat als hashtabel (sleutel -> aantal) in het geheugen,
+    de grootste wordt in chunks gelezen.
+    """
+    ongematcht = []
+    if ritten_kleiner:
+        ritten = np.fromfile(ritten_pad, dtype=RIT_RECORD)
+        sleutels = pd.Index(ritten["sleutel"]).unique()
+        beschikbaar = pd.Series(0, index=sleutels)
+        for chunk in _lees_records(bestellingen_pad, BESTELLING_RECORD, chunk_size):
+            gevonden = pd.Series(chunk["sleutel"])
+            beschikbaar = beschikbaar.add(gevonden[gevonden.isin(sleutels)].value_counts(), fill_value=0)
+        rang = pd.Series(ritten["sleutel"]).groupby(ritten["sleutel"]).cumcount().to_numpy()
+        ongematcht.append(ritten[rang >= beschikbaar.reindex(ritten["sleutel"]).to_numpy()])
+    else:
+        bestellingen = (np.fromfile(bestellingen_pad, dtype=BESTELLING_RECORD) if os.path.exists(bestellingen_pad)
+                        else np.empty(0, dtype=BESTELLING_RECORD))
+        beschikbaar = pd.Series(bestellingen["sleutel"]).value_counts()
+        # Per sleutel het aantal ritten uit eerdere chunks dat al een bestelling heeft gekregen
+        gebruikt = pd.Series(0, index=beschikbaar.index)
+        for ritten in _lees_records(ritten_pad, RIT_RECORD, chunk_size):
+            sleutels = pd.Series(ritten["sleutel"])
+            rang = (sleutels.groupby(ritten["sleutel"]).cumcount().to_numpy()
+                    + gebruikt.reindex(sleutels, fill_value=0).to_numpy())
+            ongematcht.append(ritten[rang >= beschikbaar.reindex(sleutels, fill_value=0).to_numpy()])
+            gebruikt = gebruikt.add(sleutels[sleutels.isin(beschikbaar.index)].value_counts(), fill_value=0)
+    return np.concatenate(ongematcht) if ongematcht else np.empty(0, dtype=RIT_RECORD)
+
+def stem_bestellingen_af(bron, db_file=DB_FILE, perioden=None, sleutel=SLEUTEL_KOLOMMEN,
+                         partities=PARTITIES, chunk_size=CHUNK_SIZE, bestandstype=None, blad=None):
+    """Stem de gefactureerde ritten af met een export (xlsx of csv) van het bestelsysteem.
+
+    Alleen facturen met ritten van een (jaar, maand, perceel) uit de export
+    worden bijgewerkt; perioden (lijst (jaar, maand)) beperkt dat verder tot
+    die maanden. Geeft een dict terug met 'bestellingen', 'ongeldig',
+    'ritten', 'ontbrekend', 'facturen' (bijgewerkte ids) en 'scope' (de
+    afgestemde (jaar, maand, perceel)).
+    """
+    onbekend = [k for k in sleutel if k not in TEKST_KOLOMMEN]
+    if onbekend:
+        raise ValueError(f"Onbekende sleutelkolom(men): {', '.join(onbekend)}")
+    init_db(db_file)
+    resultaat = {"bestellingen": 0, "ongeldig": 0, "ritten": 0, "ontbrekend": 0, "facturen": [], "scope": []}
+    aantal_bestellingen = np.zeros(partities, dtype="int64")
+    aantal_ritten = np.zeros(partities, dtype="int64")
+
+    with tempfile.TemporaryDirectory(prefix="factuurcontrole_afstemming_") as map_:
+        # Export van het bestelsysteem partitioneren
+        combinaties = set()
+        for chunk in lees_chunks(bron, chunk_size, bestandstype, blad):
+            dag, perceel, waarden = _bestellingen(chunk, sleutel)
+            resultaat["bestellingen"] += len(dag)
+            resultaat["ongeldig"] += len(chunk) - len(dag)
+            if dag.empty:
+                continue
+            combinaties.update(
+                pd.DataFrame({"jaar": dag.dt.year, "maand": dag.dt.month, "perceel": perceel.astype("int64")})
+                .drop_duplicates().itertuples(index=False, name=None)
+            )
+            partitie, sleutels = _hash(dag, perceel, waarden, sleutel, partities)
+            aantal_bestellingen += np.bincount(partitie, minlength=partities)
+            records = np.empty(len(sleutels), dtype=BESTELLING_RECORD)
+            records["sleutel"] = sleutels
+            _schrijf_partities(map_, "bestellingen", partitie, records, partities)
+        if perioden is not None:
+            perioden = {(int(jaar), int(maand)) for jaar, maand in perioden}
+            combinaties = {c for c in combinaties if c[:2] in perioden}
+        resultaat["scope"] = sorted(combinaties)
+
+        with connect(db_file) as conn:
+            # Gefactureerde ritten van dezelfde maanden en percelen partitioneren, in volgorde van id
+            # zodat vaststaat welke rit met een gedeelde sleutel een bestelling krijgt
+            query = f"""
+                SELECT r.id AS rit_id, r.factuur_id, r.datum, f.perceel, {', '.join(f'r.{k}' for k in sleutel)}
+                FROM facturen f
+                JOIN ritten r ON r.factuur_id = f.id
+                WHERE f.jaar = ? AND f.maand = ? AND f.perceel = ?
+                ORDER BY r.id
+            """
+            factuur_ids = []
+            for combinatie in resultaat["scope"]:
+                factuur_ids += [rij[0] for rij in conn.execute("""
+                    SELECT f.id FROM facturen f
+                    WHERE f.jaar = ? AND f.maand = ? AND f.perceel = ?
+                      AND EXISTS (SELECT 1 FROM ritten r WHERE r.factuur_id = f.id)
+                """, combinatie)]
+                for ritten in pd.read_sql_query(query, conn, params=combinatie, chunksize=chunk_size):
+                    dag = pd.to_datetime(ritten["datum"], format="ISO8601")
+                    partitie, sleutels = _hash(dag, ritten["perceel"], ritten, sleutel, partities)
+                    aantal_ritten += np.bincount(partitie, minlength=partities)
+                    records = np.empty(len(ritten), dtype=RIT_RECORD)
+                    records["rit_id"] = ritten["rit_id"].to_numpy()
+                    records["factuur_id"] = ritten["factuur_id"].to_numpy()
+                    records["sleutel"] = sleutels
+                    _schrijf_partities(map_, "ritten", partitie, records, partities)
+            resultaat["ritten"] = int(aantal_ritten.sum())
+            if not factuur_ids:
+                return resultaat
+
+            # Per partitie afstemmen en de ritten zonder bestelling vastleggen
+            for start in range(0, len(factuur_ids), 500):
+                chunk = factuur_ids[start:start + 500]
+                conn.execute(
+                    f"DELETE FROM ontbrekende_bestellingen WHERE factuur_id IN ({','.join('?' * len(chunk))})", chunk
+                )
+            aantallen = pd.Series(0, index=pd.Index(factuur_ids, name="factuur_id"))
+            for p in np.flatnonzero(aantal_ritten):
+                ongematcht = _stem_partitie_af(
+                    os.path.join(map_, f"ritten_{p}.bin"), os.path.join(map_, f"bestellingen_{p}.bin"),
+                    aantal_ritten[p] <= aantal_bestellingen[p], chunk_size
+                )
+                conn.executemany(
+                    "INSERT INTO ontbrekende_bestellingen (rit_id, factuur_id) VALUES (?, ?)",
+                    ongematcht[["rit_id", "factuur_id"]].tolist()
+                )
+                aantallen = aantallen.add(pd.Series(ongematcht["factuur_id"]).value_counts(), fill_value=0)
+                resultaat["ontbrekend"] += len(ongematcht)
+
+            # Alleen echte wijzigingen schrijven: elke update zet de KPI triggers in gang
+            conn.executemany("""
+                UPDATE afwijkingen SET controle_bestelling_sw = ?
+                WHERE factuur_id = ? AND controle_bestelling_sw IS NOT ?
+            """, ((int(aantal), int(i), int(aantal)) for i, aantal in aantallen.items()))
+            refresh_kpi_scores(conn, factuur_ids)
+            conn.commit()
+            resultaat["facturen"] = factuur_ids
+    return resultaat
+
+# === Drill-down ===
+def load_ontbrekende_bestellingen(conn, factuur_id):
+    """Gefactureerde ritten van een factuur zonder bestelling in het bestelsysteem"""
+    return pd.read_sql_query("""
+        SELECT r.ritnummer, r.datum, r.status, r.klant, r.herkomst, r.bestemming,
+               COALESCE(r.gepland_ophalen, r.werkelijk_ophalen) AS ophalen
+        FROM ontbrekende_bestellingen o
+        JOIN ritten r ON r.id = o.rit_id
+        WHERE o.factuur_id = ?
+        ORDER BY r.datum, ophalen
+    """, conn, params=(int(factuur_id),))
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stem de gefactureerde ritten af met een export van het bestelsysteem")
+    parser.add_argument("bestand", help="Pad naar de export (xlsx of csv)")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database (standaard: %(default)s)")
+    parser.add_argument("--periode", action="append",
+                        help="Alleen deze maand als JJJJ-MM (herhaalbaar, standaard alle maanden in de export)")
+    parser.add_argument("--sleutel", nargs="+", default=SLEUTEL_KOLOMMEN, choices=TEKST_KOLOMMEN,
+                        help="Kolommen naast datum en perceel (standaard: %(default)s)")
+    parser.add_argument("--partities", type=int, default=PARTITIES, help="Aantal partities op schijf")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rijen per chunk")
+    parser.add_argument("--blad", help="Naam van het werkblad (xlsx, standaard het eerste)")
+    args = parser.parse_args(argv)
+
+    perioden = [tuple(int(deel) for deel in p.split("-")) for p in args.periode] if args.periode else None
+    resultaat = stem_bestellingen_af(args.bestand, args.db, perioden, args.sleutel,
+                                     args.partities, args.chunk_size, blad=args.blad)
+    print(f"🔎 {resultaat['bestellingen']} bestellingen gelezen ({resultaat['ongeldig']} ongeldig), "
+          f"{resultaat['ritten']} ritten afgestemd, {resultaat['ontbrekend']} zonder bestelling "
+          f"op {len(resultaat['facturen'])} facturen "
+          f"({len(resultaat['scope'])} combinaties van maand en perceel uit de export)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
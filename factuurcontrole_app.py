@@ -1,38 +1,71 @@
-import sqlite3
 import streamlit as st
 import pandas as pd
+import json
 import os
 from datetime import datetime
+from factuurcontrole_db import init_db, connect, refresh_kpi_scores, compacte_dtypes
+from factuurcontrole_afstemming import stem_bestellingen_af, load_ontbrekende_bestellingen
+from factuurcontrole_cache import cached
+from factuurcontrole_dubbel import load_dubbele_ritten
+from factuurcontrole_herberekening import plan_herberekening, hervat_herberekening, herberekening_status
+from factuurcontrole_import import FACTUUR_KOLOMMEN, importeer_facturen
+from factuurcontrole_ritten import importeer_ritten
+from factuurcontrole_kpi import AFWIJKING_TYPES, calculate_kpi_scores
 
 # === Configuratie ===
 DB_FILE = "factuurcontrole.db"
 
+# Controles die voor facturen met ritten automatisch berekend worden (kolom -> uitleg in het formulier)
+RITTEN_CONTROLES = {
+    "controle_bestelling_sw": "Wordt bij het afstemmen met de SW export bepaald (factuurcontrole_afstemming).",
+    "controle_stiptheid": "Wordt bij elke ritimport uit de ritlijst bepaald (factuurcontrole_stiptheid).",
+    "controle_reistijd": "Wordt bij elke ritimport uit de ritlijst bepaald (factuurcontrole_stiptheid).",
+    "controle_dubbel_factuur": "Wordt bij elke ritimport uit de ritlijst bepaald (factuurcontrole_dubbel).",
+}
+init_db(DB_FILE)
+hervat_herberekening(DB_FILE)
+
 # === Functie om bestaande data te laden of nieuwe aan te maken ===
 def load_data():
-    with sqlite3.connect(DB_FILE) as conn:
-        df = pd.read_sql_query("SELECT * FROM facturen", conn)
+    return cached('app_facturen', DB_FILE, _load_data)
+
+def _load_data():
+    # Met de versie per rij, zodat de data editor verouderde rijen herkent
+    with connect(DB_FILE) as conn:
+        df = pd.read_sql_query("""
+            SELECT f.*, COALESCE(v.versie, 0) AS versie
+            FROM facturen f
+            LEFT JOIN factuur_versies v ON v.factuur_id = f.id
+        """, conn)
+    # Geen categorieën: in de data editor moeten nieuwe percelen en vervoerders kunnen
+    return compacte_dtypes(df, categorieen=False)
+
+def load_kpi_parameters():
+    return cached('app_kpi_parameters', DB_FILE, _load_kpi_parameters)
+
+def _load_kpi_parameters():
+    with connect(DB_FILE) as conn:
+        df = pd.read_sql_query("SELECT * FROM kpi_parameters ORDER BY afwijking_type", conn)
     return df
 
+# === KPI herberekening ===
+@st.fragment(run_every=2)
+def toon_herberekening():
+    """Voortgang van de achtergrond herberekening; ververst zichzelf elke 2 seconden"""
+    status = herberekening_status(DB_FILE)
+    if status is None:
+        return
+    if status['status'] in ('wachtrij', 'bezig', 'wisselen'):
+        totaal = status['totaal'] or 0
+        voortgang = status['verwerkt'] / totaal if totaal else 0.0
+        st.progress(voortgang, text=f"KPI scores herberekenen: {status['verwerkt']} van {totaal} facturen")
+    elif status['status'] == 'fout':
+        st.error(f"Herberekening van de KPI scores mislukt: {status['fout']}")
+
 # === Opslaan ===
 def save_data(new_row):
-    with sqlite3.connect(DB_FILE) as conn:
+    with connect(DB_FILE) as conn:
         cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS facturen (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                jaar INTEGER,
-                maand INTEGER,
-                perceel INTEGER,
-                vervoerder TEXT,
-                vaste_kosten REAL,
-                variabele_kosten REAL,
-                ritten_besteld INTEGER,
-                ritten_geannuleerd INTEGER,
-                ritten_loos INTEGER,
-                ritten_uitgevoerd INTEGER,
-                routes INTEGER
-            );
-        """)
         cursor.execute("""
             INSERT INTO facturen 
             (jaar, maand, perceel, vervoerder, vaste_kosten, variabele_kosten, 
@@ -44,9 +77,77 @@ def save_data(new_row):
             new_row["RittenGeannuleerd"], new_row["RittenLoos"], new_row["RittenUitgevoerd"],
             new_row["Routes"]
         ))
+        refresh_kpi_scores(conn, [cursor.lastrowid])
         conn.commit()
     st.success("Factuurgegevens opgeslagen!")
 
+def save_editor_changes(data, changes):
+    """Sla alleen de gewijzigde, toegevoegde en verwijderde rijen van de data editor op.
+
+    changes is de state van st.data_editor (edited_rows, added_rows,
+    deleted_rows); posities verwijzen naar rijen in data. Bestaande ids
+    blijven behouden. Rijen die sinds het laden van data door een ander
+    gewijzigd of verwijderd zijn (andere versie), worden overgeslagen en als
+    verouderd teruggegeven.
+    """
+    ids = data["id"]
+    versies = data["versie"]
+    geladen = {}
+    for pos in list(changes.get("deleted_rows", [])) + list(changes.get("edited_rows", {})):
+        geladen[int(ids.iloc[int(pos)])] = int(versies.iloc[int(pos)])
+
+    nieuwe_rijen = [tuple(rij.get(k) for k in FACTUUR_KOLOMMEN) for rij in changes.get("added_rows", [])]
+
+    with connect(DB_FILE) as conn:
+        cursor = conn.cursor()
+        # Versies controleren en opslaan in één schrijftransactie
+        cursor.execute("BEGIN IMMEDIATE")
+        huidig = dict(cursor.execute("""
+            SELECT f.id, COALESCE(v.versie, 0)
+            FROM facturen f
+            LEFT JOIN factuur_versies v ON v.factuur_id = f.id
+            WHERE f.id IN (SELECT value FROM json_each(?))
+        """, (json.dumps(list(geladen)),)).fetchall())
+        verouderd = sorted(i for i, versie in geladen.items() if huidig.get(i) != versie)
+
+        verwijderd = sorted({
+            int(ids.iloc[int(pos)]) for pos in changes.get("deleted_rows", [])
+        } - set(verouderd))
+
+        # Groepeer updates per set gewijzigde kolommen, zodat elke groep één executemany is
+        updates = {}
+        for pos, wijzigingen in changes.get("edited_rows", {}).items():
+            factuur_id = int(ids.iloc[int(pos)])
+            kolommen = tuple(k for k in FACTUUR_KOLOMMEN if k in wijzigingen)
+            if factuur_id in verwijderd or factuur_id in verouderd or not kolommen:
+                continue
+            updates.setdefault(kolommen, []).append([wijzigingen[k] for k in kolommen] + [factuur_id])
+        gewijzigd = [params[-1] for groep in updates.values() for params in groep]
+
+        for kolommen, params in updates.items():
+            cursor.executemany(
+                f"UPDATE facturen SET {', '.join(f'{k} = ?' for k in kolommen)} WHERE id = ?",
+                params
+            )
+
+        # Ids per rij uit lastrowid: een MAX(id) ervoor telt ook rijen van andere sessies mee
+        nieuwe_ids = []
+        for rij in nieuwe_rijen:
+            cursor.execute(f"""
+                INSERT INTO facturen ({', '.join(FACTUUR_KOLOMMEN)})
+                VALUES ({', '.join('?' * len(FACTUUR_KOLOMMEN))})
+            """, rij)
+            nieuwe_ids.append(cursor.lastrowid)
+
+        if verwijderd:
+            cursor.executemany("DELETE FROM afwijkingen WHERE factuur_id = ?", [(i,) for i in verwijderd])
+            cursor.executemany("DELETE FROM facturen WHERE id = ?", [(i,) for i in verwijderd])
+
+        refresh_kpi_scores(conn, gewijzigd + nieuwe_ids)
+        conn.commit()
+
+    return len(gewijzigd), len(nieuwe_ids), len(verwijderd), verouderd
+
 tab1, tab2, tab3 = st.tabs(["📥 Basisfactuur invoer", "📝 Afwijkingen invoeren", "⚙️ KPI Parameters"])
 
 with tab1:
@@ -96,30 +197,72 @@ with tab1:
             }
             save_data(nieuwe_row)
 
+    # Bulk import
+    with st.expander("📂 Bulk import uit Excel/CSV"):
+        st.caption("Kolommen zoals in de facturen tabel (jaar, maand, perceel, vervoerder, ...) "
+                   "of de indeling van de Perceelrapportage (Periode, Perceel, Vervoerder, ...).")
+        import_bestand = st.file_uploader("Bestand", type=["xlsx", "csv"], key="bulk_import_bestand")
+        if import_bestand is not None and st.button("Importeren", key="bulk_import_knop"):
+            with st.spinner("Bezig met importeren..."):
+                resultaat = importeer_facturen(import_bestand, DB_FILE)
+            st.success(f"{resultaat['geimporteerd']} van {resultaat['gelezen']} rijen geïmporteerd.")
+            if not resultaat["afgewezen"].empty:
+                st.warning(f"{len(resultaat['afgewezen'])} rijen afgewezen:")
+                st.dataframe(resultaat["afgewezen"], use_container_width=True)
+
+    # Ritlijsten: de rittentellingen van de facturen worden uit de ritregels afgeleid
+    with st.expander("🚐 Ritlijst importeren (ritregels)"):
+        st.caption("Eén regel per rit met ritdatum, perceel, vervoerder en optioneel status, route, "
+                   "klantnummer, adressen, geplande/werkelijke tijden en directe reistijd. "
+                   "Een ritlijst vervangt de eerder ingelezen ritten van dezelfde factuur.")
+        ritten_bestand = st.file_uploader("Bestand", type=["xlsx", "csv"], key="ritten_import_bestand")
+        if ritten_bestand is not None and st.button("Ritten importeren", key="ritten_import_knop"):
+            with st.spinner("Bezig met importeren..."):
+                resultaat = importeer_ritten(ritten_bestand, DB_FILE)
+            st.success(f"{resultaat['geimporteerd']} van {resultaat['gelezen']} ritregels geïmporteerd "
+                       f"voor {len(resultaat['facturen'])} facturen.")
+            if resultaat["nieuwe_facturen"]:
+                st.info(f"{len(resultaat['nieuwe_facturen'])} facturen aangemaakt voor ritten zonder factuur: "
+                        "vul de kosten aan en stem ze af met de SW export.")
+            if resultaat["opnieuw_afstemmen"]:
+                st.info(f"De afstemming met het bestelsysteem is vervallen voor {len(resultaat['opnieuw_afstemmen'])} "
+                        "bestaande facturen met nieuwe ritten: stem opnieuw af met de SW export.")
+            if not resultaat["afgewezen"].empty:
+                st.warning(f"{len(resultaat['afgewezen'])} rijen afgewezen:")
+                st.dataframe(resultaat["afgewezen"], use_container_width=True)
+
+    # Afstemming: gefactureerde ritten zonder bestelling vullen controle_bestelling_sw
+    with st.expander("🔎 Afstemmen met bestelsysteem (SW export)"):
+        st.caption("Eén regel per bestelling met ritdatum, perceel, klantnummer, vertrek- en aankomstadres. "
+                   "Alleen de gefactureerde ritten van de maanden en percelen in de export worden hiermee vergeleken.")
+        sw_bestand = st.file_uploader("Bestand", type=["xlsx", "csv"], key="afstemming_bestand")
+        if sw_bestand is not None and st.button("Afstemmen", key="afstemming_knop"):
+            with st.spinner("Bezig met afstemmen..."):
+                resultaat = stem_bestellingen_af(sw_bestand, DB_FILE)
+            st.success(f"{resultaat['ritten']} ritten afgestemd met {resultaat['bestellingen']} bestellingen: "
+                       f"{resultaat['ontbrekend']} ritten zonder bestelling op {len(resultaat['facturen'])} facturen "
+                       f"({len(resultaat['scope'])} combinaties van maand en perceel uit de export).")
+            if resultaat["ongeldig"]:
+                st.warning(f"{resultaat['ongeldig']} bestellingen zonder geldige datum of perceel overgeslagen.")
+
     # Rapportage tonen
     st.subheader("2️⃣ Ingevoerde factuurgegevens")
     data = load_data()
 
     if not data.empty:
-        edited_data = st.data_editor(data, num_rows="dynamic", use_container_width=True)
+        # De key telt per sessie de eigen opslagacties: daarna begint de editor
+        # opnieuw, zodat dezelfde wijzigingen niet twee keer toegepast worden.
+        # Wijzigingen van anderen laten openstaande bewerkingen staan.
+        editor_key = f"facturen_editor_{st.session_state.setdefault('facturen_editor_opgeslagen', 0)}"
+        st.data_editor(data, num_rows="dynamic", disabled=["id", "versie"], column_config={"versie": None},
+                       use_container_width=True, key=editor_key)
         if st.button("Wijzigingen opslaan"):
-            with sqlite3.connect(DB_FILE) as conn:
-                cursor = conn.cursor()
-                cursor.execute("DELETE FROM facturen")
-                for _, row in edited_data.iterrows():
-                    cursor.execute("""
-                        INSERT INTO facturen 
-                        (jaar, maand, perceel, vervoerder, vaste_kosten, variabele_kosten, 
-                         ritten_besteld, ritten_geannuleerd, ritten_loos, ritten_uitgevoerd, routes)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        row["jaar"], row["maand"], row["perceel"], row["vervoerder"],
-                        row["vaste_kosten"], row["variabele_kosten"], row["ritten_besteld"],
-                        row["ritten_geannuleerd"], row["ritten_loos"], row["ritten_uitgevoerd"],
-                        row["routes"]
-                    ))
-                conn.commit()
-            st.success("Wijzigingen opgeslagen.")
+            gewijzigd, toegevoegd, verwijderd, verouderd = save_editor_changes(data, st.session_state[editor_key])
+            st.session_state["facturen_editor_opgeslagen"] += 1
+            st.success(f"Wijzigingen opgeslagen ({gewijzigd} gewijzigd, {toegevoegd} toegevoegd, {verwijderd} verwijderd).")
+            if verouderd:
+                st.warning(f"{len(verouderd)} facturen zijn intussen door een ander gewijzigd of verwijderd en niet "
+                           f"opgeslagen (id {', '.join(map(str, verouderd))}). Bewerk ze opnieuw met de actuele gegevens.")
     else:
         st.info("Nog geen invoer beschikbaar.")
 
@@ -155,41 +298,62 @@ with tab2:
         with col3:
             st.metric("Ritten loos", int(selected_factuur['ritten_loos']))
             st.metric("Aantal routes", int(selected_factuur['routes']))
+
+        # Dubbele ritten uit de ritlijst (automatische controle bij de ritimport)
+        with connect(DB_FILE) as conn:
+            dubbele_ritten = load_dubbele_ritten(conn, factuur_id)
+        if not dubbele_ritten.empty:
+            with st.expander(f"🔁 {len(dubbele_ritten)} dubbele ritten op deze factuur"):
+                st.caption("Zelfde klant, herkomst en bestemming met een ophaaltijd dicht bij een eerdere rit. "
+                           "Het aantal wordt bij elke ritimport opnieuw bepaald.")
+                st.dataframe(dubbele_ritten, use_container_width=True)
+
+        # Ritten zonder bestelling (afstemming met de export van het bestelsysteem)
+        with connect(DB_FILE) as conn:
+            ontbrekende_bestellingen = load_ontbrekende_bestellingen(conn, factuur_id)
+        if not ontbrekende_bestellingen.empty:
+            with st.expander(f"🔎 {len(ontbrekende_bestellingen)} ritten zonder bestelling in SW"):
+                st.caption("Gefactureerde ritten waarvoor in de export van het bestelsysteem geen bestelling "
+                           "met dezelfde datum, perceel, klant en adressen gevonden is.")
+                st.dataframe(ontbrekende_bestellingen, use_container_width=True)
         
         st.markdown("---")
 
         st.markdown("### 🛠️ Invoer afwijkingen (aantallen)")
+        # Huidige aantallen voorinvullen; controles die uit de ritten berekend
+        # worden zijn alleen-lezen, anders overschrijft opslaan ze met de hand
+        with connect(DB_FILE) as conn:
+            opgeslagen = conn.execute(
+                f"SELECT {', '.join(AFWIJKING_TYPES)} FROM afwijkingen WHERE factuur_id = ?", (factuur_id,)
+            ).fetchone()
+            heeft_ritten = conn.execute(
+                "SELECT EXISTS (SELECT 1 FROM ritten WHERE factuur_id = ?)", (factuur_id,)
+            ).fetchone()[0]
+        opgeslagen = dict(zip(AFWIJKING_TYPES, opgeslagen or ()))
+        afgeleid = RITTEN_CONTROLES if heeft_ritten else {}
+
+        def afwijking_input(kolom, label):
+            return st.number_input(
+                label, min_value=0, step=1, value=int(opgeslagen.get(kolom) or 0),
+                disabled=kolom in afgeleid, help=afgeleid.get(kolom)
+            )
+
         with st.form("afwijking_form"):
             afwijkingen = {
-                "controle_bestelling_sw": st.number_input("Controle Bestelling ook in SW", min_value=0, step=1),
-                "controle_gegevens_levering": st.number_input("Controle levering data afwijking", min_value=0, step=1),
-                "controle_stiptheid": st.number_input("Controle stiptheid", min_value=0, step=1),
-                "controle_indicaties": st.number_input("Controle indicatie(s)", min_value=0, step=1),
-                "controle_reistijd": st.number_input("Controle Overschrijden reistijd", min_value=0, step=1),
-                "controle_dubbel_factuur": st.number_input("Controle Ritten dubbel op factuur", min_value=0, step=1),
-                "controle_lege_routes": st.number_input("Controle Routes zonder reizigers", min_value=0, step=1),
-                "controle_afwezig_melding": st.number_input("Controle Tijdig afwezig gemeld ritten", min_value=0, step=1)
+                "controle_bestelling_sw": afwijking_input("controle_bestelling_sw", "Controle Bestelling ook in SW"),
+                "controle_gegevens_levering": afwijking_input("controle_gegevens_levering", "Controle levering data afwijking"),
+                "controle_stiptheid": afwijking_input("controle_stiptheid", "Controle stiptheid"),
+                "controle_indicaties": afwijking_input("controle_indicaties", "Controle indicatie(s)"),
+                "controle_reistijd": afwijking_input("controle_reistijd", "Controle Overschrijden reistijd"),
+                "controle_dubbel_factuur": afwijking_input("controle_dubbel_factuur", "Controle Ritten dubbel op factuur"),
+                "controle_lege_routes": afwijking_input("controle_lege_routes", "Controle Routes zonder reizigers"),
+                "controle_afwezig_melding": afwijking_input("controle_afwezig_melding", "Controle Tijdig afwezig gemeld ritten")
             }
 
             submitted = st.form_submit_button("Afwijkingen opslaan")
             if submitted:
-                with sqlite3.connect(DB_FILE) as conn:
+                with connect(DB_FILE) as conn:
                     cursor = conn.cursor()
-                    cursor.execute("""
-                        CREATE TABLE IF NOT EXISTS afwijkingen (
-                            id INTEGER PRIMARY KEY AUTOINCREMENT,
-                            factuur_id INTEGER UNIQUE,
-                            controle_bestelling_sw INTEGER,
-                            controle_gegevens_levering INTEGER,
-                            controle_stiptheid INTEGER,
-                            controle_indicaties INTEGER,
-                            controle_reistijd INTEGER,
-                            controle_dubbel_factuur INTEGER,
-                            controle_lege_routes INTEGER,
-                            controle_afwezig_melding INTEGER,
-                            FOREIGN KEY (factuur_id) REFERENCES facturen(id)
-                        )
-                    """)
                     # Validate factuur_id before database operations
                     if not factuur_id or factuur_id <= 0:
                         st.error("Factuur ID is niet geldig. Kan geen afwijkingen opslaan.")
@@ -204,30 +368,13 @@ with tab2:
                     st.write(f"DEBUG: exists = {exists}")
                      
                     if exists:
-                        # Update existing record
+                        # Update existing record; berekende controles laten staan
                         st.write(f"DEBUG: Updating existing record for factuur_id = {factuur_id}")
-                        cursor.execute("""
-                            UPDATE afwijkingen SET
-                                controle_bestelling_sw = ?,
-                                controle_gegevens_levering = ?,
-                                controle_stiptheid = ?,
-                                controle_indicaties = ?,
-                                controle_reistijd = ?,
-                                controle_dubbel_factuur = ?,
-                                controle_lege_routes = ?,
-                                controle_afwezig_melding = ?
-                            WHERE factuur_id = ?
-                        """, (
-                            afwijkingen["controle_bestelling_sw"],
-                            afwijkingen["controle_gegevens_levering"],
-                            afwijkingen["controle_stiptheid"],
-                            afwijkingen["controle_indicaties"],
-                            afwijkingen["controle_reistijd"],
-                            afwijkingen["controle_dubbel_factuur"],
-                            afwijkingen["controle_lege_routes"],
-                            afwijkingen["controle_afwezig_melding"],
-                            factuur_id
-                        ))
+                        kolommen = [k for k in afwijkingen if k not in afgeleid]
+                        cursor.execute(
+                            f"UPDATE afwijkingen SET {', '.join(f'{k} = ?' for k in kolommen)} WHERE factuur_id = ?",
+                            [afwijkingen[k] for k in kolommen] + [factuur_id]
+                        )
                     else:
                         # Insert new record with validated factuur_id
                         st.write(f"DEBUG: Inserting new record for factuur_id = {factuur_id}")
@@ -248,6 +395,7 @@ with tab2:
                             afwijkingen["controle_lege_routes"],
                             afwijkingen["controle_afwezig_melding"]
                         ))
+                    refresh_kpi_scores(conn, [factuur_id])
                     conn.commit()
                 st.success("Afwijkingen opgeslagen voor geselecteerde factuur.")
                 
@@ -255,46 +403,19 @@ with tab2:
                 st.markdown("### 📊 KPI Berekeningen")
                 
                 try:
-                    with sqlite3.connect(DB_FILE) as conn:
-                        kpi_params = pd.read_sql_query("SELECT * FROM kpi_parameters", conn)
+                    kpi_params = load_kpi_parameters()
                     
                     if not kpi_params.empty:
-                        kpi_results = []
-                        
-                        # Map afwijkingen naar KPI parameters
-                        afwijking_mapping = {
-                            'controle_bestelling_sw': 'controle_bestelling_sw',
-                            'controle_gegevens_levering': 'controle_levering',
-                            'controle_stiptheid': 'controle_stiptheid',
-                            'controle_indicaties': 'controle_indicaties',
-                            'controle_reistijd': 'controle_reistijd',
-                            'controle_dubbel_factuur': 'controle_dubbel_factuur',
-                            'controle_lege_routes': 'controle_lege_routes',
-                            'controle_afwezig_melding': 'controle_afwezig_melding'
-                        }
-                        
-                        for afwijking_key, kpi_key in afwijking_mapping.items():
-                            kpi_row = kpi_params[kpi_params['afwijking_type'] == kpi_key]
-                            if not kpi_row.empty:
-                                percentage = kpi_row.iloc[0]['percentage']
-                                basis_type = kpi_row.iloc[0]['berekenings_basis']
-                                
-                                # Get actual counts
-                                afwijking_count = afwijkingen.get(f"controle_{afwijking_key}", 0)
-                                basis_count = get_basis_count(data.loc[select_index], basis_type)
-                                
-                                # Calculate KPI
-                                actual_percentage = (afwijking_count / basis_count * 100) if basis_count > 0 else 0
-                                meets_target = actual_percentage <= percentage
-                                
-                                kpi_results.append({
-                                    'Afwijking': afwijking_key.replace('_', ' ').title(),
-                                    'Aantal': afwijking_count,
-                                    'Basis': basis_count,
-                                    'Percentage': f"{actual_percentage:.1f}%",
-                                    'Doel': f"{percentage}%",
-                                    'Status': "✅ Voldoet" if meets_target else "❌ Overschreden"
-                                })
+                        # Zelfde berekening als het dashboard, met de zojuist opgeslagen aantallen
+                        factuur = {**data.loc[select_index].to_dict(), **afwijkingen}
+                        kpi_results = [{
+                            'Afwijking': kpi['afwijking'].replace('_', ' ').title(),
+                            'Aantal': kpi['aantal'],
+                            'Basis': kpi['basis'],
+                            'Percentage': f"{kpi['percentage']:.1f}%",
+                            'Doel': f"{kpi['doel']}%",
+                            'Status': "✅ Voldoet" if kpi['status'] == 'GOED' else "❌ Overschreden"
+                        } for kpi in calculate_kpi_scores(factuur, kpi_params)]
                         
                         if kpi_results:
                             st.dataframe(pd.DataFrame(kpi_results), use_container_width=True)
@@ -307,24 +428,6 @@ with tab2:
     else:
         st.info("Er zijn nog geen facturen beschikbaar voor afwijkingsinvoer.")
 
-def calculate_kpi_score(afwijking_count, basis_count, percentage):
-    """Bereken KPI score op basis van afwijkingen en basis"""
-    if basis_count == 0:
-        return 0.0
-    actual_percentage = (afwijking_count / basis_count) * 100
-    return actual_percentage, actual_percentage <= percentage
-
-def get_basis_count(factuur_data, basis_type):
-    """Haal het juiste aantal op basis van het basis type"""
-    basis_mapping = {
-        "Ritten besteld": factuur_data['ritten_besteld'],
-        "Ritten uitgevoerd": factuur_data['ritten_uitgevoerd'],
-        "Ritten geannuleerd": factuur_data['ritten_geannuleerd'],
-        "Ritten loos": factuur_data['ritten_loos'],
-        "Routes": factuur_data['routes']
-    }
-    return basis_mapping.get(basis_type, 1)
-
 with tab3:
     st.subheader("⚙️ KPI Parameters Configuratie")
     st.markdown("### 📊 Definieer percentages en berekeningsgrondslagen per afwijking")
@@ -357,7 +460,7 @@ with tab3:
         st.markdown("#### 📦 Controle levering data afwijking")
         col1, col2 = st.columns(2)
         with col1:
-            kpi_config['controle_levering_percentage'] = st.number_input(
+            kpi_config['controle_gegevens_levering_percentage'] = st.number_input(
                 "Percentage (%)",
                 min_value=0.0,
                 max_value=100.0,
@@ -366,7 +469,7 @@ with tab3:
                 key="kpi_levering_percentage"
             )
         with col2:
-            kpi_config['controle_levering_basis'] = st.selectbox(
+            kpi_config['controle_gegevens_levering_basis'] = st.selectbox(
                 "Berekeningsgrondslag",
                 ["Ritten besteld", "Ritten uitgevoerd", "Ritten geannuleerd", "Ritten loos"],
                 index=1,
@@ -491,18 +594,8 @@ with tab3:
         
         if submitted:
             # Opslaan KPI parameters
-            with sqlite3.connect(DB_FILE) as conn:
+            def schrijf_kpi_parameters(conn):
                 cursor = conn.cursor()
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS kpi_parameters (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        afwijking_type TEXT UNIQUE,
-                        percentage REAL,
-                        berekenings_basis TEXT,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
                 # Insert or update KPI parameters
                 for afwijking, config in kpi_config.items():
                     if 'percentage' in afwijking:
@@ -515,16 +608,19 @@ with tab3:
                             kpi_config[afwijking],
                             kpi_config[afwijking.replace('_percentage', '_basis')]
                         ))
-                
-                conn.commit()
-            st.success("KPI parameters succesvol opgeslagen!")
+            
+            # Nieuwe parameters veranderen de score van elke factuur; dat gebeurt
+            # op de achtergrond, het dashboard toont tot die tijd de vorige scores
+            plan_herberekening(DB_FILE, schrijf_kpi_parameters)
+            st.success("KPI parameters succesvol opgeslagen! De scores worden op de achtergrond herberekend.")
+
+    toon_herberekening()
 
     # Toon huidige KPI configuratie
     st.markdown("### 📋 Huidige KPI Configuratie")
     
     try:
-        with sqlite3.connect(DB_FILE) as conn:
-            kpi_data = pd.read_sql_query("SELECT * FROM kpi_parameters ORDER BY afwijking_type", conn)
+        kpi_data = load_kpi_parameters()
         
         if not kpi_data.empty:
             st.dataframe(
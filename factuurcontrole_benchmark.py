@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Benchmark van de laad-, filter-, scoring- en grafiekstappen van de dashboards.
+
+Meet per stap de tijd (beste en mediaan van een aantal herhalingen), de
+doorvoer in rijen per seconde, het piekgeheugen (tracemalloc) en voor
+DataFrame resultaten het geheugen van het frame per 100k rijen, op een
+bestaande database of op gegenereerde testdata van verschillende groottes.
+De resultaten worden als JSON opgeslagen zodat versies vergeleken kunnen worden.
+
+Gebruik:
+    python factuurcontrole_benchmark.py --facturen 1000 10000 100000
+    python factuurcontrole_benchmark.py --db factuurcontrole.db --herhalingen 10
+    python factuurcontrole_benchmark.py --facturen 100000 --vergelijk benchmark_vorige.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from factuurcontrole_db import (
+    FACTUUR_QUERY, init_db, connect_readonly, get_kpi_scores, load_facturen, load_filter_opties,
+    load_maand_aggregaten, load_overall_scores
+)
+from factuurcontrole_kpi import calculate_kpi_scores, calculate_kpi_scores_batch, compileer_kpi_parameters
+from factuurcontrole_dashboard import (
+    KAART_PAGINA_GROOTTES, prepare_analytics_data, prepare_stacked_bar_data, bestelling_sw_percentage
+)
+from factuurcontrole_testdata import genereer_testdata
+
+# === Configuratie ===
+HERHALINGEN = 3
+
+# De per-factuur berekening is te traag voor grote sets: meet op een steekproef
+PER_FACTUUR_STEEKPROEF = 200
+
+# === Meten ===
+def meet(resultaten, facturen, stap, functie, herhalingen=HERHALINGEN, rijen=None):
+    """Time functie() een aantal keer en meet daarna het piekgeheugen van één extra run.
+
+    rijen is het aantal verwerkte rijen, of een functie die dat uit het
+    resultaat bepaalt (standaard len(resultaat)). Geeft het resultaat terug.
+    """
+    tijden = []
+    for _ in range(herhalingen):
+        gc.collect()
+        start = time.perf_counter()
+        resultaat = functie()
+        tijden.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        functie()
+        _, piek = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    aantal = rijen(resultaat) if callable(rijen) else (rijen if rijen is not None else len(resultaat))
+    beste = min(tijden)
+    # Geheugen dat het resultaat zelf inneemt (bijv. per sessie gecachte frames)
+    frame_mb = None
+    if isinstance(resultaat, pd.DataFrame) and len(resultaat):
+        frame_mb = resultaat.memory_usage(deep=True).sum() / 1024 / 1024 / len(resultaat) * 100_000
+    resultaten.append({
+        'facturen': facturen,
+        'stap': stap,
+        'rijen': aantal,
+        'seconden_min': beste,
+        'seconden_mediaan': statistics.median(tijden),
+        'rijen_per_seconde': aantal / beste if beste > 0 else None,
+        'piek_geheugen_mb': piek / 1024 / 1024,
+        'frame_mb_per_100k': frame_mb
+    })
+    frame = f"  {frame_mb:6.1f} MB/100k rijen" if frame_mb is not None else ""
+    print(f"  {stap:<26} {beste * 1000:10.1f} ms  {aantal:>10} rijen  {piek / 1024 / 1024:8.1f} MB{frame}")
+    return resultaat
+
+def benchmark_database(db_file, herhalingen=HERHALINGEN):
+    """Meet alle stappen op één database; geeft een lijst resultaten terug"""
+    resultaten = []
+    with connect_readonly(db_file) as conn:
+        facturen = conn.execute("SELECT COUNT(*) FROM facturen").fetchone()[0]
+        print(f"📊 {db_file}: {facturen} facturen")
+
+        def stap(naam, functie, **kwargs):
+            return meet(resultaten, facturen, naam, functie, herhalingen, **kwargs)
+
+        kpi_params = pd.read_sql_query("SELECT * FROM kpi_parameters", conn)
+        # Zonder compacte dtypes, ter vergelijking van tijd en geheugen
+        stap('load_data_ruw', lambda: pd.read_sql_query(FACTUUR_QUERY, conn))
+        data = stap('load_data', lambda: load_facturen(conn))
+        opties = stap('filter_opties', lambda: load_filter_opties(conn), rijen=lambda o: sum(map(len, o.values())))
+
+        # De dashboards starten met alle opties geselecteerd
+        filters = {dimensie: aantallen.index.tolist() for dimensie, aantallen in opties.items()}
+        gefilterd = stap('apply_filters', lambda: load_facturen(conn, filters))
+        aggregaten = stap('apply_stacked_bar_filters', lambda: load_maand_aggregaten(conn, filters))
+
+        steekproef = data.head(PER_FACTUUR_STEEKPROEF)
+        parameters = compileer_kpi_parameters(kpi_params)
+        stap('kpi_per_factuur', lambda: [calculate_kpi_scores(rij, parameters) for _, rij in steekproef.iterrows()])
+        stap('kpi_batch', lambda: calculate_kpi_scores_batch(gefilterd, kpi_params), rijen=len(gefilterd))
+        # Wat de dashboards lezen: het bewaarde gemiddelde van elke factuur en
+        # de scores per afwijking van één pagina kaarten
+        overall_scores = stap('kpi_opgeslagen_gemiddelde', lambda: load_overall_scores(conn, gefilterd, filters))
+        pagina = gefilterd.head(KAART_PAGINA_GROOTTES[0])
+        stap('kpi_opgeslagen_pagina', lambda: get_kpi_scores(conn, pagina, kpi_params), rijen=len(pagina))
+
+        stap('analytics_grafiekdata', lambda: prepare_analytics_data(gefilterd, overall_scores))
+
+        def stacked_bar():
+            maanden, grouped_data = prepare_stacked_bar_data(aggregaten)
+            bestelling_sw_percentage(maanden)
+            return grouped_data
+        stap('stacked_bar_grafiekdata', stacked_bar, rijen=len(aggregaten))
+    return resultaten
+
+# === Rapportage ===
+def git_versie():
+    """Korte commit hash van de huidige checkout, indien beschikbaar"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def vergelijk(vorige, huidige):
+    """Tabel met de tijden van een vorige run naast de huidige"""
+    sleutel = ['facturen', 'stap']
+    oud = pd.DataFrame(vorige['resultaten'])[sleutel + ['seconden_min']]
+    nieuw = pd.DataFrame(huidige['resultaten'])[sleutel + ['seconden_min']]
+    tabel = oud.merge(nieuw, on=sleutel, suffixes=('_vorige', '_huidige'))
+    tabel['versnelling'] = tabel['seconden_min_vorige'] / tabel['seconden_min_huidige']
+    return tabel
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de dashboardstappen")
+    parser.add_argument("--db", help="Bestaande database in plaats van gegenereerde testdata")
+    parser.add_argument("--facturen", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="Groottes van de gegenereerde testdata (standaard: %(default)s)")
+    parser.add_argument("--percelen", type=int, default=20, help="Percelen in de testdata")
+    parser.add_argument("--vervoerders", type=int, default=12, help="Vervoerders in de testdata")
+    parser.add_argument("--map", help="Map om gegenereerde databases te bewaren en te hergebruiken")
+    parser.add_argument("--herhalingen", type=int, default=HERHALINGEN, help="Herhalingen per stap")
+    parser.add_argument("--uitvoer", default=f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                        help="JSON bestand voor de resultaten")
+    parser.add_argument("--vergelijk", help="Eerder JSON resultaat om mee te vergelijken")
+    args = parser.parse_args(argv)
+
+    resultaten = []
+    if args.db:
+        init_db(args.db)
+        resultaten += benchmark_database(args.db, args.herhalingen)
+    else:
+        with tempfile.TemporaryDirectory() as tijdelijk:
+            testdata_map = args.map or tijdelijk
+            os.makedirs(testdata_map, exist_ok=True)
+            for facturen in args.facturen:
+                db_file = os.path.join(testdata_map, f"testdata_{facturen}_{args.percelen}p_{args.vervoerders}v.db")
+                if not os.path.exists(db_file):
+                    start = time.perf_counter()
+                    genereer_testdata(db_file, facturen, args.percelen, args.vervoerders)
+                    print(f"🛠️ {facturen} facturen gegenereerd ({time.perf_counter() - start:.1f}s)")
+                resultaten += benchmark_database(db_file, args.herhalingen)
+
+    rapport = {
+        'tijdstip': datetime.now().isoformat(timespec='seconds'),
+        'versie': git_versie(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'herhalingen': args.herhalingen,
+        'resultaten': resultaten
+    }
+    with open(args.uitvoer, 'w', encoding='utf-8') as f:
+        json.dump(rapport, f, indent=2)
+    print(f"✅ Resultaten opgeslagen in {args.uitvoer}")
+
+    if args.vergelijk:
+        with open(args.vergelijk, encoding='utf-8') as f:
+            vorige = json.load(f)
+        print(f"\nVergelijking met {args.vergelijk} ({vorige.get('versie')})")
+        print(vergelijk(vorige, rapport).to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+import json
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from factuurcontrole_db import get_data_version
+
+# === Gedeelde data cache ===
+# Geladen data blijft in het geheugen van het proces, over reruns en sessies
+# heen, totdat de dataversie in de database verandert. De opgeslagen objecten
+# worden gedeeld: aanroepers mogen ze niet in-place wijzigen. Net als bij de
+# figuur cache vallen de minst recent gebruikte entries eruit zodra het
+# geheugenplafond bereikt is.
+DATA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+_laden = {}
+_stats = {'hits': 0, 'misses': 0, 'bytes': 0, 'evictions': 0}
+
+# Dataversie per database binnen de huidige rerun (per thread)
+_rerun = threading.local()
+
+@contextmanager
+def rerun_scope():
+    """Lees de dataversie één keer per rerun.
+
+    Alle loaders in de rerun zien dezelfde versie en dus dezelfde
+    (gedeelde) data. Alleen voor reruns die zelf niet schrijven.
+    """
+    _rerun.versies = {}
+    try:
+        yield
+    finally:
+        _rerun.versies = None
+
+def _data_versie(db_file):
+    versies = getattr(_rerun, 'versies', None)
+    if versies is None:
+        return get_data_version(db_file)
+    if db_file not in versies:
+        versies[db_file] = get_data_version(db_file)
+    return versies[db_file]
+
+def _grootte(value):
+    """Geschatte geheugengrootte in bytes van een waarde in de data cache"""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        grootte = value.memory_usage(deep=True)
+        return int(grootte.sum()) if isinstance(grootte, pd.Series) else int(grootte)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_grootte(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_grootte(v) for v in value.values())
+    return sys.getsizeof(value)
+
+def _verwijder(key):
+    _stats['bytes'] -= _cache.pop(key)[2]
+
+def _cache_hit(key, versie):
+    """Entry (versie, waarde, bytes) uit de cache, of None bij een miss (aanroeper houdt _lock vast)"""
+    entry = _cache.get(key)
+    if versie is not None and entry is not None and entry[0] == versie:
+        _stats['hits'] += 1
+        _cache.move_to_end(key)
+        return entry
+    return None
+
+def cached(naam, db_file, loader, *args):
+    """Geef loader(*args) terug uit de cache zolang de dataversie gelijk is"""
+    versie = _data_versie(db_file)
+    key = (naam, db_file) + args
+
+    with _lock:
+        entry = _cache_hit(key, versie)
+        if entry is not None:
+            return entry[1]
+        # Eén lock per key: gelijktijdige sessies laden dezelfde data maar één keer
+        laad_lock = _laden.setdefault(key, threading.Lock())
+
+    # Buiten _lock laden: hits en loads van andere keys wachten niet op deze query
+    with laad_lock:
+        try:
+            with _lock:
+                entry = _cache_hit(key, versie)
+                if entry is not None:
+                    return entry[1]
+                _stats['misses'] += 1
+
+            value = loader(*args)
+
+            if versie is not None:
+                # Buiten _lock meten: deep=True loopt langs alle strings
+                grootte = _grootte(value)
+                with _lock:
+                    # Entries van een oudere dataversie zijn nooit meer bruikbaar
+                    for oud in [k for k, (v, _, _) in _cache.items() if k[1] == db_file and v != versie]:
+                        _verwijder(oud)
+                    if key in _cache:
+                        _verwijder(key)
+                    if grootte <= DATA_CACHE_MAX_BYTES:
+                        _cache[key] = (versie, value, grootte)
+                        _stats['bytes'] += grootte
+                    while _stats['bytes'] > DATA_CACHE_MAX_BYTES:
+                        _verwijder(next(iter(_cache)))
+                        _stats['evictions'] += 1
+        finally:
+            with _lock:
+                if _laden.get(key) is laad_lock:
+                    del _laden[key]
+    return value
+
+# === Figuur cache ===
+# Plotly figuren per (weergave, filters, dataversie), opgeslagen als JSON.
+# Bij een hit wordt de figuur zonder validatie opnieuw opgebouwd; dat is
+# veel goedkoper dan px/go opnieuw laten rekenen. Minst recent gebruikte
+# figuren vallen eruit zodra het geheugenplafond bereikt is.
+FIGUUR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_figuren = OrderedDict()
+_figuur_stats = {'hits': 0, 'misses': 0, 'bytes': 0, 'evictions': 0}
+
+def _verwijder_figuur(key):
+    _figuur_stats['bytes'] -= len(_figuren.pop(key)[1])
+
+def cached_figuur(naam, db_file, sleutel, bouwer, *args):
+    """Geef bouwer(*args) terug uit de figuur cache zolang sleutel en dataversie gelijk zijn"""
+    versie = _data_versie(db_file)
+    key = (naam, db_file, sleutel)
+
+    with _lock:
+        entry = _figuren.get(key)
+        if versie is not None and entry is not None and entry[0] == versie:
+            _figuur_stats['hits'] += 1
+            _figuren.move_to_end(key)
+            figuur_json = entry[1]
+        else:
+            figuur_json = None
+            _figuur_stats['misses'] += 1
+
+    if figuur_json is not None:
+        return go.Figure(json.loads(figuur_json), _validate=False)
+
+    # Buiten de lock bouwen: andere sessies hoeven niet op deze figuur te wachten
+    fig = bouwer(*args)
+    if versie is None:
+        return fig
+    figuur_json = fig.to_json()
+
+    with _lock:
+        # Figuren van een oudere dataversie zijn nooit meer bruikbaar
+        for oud in [k for k, (v, _) in _figuren.items() if k[1] == db_file and v != versie]:
+            _verwijder_figuur(oud)
+        if key in _figuren:
+            _verwijder_figuur(key)
+        if len(figuur_json) <= FIGUUR_CACHE_MAX_BYTES:
+            _figuren[key] = (versie, figuur_json)
+            _figuur_stats['bytes'] += len(figuur_json)
+        while _figuur_stats['bytes'] > FIGUUR_CACHE_MAX_BYTES:
+            _verwijder_figuur(next(iter(_figuren)))
+            _figuur_stats['evictions'] += 1
+    return fig
+
+def cache_stats():
+    """Aantal cache hits, misses en evictions sinds de start van het proces"""
+    with _lock:
+        return dict(
+            _stats, entries=len(_cache),
+            figuur_hits=_figuur_stats['hits'], figuur_misses=_figuur_stats['misses'],
+            figuur_entries=len(_figuren), figuur_bytes=_figuur_stats['bytes'],
+            figuur_evictions=_figuur_stats['evictions']
+        )
+
+def clear_cache():
+    """Leeg de cache (bijv. in scripts of benchmarks)"""
+    with _lock:
+        _cache.clear()
+        _stats['bytes'] = 0
+        _figuren.clear()
+        _figuur_stats['bytes'] = 0
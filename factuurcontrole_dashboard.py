@@ -1,4 +1,3 @@
-import sqlite3
 import streamlit as st
 import pandas as pd
 import plotly.express as px
@@ -8,107 +7,91 @@ import io
 from PIL import Image
 import base64
 import numpy as np
+from factuurcontrole_kpi import overall_status
+from factuurcontrole_db import (
+    init_db, connect_readonly, get_kpi_scores, load_facturen, load_overall_scores, load_filter_opties, load_maand_aggregaten,
+    normalize_filters, FILTER_DIMENSIES
+)
+from factuurcontrole_cache import cached, cached_figuur, cache_stats, rerun_scope
+from factuurcontrole_export import beschikbare_formaten, exporteer_bytes
+from factuurcontrole_herberekening import herberekening_status
+from factuurcontrole_profiling import (
+    ST_FUNCTIES, geprofileerd, instrumenteer, profiling_rerun, toon_profiling_panel
+)
+
+# Opt-in profiling: figuren en st.plotly_chart/st.dataframe worden gemeten als het aan staat
+px = instrumenteer(px, "px")
+go = instrumenteer(go, "go")
+st = instrumenteer(st, "st", ST_FUNCTIES)
 
 # === Configuratie ===
 DB_FILE = "factuurcontrole.db"
 
+# Per Perceel weergave: percelen naast elkaar, en per kwartaal boven dit aantal maanden
+FACET_KOLOMMEN = 3
+MAX_MAANDEN_FACET = 24
+
 # === Database functies ===
-def load_data():
-    """Laad alle factuurgegevens"""
-    with sqlite3.connect(DB_FILE) as conn:
-        # Ensure all facturen have corresponding afwijkingen records
-        cursor = conn.cursor()
-        cursor.execute("""
-            INSERT OR IGNORE INTO afwijkingen (factuur_id, controle_bestelling_sw, controle_gegevens_levering,
-            controle_stiptheid, controle_indicaties, controle_reistijd, controle_dubbel_factuur,
-            controle_lege_routes, controle_afwezig_melding)
-            SELECT f.id, 0, 0, 0, 0, 0, 0, 0, 0
-            FROM facturen f
-            WHERE NOT EXISTS (SELECT 1 FROM afwijkingen a WHERE a.factuur_id = f.id)
-        """)
-        conn.commit()
-        
-        query = """
-        SELECT f.*, 
-               COALESCE(a.controle_bestelling_sw, 0) as controle_bestelling_sw,
-               COALESCE(a.controle_gegevens_levering, 0) as controle_gegevens_levering,
-               COALESCE(a.controle_stiptheid, 0) as controle_stiptheid,
-               COALESCE(a.controle_indicaties, 0) as controle_indicaties,
-               COALESCE(a.controle_reistijd, 0) as controle_reistijd,
-               COALESCE(a.controle_dubbel_factuur, 0) as controle_dubbel_factuur,
-               COALESCE(a.controle_lege_routes, 0) as controle_lege_routes,
-               COALESCE(a.controle_afwezig_melding, 0) as controle_afwezig_melding
-        FROM facturen f
-        LEFT JOIN afwijkingen a ON f.id = a.factuur_id
-        """
-        df = pd.read_sql_query(query, conn)
+@geprofileerd()
+def load_data(filters=None):
+    """Laad de factuurgegevens die aan de filters voldoen (uit de cache zolang de data niet gewijzigd is)"""
+    return cached('dashboard_data', DB_FILE, _load_data, normalize_filters(filters))
+
+@geprofileerd("sql_facturen")
+def _load_data(filter_key):
+    # Alleen-lezen: elke factuur krijgt bij het invoeren al een afwijkingen rij
+    with connect_readonly(DB_FILE) as conn:
+        df = load_facturen(conn, dict(filter_key) if filter_key is not None else None)
     return df
 
+@geprofileerd()
+def load_aggregaten(filters=None):
+    """Laad de maandtotalen per perceel en vervoerder die aan de filters voldoen"""
+    return cached('maand_aggregaten', DB_FILE, _load_aggregaten, normalize_filters(filters))
+
+@geprofileerd("sql_maand_aggregaten")
+def _load_aggregaten(filter_key):
+    with connect_readonly(DB_FILE) as conn:
+        return load_maand_aggregaten(conn, dict(filter_key) if filter_key is not None else None)
+
+@geprofileerd()
+def load_opties():
+    """Laad de filteropties met het aantal facturen per optie"""
+    return cached('filter_opties', DB_FILE, _load_opties)
+
+@geprofileerd("sql_filter_opties")
+def _load_opties():
+    with connect_readonly(DB_FILE) as conn:
+        return load_filter_opties(conn)
+
+@geprofileerd()
 def load_kpi_parameters():
-    """Laad KPI parameters"""
-    with sqlite3.connect(DB_FILE) as conn:
+    """Laad KPI parameters (uit de cache zolang de data niet gewijzigd is)"""
+    return cached('kpi_parameters', DB_FILE, _load_kpi_parameters)
+
+@geprofileerd("sql_kpi_parameters")
+def _load_kpi_parameters():
+    with connect_readonly(DB_FILE) as conn:
         df = pd.read_sql_query("SELECT * FROM kpi_parameters", conn)
     return df
 
-# === KPI Berekeningen ===
-def calculate_kpi_scores(factuur_data, kpi_params):
-    """Bereken KPI scores voor een factuur"""
-    kpi_results = []
-    
-    afwijking_mapping = {
-        'controle_bestelling_sw': 'controle_bestelling_sw',
-        'controle_gegevens_levering': 'controle_gegevens_levering',
-        'controle_stiptheid': 'controle_stiptheid',
-        'controle_indicaties': 'controle_indicaties',
-        'controle_reistijd': 'controle_reistijd',
-        'controle_dubbel_factuur': 'controle_dubbel_factuur',
-        'controle_lege_routes': 'controle_lege_routes',
-        'controle_afwezig_melding': 'controle_afwezig_melding'
-    }
-    
-    # Convert kpi_params to DataFrame if it's a list
-    if isinstance(kpi_params, list):
-        kpi_params_df = pd.DataFrame(kpi_params)
-    else:
-        kpi_params_df = kpi_params
-    
-    for afwijking_key, kpi_key in afwijking_mapping.items():
-        kpi_row = kpi_params_df[kpi_params_df['afwijking_type'] == kpi_key]
-        if not kpi_row.empty:
-            percentage = kpi_row.iloc[0]['percentage']
-            basis_type = kpi_row.iloc[0]['berekenings_basis']
-            
-            # Get actual counts
-            afwijking_count = factuur_data.get(kpi_key, 0)
-            basis_count = get_basis_count(factuur_data, basis_type)
-            
-            # Calculate KPI
-            actual_percentage = (afwijking_count / basis_count * 100) if basis_count > 0 else 0
-            meets_target = actual_percentage <= percentage
-            
-            kpi_results.append({
-                'afwijking': afwijking_key,
-                'naam': afwijking_key.replace('_', ' ').replace('controle ', '').title(),
-                'aantal': afwijking_count,
-                'basis': basis_count,
-                'percentage': actual_percentage,
-                'doel': percentage,
-                'status': 'GOED' if meets_target else 'AFWIJKING',
-                'score': 100 if meets_target else max(0, 100 - (actual_percentage - percentage) * 10)
-            })
-    
-    return kpi_results
-
-def get_basis_count(factuur_data, basis_type):
-    """Haal het juiste aantal op basis van het basis type"""
-    basis_mapping = {
-        "Ritten besteld": factuur_data.get('ritten_besteld', 0),
-        "Ritten uitgevoerd": factuur_data.get('ritten_uitgevoerd', 0),
-        "Ritten geannuleerd": factuur_data.get('ritten_geannuleerd', 0),
-        "Ritten loos": factuur_data.get('ritten_loos', 0),
-        "Routes": factuur_data.get('routes', 0)
-    }
-    return basis_mapping.get(basis_type, 1)
+@geprofileerd()
+def load_scores(data, filter_key):
+    """Laad de gemiddelde opgeslagen KPI score van de facturen uit load_data(filters)"""
+    @geprofileerd("sql_overall_scores")
+    def _load_scores(filter_key):
+        with connect_readonly(DB_FILE) as conn:
+            return load_overall_scores(conn, data, dict(filter_key) if filter_key is not None else None)
+    return cached('overall_scores', DB_FILE, _load_scores, filter_key)
+
+@geprofileerd()
+def load_kpi_details(data, kpi_params):
+    """Laad de opgeslagen KPI scores per afwijking, alleen voor de facturen in data (bijv. één pagina kaarten)"""
+    @geprofileerd("sql_kpi_scores")
+    def _load_kpi_details(_ids):
+        with connect_readonly(DB_FILE) as conn:
+            return get_kpi_scores(conn, data, kpi_params)[0]
+    return cached('kpi_scores', DB_FILE, _load_kpi_details, data['id'].to_numpy().tobytes())
 
 # === Stoplight Model ===
 def get_stoplight_color(score):
@@ -134,15 +117,45 @@ def create_traffic_light_display(score):
     
     return color, status
 
+# === Stoplight kaarten ===
+KAART_PAGINA_GROOTTES = [12, 24, 48, 96]
+KAART_SORTERINGEN = ["Slechtste score eerst", "Beste score eerst", "Chronologisch"]
+
+def select_kaarten_pagina(overall_scores, data):
+    """Sorteer- en paginakeuze voor de stoplight kaarten; geeft de index van de facturen op de pagina"""
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sortering = st.selectbox("Sortering", KAART_SORTERINGEN, key="dashboard_kaart_sortering")
+    with col2:
+        pagina_grootte = st.selectbox("Kaarten per pagina", KAART_PAGINA_GROOTTES, key="dashboard_kaart_pagina_grootte")
+    aantal_paginas = max(1, -(-len(overall_scores) // pagina_grootte))
+    with col3:
+        pagina = st.selectbox(f"Pagina (van {aantal_paginas})", range(1, aantal_paginas + 1), key="dashboard_kaart_pagina")
+    
+    if sortering == "Chronologisch":
+        volgorde = data.sort_values(['jaar', 'maand'], kind='stable').index
+    else:
+        volgorde = overall_scores.sort_values(ascending=sortering == "Slechtste score eerst", kind='stable').index
+    
+    start = (pagina - 1) * pagina_grootte
+    return volgorde[start:start + pagina_grootte]
+
 # === Export functies ===
-def export_dataframe_to_csv(df, filename):
-    """Exporteer DataFrame naar CSV"""
-    csv = df.to_csv(index=False)
+def export_dataframe(df, bestandsnaam, key):
+    """Exportknop voor een DataFrame (CSV, Parquet of Excel).
+
+    Het bestand wordt pas gemaakt als er op download geklikt wordt, en dan
+    in blokken geschreven; een gewone rerun kost niets.
+    """
+    formaten = beschikbare_formaten()
+    formaat = st.selectbox("Exportformaat", list(formaten), key=f"{key}_formaat")
+    extensie, mime = formaten[formaat]
     st.download_button(
-        label="📥 Download als CSV",
-        data=csv,
-        file_name=filename,
-        mime="text/csv"
+        label=f"📥 Download als {formaat}",
+        data=lambda: exporteer_bytes(df, formaat),
+        file_name=f"{bestandsnaam}.{extensie}",
+        mime=mime,
+        key=key
     )
 
 def export_plot_to_png(fig, filename):
@@ -151,113 +164,398 @@ def export_plot_to_png(fig, filename):
     # Dit vermijdt Kaleido/Chrome dependency
     #st.info("💡 Grafiek download is beschikbaar via de Plotly toolbar (camera icoon rechtsboven in de grafiek)")
 
+# === Filters ===
+# Widgets van een verborgen weergave worden door Streamlit opgeruimd; deze
+# keuzes worden bewaard zodat ze terugkomen bij het wisselen van weergave
+BEWAARDE_WIDGETS = (
+    "dashboard_filter_", "analytics_filter_", "stacked_bar_filter_",
+    "dashboard_kaart_sortering", "dashboard_kaart_pagina_grootte"
+)
+
+def bewaar_widget_keuzes():
+    """Zet de bewaarde widgetwaarden om in gewone session state (aan het begin van elke rerun)"""
+    for key in list(st.session_state):
+        if str(key).startswith(BEWAARDE_WIDGETS):
+            st.session_state[key] = st.session_state[key]
+
+def filter_multiselect(widget, opties, dimensie, key):
+    """Multiselect voor één dimensie, met het aantal facturen achter elke optie.
+
+    Standaard is alles geselecteerd. Een bewaarde keuze blijft staan; opties
+    die sindsdien bijgekomen zijn worden eraan toegevoegd.
+    """
+    aantallen = opties[dimensie]
+    waarden = aantallen.index.tolist()
+    standaard = {'default': waarden}
+    if key in st.session_state:
+        bekend = st.session_state.get(f"{key}_opties", waarden)
+        gekozen = st.session_state[key]
+        st.session_state[key] = [w for w in waarden if w in gekozen or w not in bekend]
+        standaard = {}
+    st.session_state[f"{key}_opties"] = waarden
+    return widget(
+        dimensie.capitalize(),
+        waarden,
+        key=key,
+        format_func=lambda x: f"{x} ({aantallen[x]})",
+        **standaard
+    )
+
 # === Dashboard Filter (Sidebar) ===
-def apply_dashboard_filters(data):
-    """Apply dashboard filters in sidebar and return filtered dataframe"""
+@geprofileerd()
+def apply_dashboard_filters(opties):
+    """Apply dashboard filters in sidebar and return filtered dataframe and filter key"""
     st.sidebar.header("🔍 Dashboard Filters")
     
-    # Jaar filter
-    jaren = sorted([x for x in data['jaar'].unique() if x is not None])
-    geselecteerde_jaren = st.sidebar.multiselect("Jaar", jaren, default=jaren, key="dashboard_filter_jaar")
+    filters = {
+        dimensie: filter_multiselect(st.sidebar.multiselect, opties, dimensie, f"dashboard_filter_{dimensie}")
+        for dimensie in FILTER_DIMENSIES
+    }
     
-    # Maand filter
-    maanden = sorted([x for x in data['maand'].unique() if x is not None])
-    geselecteerde_maanden = st.sidebar.multiselect("Maand", maanden, default=maanden, key="dashboard_filter_maand")
+    # Filter in SQL: alleen de geselecteerde facturen worden geladen
+    return load_data(filters), normalize_filters(filters)
+
+# === Analytics Filter (In-tab) ===
+@geprofileerd()
+def apply_analytics_filters(opties):
+    """Apply analytics filters within the tab content and return filtered dataframe and filter key"""
+    st.header("🔍 Analytics Filters")
     
-    # Perceel filter
-    percelen = sorted([x for x in data['perceel'].unique() if x is not None])
-    geselecteerde_percelen = st.sidebar.multiselect("Perceel", percelen, default=percelen, key="dashboard_filter_perceel")
+    filters = {}
+    for col, dimensie in zip(st.columns(4), FILTER_DIMENSIES):
+        with col:
+            filters[dimensie] = filter_multiselect(st.multiselect, opties, dimensie, f"analytics_filter_{dimensie}")
     
-    # Vervoerder filter
-    vervoerders = sorted([x for x in data['vervoerder'].unique() if x is not None])
-    geselecteerde_vervoerders = st.sidebar.multiselect("Vervoerder", vervoerders, default=vervoerders, key="dashboard_filter_vervoerder")
+    # Filter in SQL: alleen de geselecteerde facturen worden geladen
+    return load_data(filters), normalize_filters(filters)
+
+# === Stacked Bar Graph Filter ===
+@geprofileerd()
+def apply_stacked_bar_filters(opties):
+    """Apply filters for the stacked bar graph tab and return the filtered monthly aggregates and filter key"""
+    st.header("🔍 Stacked Bar Graph Filters")
     
-    # Filter data
-    gefilterde_data = data[
-        (data['jaar'].isin(geselecteerde_jaren)) &
-        (data['maand'].isin(geselecteerde_maanden)) &
-        (data['perceel'].isin(geselecteerde_percelen)) &
-        (data['vervoerder'].isin(geselecteerde_vervoerders))
-    ]
+    filters = {}
+    for col, dimensie in zip(st.columns(4), FILTER_DIMENSIES):
+        with col:
+            filters[dimensie] = filter_multiselect(st.multiselect, opties, dimensie, f"stacked_bar_filter_{dimensie}")
     
-    return gefilterde_data
+    # Leest maand_aggregaten in plaats van de losse facturen
+    return load_aggregaten(filters), normalize_filters(filters)
 
-# === Analytics Filter (In-tab) ===
-def apply_analytics_filters(data):
-    """Apply analytics filters within the tab content and return filtered dataframe"""
-    st.header("🔍 Analytics Filters")
+# === Grafiekdata ===
+def jaar_maand(df):
+    """Jaar-maand label (YYYY-MM) voor chronologische volgorde"""
+    return df['jaar'].astype(str) + '-' + df['maand'].astype(str).str.zfill(2)
+
+@geprofileerd()
+def prepare_analytics_data(data, overall_scores):
+    """Per factuur de score en kosten voor de analytics grafieken, chronologisch gesorteerd"""
+    # Kolommen delen met data (geen kopie); perceel als gewone waarden, want px
+    # kleurt een categorie anders dan een getal
+    facturen_df = pd.DataFrame({
+        'jaar': data['jaar'],
+        'maand': data['maand'],
+        'jaar_maand': jaar_maand(data),
+        'perceel': pd.Series(np.asarray(data['perceel']), index=data.index),
+        'vervoerder': data['vervoerder'],
+        'score': overall_scores,
+        'vaste_kosten': data['vaste_kosten'],
+        'variabele_kosten': data['variabele_kosten'],
+        'ritten_besteld': data['ritten_besteld'],
+        'ritten_uitgevoerd': data['ritten_uitgevoerd']
+    }, copy=False).reset_index(drop=True)
+    return facturen_df.sort_values(['jaar', 'maand'])
+
+@geprofileerd()
+def prepare_stacked_bar_data(aggregaten):
+    """Maandtotalen met jaar_maand, en de ritten statussen per perceel en jaar-maand"""
+    aggregaten = aggregaten.assign(jaar_maand=jaar_maand(aggregaten))
+    grouped_data = aggregaten.groupby(['perceel', 'jaar_maand']).agg({
+        'ritten_besteld': 'sum',
+        'ritten_geannuleerd': 'sum',
+        'ritten_loos': 'sum'
+    }).reset_index()
+    return aggregaten, grouped_data
+
+@geprofileerd()
+def bestelling_sw_percentage(aggregaten):
+    """Percentage controle_bestelling_sw afwijkingen t.o.v. ritten besteld, per jaar-maand"""
+    percentage_data = aggregaten.groupby(['jaar_maand']).agg({
+        'ritten_besteld': 'sum',
+        'controle_bestelling_sw': 'sum'
+    }).reset_index()
+    percentage_data['percentage_goed'] = 100  # Always 100% for green base
+    percentage_data['percentage_fout'] = (percentage_data['controle_bestelling_sw'] / percentage_data['ritten_besteld'] * 100).fillna(0)
+    return percentage_data
+
+@geprofileerd()
+def prepare_perceel_facetdata(aggregaten, max_maanden=MAX_MAANDEN_FACET):
+    """Totalen per perceel en periode (jaar-maand); per kwartaal als er meer dan max_maanden maanden zijn"""
+    maand = aggregaten['maand']
+    per_kwartaal = len(aggregaten[['jaar', 'maand']].drop_duplicates()) > max_maanden
+    if per_kwartaal:
+        # Eerste maand van het kwartaal als periode
+        maand = (maand - 1) // 3 * 3 + 1
+    periode = jaar_maand(aggregaten.assign(maand=maand)).rename('periode')
+    totalen = aggregaten.groupby(['perceel', periode]).agg({
+        'ritten_besteld': 'sum',
+        'ritten_geannuleerd': 'sum',
+        'ritten_loos': 'sum',
+        'controle_bestelling_sw': 'sum'
+    }).reset_index()
+    totalen['percentage_goed'] = 100
+    totalen['percentage_fout'] = (totalen['controle_bestelling_sw'] / totalen['ritten_besteld'] * 100).fillna(0)
+    return totalen, per_kwartaal
+
+# === Figuren ===
+# Kleuren per perceel in de analytics grafieken
+PERCEEL_KLEUREN = {
+    'Perceel 2': 'green',
+    'Perceel 3': 'blue',
+    'Perceel 4': 'red'
+}
+
+# Kleuren per serie in de stacked bar grafieken
+STATUS_KLEUREN = {
+    'Ritten Besteld': 'green',
+    'Ritten Geannuleerd': 'yellow',
+    'Ritten Loos': 'red',
+    'Ritten Besteld (100%)': 'green',
+    'Controle Bestelling SW (%)': 'red'
+}
+
+def figuur_score_trend(facturen_df):
+    """Kwaliteitsscore per maand als lijn per perceel"""
+    fig_trend = px.line(
+        facturen_df,
+        x='jaar_maand',
+        y='score',
+        color='perceel',
+        title='Kwaliteitsscore per maand (chronologisch)',
+        labels={'score': 'Kwaliteitsscore (%)', 'jaar_maand': 'Jaar-Maand'},
+        color_discrete_map=PERCEEL_KLEUREN
+    )
     
-    col1, col2, col3, col4 = st.columns(4)
+    # Ensure consistent 1-month increments
+    fig_trend.update_xaxes(
+        tickangle=-45,
+        tickmode='linear',
+        dtick='M1',  # 1 month increments
+        tickformat='%Y-%m'  # Format as YYYY-MM
+    )
+    return fig_trend
+
+def figuur_kwaliteit_perceel(facturen_df):
+    """Kwaliteitsscore per perceel over tijd (bar chart)"""
+    fig_kwaliteit_perceel = px.bar(
+        facturen_df,
+        x='jaar_maand',
+        y='score',
+        color='perceel',
+        title='Gemiddelde kwaliteitsscore per perceel over tijd',
+        labels={'score': 'Gemiddelde kwaliteitsscore (%)', 'jaar_maand': 'Jaar-Maand'},
+        color_discrete_map=PERCEEL_KLEUREN,
+        barmode='group'
+    )
     
-    with col1:
-        jaren = sorted([x for x in data['jaar'].unique() if x is not None])
-        geselecteerde_jaren = st.multiselect("Jaar", jaren, default=jaren, key="analytics_filter_jaar")
+    # Ensure consistent 1-month increments
+    fig_kwaliteit_perceel.update_xaxes(
+        tickangle=-45,
+        tickmode='linear',
+        dtick='M1',  # 1 month increments
+        tickformat='%Y-%m'  # Format as YYYY-MM
+    )
+    return fig_kwaliteit_perceel
+
+def figuur_kosten(facturen_df):
+    """Variabele kosten per maand"""
+    fig_kosten = px.bar(
+        facturen_df,
+        x='jaar_maand',
+        y='variabele_kosten',
+        color='perceel',
+        title='Variabele kosten per maand',
+        labels={'variabele_kosten': 'Variabele kosten (€)', 'jaar_maand': 'Jaar-Maand'},
+        color_discrete_map=PERCEEL_KLEUREN
+    )
     
-    with col2:
-        maanden = sorted([x for x in data['maand'].unique() if x is not None])
-        geselecteerde_maanden = st.multiselect("Maand", maanden, default=maanden, key="analytics_filter_maand")
+    # Ensure consistent 1-month increments
+    fig_kosten.update_xaxes(
+        tickangle=-45,
+        tickmode='linear',
+        dtick='M1',  # 1 month increments
+        tickformat='%Y-%m'  # Format as YYYY-MM
+    )
+    return fig_kosten
+
+def figuur_ritten_status(grouped_data):
+    """Stacked bar graph met de ritten statussen per jaar-maand"""
+    fig_stacked = go.Figure()
     
-    with col3:
-        percelen = sorted([x for x in data['perceel'].unique() if x is not None])
-        geselecteerde_percelen = st.multiselect("Perceel", percelen, default=percelen, key="analytics_filter_perceel")
-    
-    with col4:
-        vervoerders = sorted([x for x in data['vervoerder'].unique() if x is not None])
-        geselecteerde_vervoerders = st.multiselect("Vervoerder", vervoerders, default=vervoerders, key="analytics_filter_vervoerder")
-    
-    # Filter data
-    gefilterde_data = data[
-        (data['jaar'].isin(geselecteerde_jaren)) &
-        (data['maand'].isin(geselecteerde_maanden)) &
-        (data['perceel'].isin(geselecteerde_percelen)) &
-        (data['vervoerder'].isin(geselecteerde_vervoerders))
-    ]
+    # Voeg traces toe voor elke ritten status
+    fig_stacked.add_trace(go.Bar(
+        name='Ritten Besteld',
+        x=grouped_data['jaar_maand'],
+        y=grouped_data['ritten_besteld'],
+        marker_color='green',
+        hovertemplate='<b>%{x}</b><br>Ritten Besteld: %{y}<extra></extra>'
+    ))
     
-    return gefilterde_data
+    fig_stacked.add_trace(go.Bar(
+        name='Ritten Geannuleerd',
+        x=grouped_data['jaar_maand'],
+        y=grouped_data['ritten_geannuleerd'],
+        marker_color='yellow',
+        hovertemplate='<b>%{x}</b><br>Ritten Geannuleerd: %{y}<extra></extra>'
+    ))
+    
+    fig_stacked.add_trace(go.Bar(
+        name='Ritten Loos',
+        x=grouped_data['jaar_maand'],
+        y=grouped_data['ritten_loos'],
+        marker_color='red',
+        hovertemplate='<b>%{x}</b><br>Ritten Loos: %{y}<extra></extra>'
+    ))
+    
+    # Configureer layout
+    fig_stacked.update_layout(
+        title='Ritten Status per Perceel (Stacked)',
+        xaxis_title='Jaar-Maand',
+        yaxis_title='Aantal Ritten',
+        barmode='stack',
+        height=600,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    
+    # Update x-as voor consistente 1-maand increments
+    fig_stacked.update_xaxes(
+        tickangle=-45,
+        tickmode='linear',
+        dtick='M1',
+        tickformat='%Y-%m'
+    )
+    return fig_stacked
 
-# === Stacked Bar Graph Filter ===
-def apply_stacked_bar_filters(data):
-    """Apply filters specifically for the stacked bar graph tab"""
-    st.header("🔍 Stacked Bar Graph Filters")
+def figuur_bestelling_sw(aggregaten):
+    """Controle bestelling SW als percentage van ritten besteld, gecombineerd"""
+    percentage_data = bestelling_sw_percentage(aggregaten)
     
-    col1, col2, col3, col4 = st.columns(4)
+    fig_percentage = go.Figure()
     
-    with col1:
-        jaren = sorted([x for x in data['jaar'].unique() if x is not None])
-        geselecteerde_jaren = st.multiselect("Jaar", jaren, default=jaren, key="stacked_bar_filter_jaar")
+    # Green base (100%)
+    fig_percentage.add_trace(go.Bar(
+        name='Ritten Besteld (100%)',
+        x=percentage_data['jaar_maand'],
+        y=percentage_data['percentage_goed'],
+        marker_color='green',
+        hovertemplate='<b>%{x}</b><br>Ritten Besteld: 100%<extra></extra>'
+    ))
     
-    with col2:
-        maanden = sorted([x for x in data['maand'].unique() if x is not None])
-        geselecteerde_maanden = st.multiselect("Maand", maanden, default=maanden, key="stacked_bar_filter_maand")
+    # Red percentage (controle_bestelling_sw)
+    fig_percentage.add_trace(go.Bar(
+        name='Controle Bestelling SW (%)',
+        x=percentage_data['jaar_maand'],
+        y=percentage_data['percentage_fout'],
+        marker_color='red',
+        hovertemplate='<b>%{x}</b><br>Controle Bestelling SW: %{y:.1f}%<extra></extra>'
+    ))
     
-    with col3:
-        percelen = sorted([x for x in data['perceel'].unique() if x is not None])
-        geselecteerde_percelen = st.multiselect("Perceel", percelen, default=percelen, key="stacked_bar_filter_perceel")
-    
-    with col4:
-        vervoerders = sorted([x for x in data['vervoerder'].unique() if x is not None])
-        geselecteerde_vervoerders = st.multiselect("Vervoerder", vervoerders, default=vervoerders, key="stacked_bar_filter_vervoerder")
-    
-    # Filter data
-    gefilterde_data = data[
-        (data['jaar'].isin(geselecteerde_jaren)) &
-        (data['maand'].isin(geselecteerde_maanden)) &
-        (data['perceel'].isin(geselecteerde_percelen)) &
-        (data['vervoerder'].isin(geselecteerde_vervoerders))
-    ]
+    fig_percentage.update_layout(
+        title='Controle Bestelling SW Percentage (Gecombineerd)',
+        xaxis_title='Jaar-Maand',
+        yaxis_title='Percentage (%)',
+        barmode='stack',
+        height=600,
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    
+    fig_percentage.update_xaxes(
+        tickangle=-45,
+        tickmode='linear',
+        dtick='M1',
+        tickformat='%Y-%m'
+    )
+    return fig_percentage
+
+def _facet_figuur(totalen, per_kwartaal, kolommen, namen, titel, y_titel):
+    """Eén figuur met een paneel per perceel, de kolommen gestapeld als series"""
+    long_data = totalen.melt(
+        id_vars=['perceel', 'periode'], value_vars=list(kolommen), var_name='serie', value_name='waarde'
+    )
+    long_data['serie'] = long_data['serie'].map(dict(zip(kolommen, namen)))
+    
+    rijen = -(-totalen['perceel'].nunique() // FACET_KOLOMMEN)
+    fig = px.bar(
+        long_data,
+        x='periode',
+        y='waarde',
+        color='serie',
+        facet_col='perceel',
+        facet_col_wrap=FACET_KOLOMMEN,
+        facet_row_spacing=min(0.08, 0.4 / rijen),
+        category_orders={'serie': list(namen)},
+        color_discrete_map=STATUS_KLEUREN,
+        labels={'periode': 'Jaar-Kwartaal' if per_kwartaal else 'Jaar-Maand', 'waarde': y_titel, 'serie': ''},
+        title=titel,
+        height=100 + 300 * rijen
+    )
+    fig.update_layout(barmode='stack')
+    
+    # "perceel=Perceel 2" -> "Perceel 2"
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split('=', 1)[-1]))
     
-    return gefilterde_data
+    fig.update_xaxes(
+        tickangle=-45,
+        tickmode='linear',
+        dtick='M3' if per_kwartaal else 'M1',
+        tickformat='%Y-Q%q' if per_kwartaal else '%Y-%m'
+    )
+    return fig
+
+def figuur_ritten_status_percelen(aggregaten):
+    """Ritten statussen met een paneel per perceel"""
+    totalen, per_kwartaal = prepare_perceel_facetdata(aggregaten)
+    return _facet_figuur(
+        totalen, per_kwartaal,
+        ['ritten_besteld', 'ritten_geannuleerd', 'ritten_loos'],
+        ['Ritten Besteld', 'Ritten Geannuleerd', 'Ritten Loos'],
+        'Ritten Status per Perceel', 'Aantal Ritten'
+    )
+
+def figuur_bestelling_sw_percelen(aggregaten):
+    """Controle bestelling SW percentage met een paneel per perceel"""
+    totalen, per_kwartaal = prepare_perceel_facetdata(aggregaten)
+    return _facet_figuur(
+        totalen, per_kwartaal,
+        ['percentage_goed', 'percentage_fout'],
+        ['Ritten Besteld (100%)', 'Controle Bestelling SW (%)'],
+        'Controle Bestelling SW Percentage per Perceel', 'Percentage (%)'
+    )
 
 # === Dashboard Layout ===
+@geprofileerd()
 def show_dashboard():
     """Toon het hoofddashboard met stoplight model"""
     st.title("📊 Factuurcontrole Dashboard")
     
-    # Laad data
-    data = load_data()
+    # Laad filteropties en KPI parameters
+    opties = load_opties()
     kpi_params = load_kpi_parameters()
     
-    if data.empty:
+    if opties['jaar'].empty:
         st.warning("Geen factuurgegevens gevonden. Voer eerst factuurgegevens in.")
         return
     
@@ -266,7 +564,7 @@ def show_dashboard():
         return
     
     # Apply dashboard filters (sidebar)
-    gefilterde_data = apply_dashboard_filters(data)
+    gefilterde_data, filter_key = apply_dashboard_filters(opties)
     
     if gefilterde_data.empty:
         st.warning("Geen data gevonden met de geselecteerde filters.")
@@ -275,32 +573,32 @@ def show_dashboard():
     # Stoplight overzicht
     st.header("🚦 Stoplight Overzicht")
     
-    # Bereken scores voor alle facturen
-    facturen_scores = []
-    for _, factuur in gefilterde_data.iterrows():
-        kpi_results = calculate_kpi_scores(factuur, kpi_params)
-        overall_score = np.mean([kpi['score'] for kpi in kpi_results]) if kpi_results else 0
-        
-        facturen_scores.append({
-            'jaar': factuur['jaar'],
-            'maand': factuur['maand'],
-            'perceel': factuur['perceel'],
-            'vervoerder': factuur['vervoerder'],
-            'score': overall_score,
-            'status': 'GOED' if overall_score >= 90 else 'AANDACHT' if overall_score >= 70 else 'ACTIE',
-            'vaste_kosten': factuur['vaste_kosten'],
-            'variabele_kosten': factuur['variabele_kosten'],
-            'ritten_besteld': factuur['ritten_besteld'],
-            'ritten_uitgevoerd': factuur['ritten_uitgevoerd']
-        })
-    
-    facturen_df = pd.DataFrame(facturen_scores)
-    
-    # Toon stoplight kaarten
+    # Lees de gemiddelde opgeslagen score van alle facturen
+    overall_scores = load_scores(gefilterde_data, filter_key)
+    
+    facturen_df = pd.DataFrame({
+        'jaar': gefilterde_data['jaar'],
+        'maand': gefilterde_data['maand'],
+        'perceel': gefilterde_data['perceel'],
+        'vervoerder': gefilterde_data['vervoerder'],
+        'score': overall_scores,
+        'status': overall_status(overall_scores),
+        'vaste_kosten': gefilterde_data['vaste_kosten'],
+        'variabele_kosten': gefilterde_data['variabele_kosten'],
+        'ritten_besteld': gefilterde_data['ritten_besteld'],
+        'ritten_uitgevoerd': gefilterde_data['ritten_uitgevoerd']
+    }, copy=False).reset_index(drop=True)
+    
+    # Toon stoplight kaarten, per pagina
+    kaarten_pagina = select_kaarten_pagina(overall_scores, gefilterde_data)
+    # De scores per afwijking alleen voor de kaarten op deze pagina
+    kpi_df = load_kpi_details(gefilterde_data.loc[kaarten_pagina], kpi_params)
+    details_per_factuur = {index: details for index, details in kpi_df.groupby('index', sort=False)}
+    
     cols = st.columns(3)
-    for idx, (_, factuur) in enumerate(gefilterde_data.iterrows()):
-        kpi_results = calculate_kpi_scores(factuur, kpi_params)
-        overall_score = np.mean([kpi['score'] for kpi in kpi_results]) if kpi_results else 0
+    for idx, factuur_index in enumerate(kaarten_pagina):
+        factuur = gefilterde_data.loc[factuur_index]
+        overall_score = overall_scores[factuur_index]
         
         col_idx = idx % 3
         with cols[col_idx]:
@@ -322,16 +620,17 @@ def show_dashboard():
             </div>
             """, unsafe_allow_html=True)
             
-            # KPI details expander
-            with st.expander("📊 Details"):
-                for kpi in kpi_results:
-                    st.write(f"{get_stoplight_color(kpi['score'])} {kpi['naam']}: {kpi['percentage']:.1f}% (doel: {kpi['doel']}%)")
+            # KPI details alleen renderen als ze opengeklapt worden
+            if st.toggle("📊 Details", key=f"kaart_details_{factuur['id']}"):
+                details = details_per_factuur.get(factuur_index)
+                for kpi in ([] if details is None else details.itertuples()):
+                    st.write(f"{get_stoplight_color(kpi.score)} {kpi.naam}: {kpi.percentage:.1f}% (doel: {kpi.doel}%)")
     
     # Export knoppen
     st.header("📤 Export")
     col1, col2 = st.columns(2)
     with col2:
-        export_dataframe_to_csv(facturen_df, f"factuur_scores_{datetime.now().strftime('%Y%m%d')}.csv")
+        export_dataframe(facturen_df, f"factuur_scores_{datetime.now().strftime('%Y%m%d')}", key="dashboard_export_scores")
     with col1:
         # Maak een samenvattende tabel
         summary_df = facturen_df[['jaar', 'maand', 'perceel', 'vervoerder', 'score', 'status']]
@@ -351,7 +650,7 @@ def show_dashboard():
     
     # Filter alleen de kolommen die daadwerkelijk bestaan in de data
     available_cols = [col for col in factuur_afwijkingen_cols if col in gefilterde_data.columns]
-    display_df = gefilterde_data[available_cols].copy()
+    display_df = gefilterde_data[available_cols]
     
     # Geef kolommen Nederlandse namen voor betere leesbaarheid
     column_mapping = {
@@ -382,122 +681,40 @@ def show_dashboard():
     st.dataframe(display_df, use_container_width=True)
     
     # Export knop voor de volledige factuur data met afwijkingen
-    export_dataframe_to_csv(display_df, f"factuur_afwijkingen_data_{datetime.now().strftime('%Y%m%d')}.csv")
+    export_dataframe(display_df, f"factuur_afwijkingen_data_{datetime.now().strftime('%Y%m%d')}", key="dashboard_export_afwijkingen")
 
+@geprofileerd()
 def show_analytics():
     """Toon analytics pagina met grafieken"""
     st.title("📈 Factuur Analytics")
     
-    # Laad data
-    data = load_data()
-    kpi_params = load_kpi_parameters()
+    # Laad filteropties
+    opties = load_opties()
     
-    if data.empty:
+    if opties['jaar'].empty:
         st.warning("Geen factuurgegevens gevonden.")
         return
     
     # Apply analytics filters (within tab content)
-    gefilterde_data = apply_analytics_filters(data)
+    gefilterde_data, filter_key = apply_analytics_filters(opties)
     
-    # Bereken scores
-    facturen_scores = []
-    for _, factuur in gefilterde_data.iterrows():
-        kpi_results = calculate_kpi_scores(factuur, kpi_params)
-        overall_score = np.mean([kpi['score'] for kpi in kpi_results]) if kpi_results else 0
-        
-        # Create year-month combination for proper chronological ordering
-        year_month = f"{factuur['jaar']}-{factuur['maand']:02d}"
-        
-        facturen_scores.append({
-            'jaar': factuur['jaar'],
-            'maand': factuur['maand'],
-            'jaar_maand': year_month,
-            'perceel': factuur['perceel'],
-            'vervoerder': factuur['vervoerder'],
-            'score': overall_score,
-            'vaste_kosten': factuur['vaste_kosten'],
-            'variabele_kosten': factuur['variabele_kosten'],
-            'ritten_besteld': factuur['ritten_besteld'],
-            'ritten_uitgevoerd': factuur['ritten_uitgevoerd']
-        })
-    
-    facturen_df = pd.DataFrame(facturen_scores)
-    
-    # Sort by year and month for proper chronological order
-    facturen_df = facturen_df.sort_values(['jaar', 'maand'])
+    # Lees de gemiddelde opgeslagen score van alle facturen
+    overall_scores = load_scores(gefilterde_data, filter_key)
+    
+    # Per factuur, chronologisch gesorteerd
+    facturen_df = prepare_analytics_data(gefilterde_data, overall_scores)
     
     # Grafieken
     st.header("📊 Prestatie Overzicht")
     
-    # Define color mapping for percelen
-    color_map = {
-        'Perceel 2': 'green',
-        'Perceel 3': 'blue',
-        'Perceel 4': 'red'
-    }
-    
-    # 1. Score trend over tijd
-    fig_trend = px.line(
-        facturen_df,
-        x='jaar_maand',
-        y='score',
-        color='perceel',
-        title='Kwaliteitsscore per maand (chronologisch)',
-        labels={'score': 'Kwaliteitsscore (%)', 'jaar_maand': 'Jaar-Maand'},
-        color_discrete_map=color_map
-    )
-    
-    # Ensure consistent 1-month increments
-    fig_trend.update_xaxes(
-        tickangle=-45,
-        tickmode='linear',
-        dtick='M1',  # 1 month increments
-        tickformat='%Y-%m'  # Format as YYYY-MM
-    )
-    
+    # Figuren komen uit de cache zolang filters en data gelijk blijven
+    fig_trend = cached_figuur('analytics_trend', DB_FILE, filter_key, figuur_score_trend, facturen_df)
     st.plotly_chart(fig_trend, use_container_width=True, key="trend_chart")
     
-    # 2. Kwaliteitsscore per perceel over tijd (bar chart)
-    fig_kwaliteit_perceel = px.bar(
-        facturen_df,
-        x='jaar_maand',
-        y='score',
-        color='perceel',
-        title='Gemiddelde kwaliteitsscore per perceel over tijd',
-        labels={'score': 'Gemiddelde kwaliteitsscore (%)', 'jaar_maand': 'Jaar-Maand'},
-        color_discrete_map=color_map,
-        barmode='group'
-    )
-    
-    # Ensure consistent 1-month increments
-    fig_kwaliteit_perceel.update_xaxes(
-        tickangle=-45,
-        tickmode='linear',
-        dtick='M1',  # 1 month increments
-        tickformat='%Y-%m'  # Format as YYYY-MM
-    )
-    
+    fig_kwaliteit_perceel = cached_figuur('analytics_kwaliteit_perceel', DB_FILE, filter_key, figuur_kwaliteit_perceel, facturen_df)
     st.plotly_chart(fig_kwaliteit_perceel, use_container_width=True, key="kwaliteit_perceel_chart")
     
-    # 3. Kosten analyse per maand
-    fig_kosten = px.bar(
-        facturen_df,
-        x='jaar_maand',
-        y='variabele_kosten',
-        color='perceel',
-        title='Variabele kosten per maand',
-        labels={'variabele_kosten': 'Variabele kosten (€)', 'jaar_maand': 'Jaar-Maand'},
-        color_discrete_map=color_map
-    )
-    
-    # Ensure consistent 1-month increments
-    fig_kosten.update_xaxes(
-        tickangle=-45,
-        tickmode='linear',
-        dtick='M1',  # 1 month increments
-        tickformat='%Y-%m'  # Format as YYYY-MM
-    )
-    
+    fig_kosten = cached_figuur('analytics_kosten', DB_FILE, filter_key, figuur_kosten, facturen_df)
     st.plotly_chart(fig_kosten, use_container_width=True, key="kosten_chart")
     
     # Export knoppen
@@ -505,7 +722,7 @@ def show_analytics():
     col1, col2 = st.columns(2)
     
     with col1:
-        export_dataframe_to_csv(facturen_df, f"analytics_data_{datetime.now().strftime('%Y%m%d')}.csv")
+        export_dataframe(facturen_df, f"analytics_data_{datetime.now().strftime('%Y%m%d')}", key="analytics_export_scores")
     
     with col2:
         export_plot_to_png(fig_trend, f"trend_chart_{datetime.now().strftime('%Y%m%d')}.png")
@@ -524,7 +741,7 @@ def show_analytics():
     
     # Filter alleen de kolommen die daadwerkelijk bestaan in de data
     available_cols = [col for col in factuur_afwijkingen_cols if col in gefilterde_data.columns]
-    display_df = gefilterde_data[available_cols].copy()
+    display_df = gefilterde_data[available_cols]
     
     # Geef kolommen Nederlandse namen voor betere leesbaarheid
     column_mapping = {
@@ -555,267 +772,94 @@ def show_analytics():
     st.dataframe(display_df, use_container_width=True)
     
     # Export knop voor de volledige factuur data met afwijkingen
-    export_dataframe_to_csv(display_df, f"factuur_afwijkingen_analytics_{datetime.now().strftime('%Y%m%d')}.csv")
+    export_dataframe(display_df, f"factuur_afwijkingen_analytics_{datetime.now().strftime('%Y%m%d')}", key="analytics_export_afwijkingen")
 
+@geprofileerd()
 def show_stacked_bar_graph():
     """Toon stacked bar graph per perceel met ritten statussen"""
     st.title("📊 Stacked Bar Graph - Ritten Status per Perceel")
     
-    # Laad data
-    data = load_data()
+    # Laad filteropties
+    opties = load_opties()
     
-    if data.empty:
+    if opties['jaar'].empty:
         st.warning("Geen factuurgegevens gevonden.")
         return
     
-    # Apply filters
-    gefilterde_data = apply_stacked_bar_filters(data)
+    # Apply filters (voorberekende maandtotalen, al chronologisch gesorteerd)
+    gefilterde_data, filter_key = apply_stacked_bar_filters(opties)
     
     if gefilterde_data.empty:
         st.warning("Geen data gevonden met de geselecteerde filters.")
         return
     
-    # Bereken jaar-maand combinatie voor chronologische volgorde
-    gefilterde_data['jaar_maand'] = gefilterde_data.apply(
-        lambda row: f"{row['jaar']}-{row['maand']:02d}", axis=1
-    )
-    
-    # Sorteer data chronologisch
-    gefilterde_data = gefilterde_data.sort_values(['jaar', 'maand'])
-    
     # Groepeer data per perceel en jaar-maand
-    grouped_data = gefilterde_data.groupby(['perceel', 'jaar_maand']).agg({
-        'ritten_besteld': 'sum',
-        'ritten_geannuleerd': 'sum',
-        'ritten_loos': 'sum'
-    }).reset_index()
-    
-    # Maak stacked bar graph
-    fig_stacked = go.Figure()
-    
-    # Voeg traces toe voor elke ritten status
-    fig_stacked.add_trace(go.Bar(
-        name='Ritten Besteld',
-        x=grouped_data['jaar_maand'],
-        y=grouped_data['ritten_besteld'],
-        marker_color='green',
-        hovertemplate='<b>%{x}</b><br>Ritten Besteld: %{y}<extra></extra>'
-    ))
-    
-    fig_stacked.add_trace(go.Bar(
-        name='Ritten Geannuleerd',
-        x=grouped_data['jaar_maand'],
-        y=grouped_data['ritten_geannuleerd'],
-        marker_color='yellow',
-        hovertemplate='<b>%{x}</b><br>Ritten Geannuleerd: %{y}<extra></extra>'
-    ))
-    
-    fig_stacked.add_trace(go.Bar(
-        name='Ritten Loos',
-        x=grouped_data['jaar_maand'],
-        y=grouped_data['ritten_loos'],
-        marker_color='red',
-        hovertemplate='<b>%{x}</b><br>Ritten Loos: %{y}<extra></extra>'
-    ))
-    
-    # Configureer layout
-    fig_stacked.update_layout(
-        title='Ritten Status per Perceel (Stacked)',
-        xaxis_title='Jaar-Maand',
-        yaxis_title='Aantal Ritten',
-        barmode='stack',
-        height=600,
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1
-        )
-    )
-    
-    # Update x-as voor consistente 1-maand increments
-    fig_stacked.update_xaxes(
-        tickangle=-45,
-        tickmode='linear',
-        dtick='M1',
-        tickformat='%Y-%m'
-    )
+    gefilterde_data, grouped_data = prepare_stacked_bar_data(gefilterde_data)
     
     # Create tabs for different views
     view_tab1, view_tab2 = st.tabs(["📊 Gecombineerd Overzicht", "📈 Per Perceel"])
     
+    # Figuren komen uit de cache zolang filters en data gelijk blijven
     with view_tab1:
+        fig_stacked = cached_figuur('stacked_ritten_status', DB_FILE, filter_key, figuur_ritten_status, grouped_data)
         st.plotly_chart(fig_stacked, use_container_width=True)
         
         # New stacked bar chart for controle_bestelling_sw percentage
         st.header("📊 Controle Bestelling SW Percentage")
         
-        # Calculate percentage data
-        percentage_data = gefilterde_data.groupby(['jaar_maand']).agg({
-            'ritten_besteld': 'sum',
-            'controle_bestelling_sw': 'sum'
-        }).reset_index()
-        
-        # Calculate percentages
-        percentage_data['percentage_goed'] = 100  # Always 100% for green base
-        percentage_data['percentage_fout'] = (percentage_data['controle_bestelling_sw'] / percentage_data['ritten_besteld'] * 100).fillna(0)
-        
-        fig_percentage = go.Figure()
-        
-        # Green base (100%)
-        fig_percentage.add_trace(go.Bar(
-            name='Ritten Besteld (100%)',
-            x=percentage_data['jaar_maand'],
-            y=percentage_data['percentage_goed'],
-            marker_color='green',
-            hovertemplate='<b>%{x}</b><br>Ritten Besteld: 100%<extra></extra>'
-        ))
-        
-        # Red percentage (controle_bestelling_sw)
-        fig_percentage.add_trace(go.Bar(
-            name='Controle Bestelling SW (%)',
-            x=percentage_data['jaar_maand'],
-            y=percentage_data['percentage_fout'],
-            marker_color='red',
-            hovertemplate='<b>%{x}</b><br>Controle Bestelling SW: %{y:.1f}%<extra></extra>'
-        ))
-        
-        fig_percentage.update_layout(
-            title='Controle Bestelling SW Percentage (Gecombineerd)',
-            xaxis_title='Jaar-Maand',
-            yaxis_title='Percentage (%)',
-            barmode='stack',
-            height=600,
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            )
-        )
-        
-        fig_percentage.update_xaxes(
-            tickangle=-45,
-            tickmode='linear',
-            dtick='M1',
-            tickformat='%Y-%m'
-        )
-        
+        fig_percentage = cached_figuur('stacked_bestelling_sw', DB_FILE, filter_key, figuur_bestelling_sw, gefilterde_data)
         st.plotly_chart(fig_percentage, use_container_width=True)
     
     with view_tab2:
-        percelen = sorted(grouped_data['perceel'].unique())
+        # Eén figuur per metriek met een paneel per perceel
+        fig_percelen = cached_figuur('stacked_ritten_status_percelen', DB_FILE, filter_key, figuur_ritten_status_percelen, gefilterde_data)
+        st.plotly_chart(fig_percelen, use_container_width=True)
         
-        for perceel in percelen:
-            perceel_data = grouped_data[grouped_data['perceel'] == perceel]
-            
-            fig_perceel = go.Figure()
-            
-            fig_perceel.add_trace(go.Bar(
-                name='Ritten Besteld',
-                x=perceel_data['jaar_maand'],
-                y=perceel_data['ritten_besteld'],
-                marker_color='green'
-            ))
-            
-            fig_perceel.add_trace(go.Bar(
-                name='Ritten Geannuleerd',
-                x=perceel_data['jaar_maand'],
-                y=perceel_data['ritten_geannuleerd'],
-                marker_color='yellow'
-            ))
-            
-            fig_perceel.add_trace(go.Bar(
-                name='Ritten Loos',
-                x=perceel_data['jaar_maand'],
-                y=perceel_data['ritten_loos'],
-                marker_color='red'
-            ))
-            
-            fig_perceel.update_layout(
-                title=f'Ritten Status - {perceel}',
-                xaxis_title='Jaar-Maand',
-                yaxis_title='Aantal Ritten',
-                barmode='stack',
-                height=400
-            )
-            
-            fig_perceel.update_xaxes(
-                tickangle=-45,
-                tickmode='linear',
-                dtick='M1',
-                tickformat='%Y-%m'
-            )
-            
-            st.plotly_chart(fig_perceel, use_container_width=True)
-            
-            # New percentage chart per perceel
-            perceel_percentage_data = gefilterde_data[gefilterde_data['perceel'] == perceel].groupby(['jaar_maand']).agg({
-                'ritten_besteld': 'sum',
-                'controle_bestelling_sw': 'sum'
-            }).reset_index()
-            
-            perceel_percentage_data['percentage_goed'] = 100
-            perceel_percentage_data['percentage_fout'] = (perceel_percentage_data['controle_bestelling_sw'] / perceel_percentage_data['ritten_besteld'] * 100).fillna(0)
-            
-            fig_perceel_percentage = go.Figure()
-            
-            fig_perceel_percentage.add_trace(go.Bar(
-                name='Ritten Besteld (100%)',
-                x=perceel_percentage_data['jaar_maand'],
-                y=perceel_percentage_data['percentage_goed'],
-                marker_color='green'
-            ))
-            
-            fig_perceel_percentage.add_trace(go.Bar(
-                name='Controle Bestelling SW (%)',
-                x=perceel_percentage_data['jaar_maand'],
-                y=perceel_percentage_data['percentage_fout'],
-                marker_color='red'
-            ))
-            
-            fig_perceel_percentage.update_layout(
-                title=f'Controle Bestelling SW Percentage - {perceel}',
-                xaxis_title='Jaar-Maand',
-                yaxis_title='Percentage (%)',
-                barmode='stack',
-                height=400
-            )
-            
-            fig_perceel_percentage.update_xaxes(
-                tickangle=-45,
-                tickmode='linear',
-                dtick='M1',
-                tickformat='%Y-%m'
-            )
-            
-            st.plotly_chart(fig_perceel_percentage, use_container_width=True)
+        fig_percelen_percentage = cached_figuur('stacked_bestelling_sw_percelen', DB_FILE, filter_key, figuur_bestelling_sw_percelen, gefilterde_data)
+        st.plotly_chart(fig_percelen_percentage, use_container_width=True)
     
     # Export knop
     st.header("📤 Export")
-    export_dataframe_to_csv(grouped_data, f"stacked_bar_data_{datetime.now().strftime('%Y%m%d')}.csv")
+    export_dataframe(grouped_data, f"stacked_bar_data_{datetime.now().strftime('%Y%m%d')}", key="stacked_bar_export")
 
 # === Hoofdapplicatie ===
+# Weergaven in de navigatie; alleen de gekozen weergave wordt uitgevoerd
+WEERGAVEN = {
+    "🚦 Dashboard": show_dashboard,
+    "📈 Analytics": show_analytics,
+    "📊 Stacked Bar Graph": show_stacked_bar_graph,
+}
+
 def main():
     st.set_page_config(
         page_title="Factuurcontrole Dashboard",
         page_icon="📊",
         layout="wide"
     )
+    bewaar_widget_keuzes()
+    with profiling_rerun(), rerun_scope():
+        init_db(DB_FILE)
+        
+        weergave = st.sidebar.radio("Weergave", list(WEERGAVEN), key="dashboard_weergave")
+        
+        stats = cache_stats()
+        st.sidebar.caption(
+            f"Cache: {stats['hits']} hits / {stats['misses']} misses / {stats['evictions']} evictions "
+            f"({stats['bytes'] / 2**20:.0f} MB), "
+            f"figuren: {stats['figuur_hits']} hits / {stats['figuur_misses']} misses / "
+            f"{stats['figuur_evictions']} evictions"
+        )
+        
+        # Tijdens een herberekening blijven de vorige (consistente) scores zichtbaar
+        herberekening = herberekening_status(DB_FILE)
+        if herberekening and herberekening['status'] in ('wachtrij', 'bezig', 'wisselen'):
+            totaal = herberekening['totaal'] or 0
+            procent = herberekening['verwerkt'] / totaal * 100 if totaal else 0
+            st.sidebar.info(f"KPI scores worden herberekend ({procent:.0f}%). Tot die tijd worden de vorige scores getoond.")
+        
+        WEERGAVEN[weergave]()
     
-    # Tabs
-    tab1, tab2, tab3 = st.tabs(["🚦 Dashboard", "📈 Analytics", "📊 Stacked Bar Graph"])
-    
-    with tab1:
-        show_dashboard()
-    
-    with tab2:
-        show_analytics()
-    
-    with tab3:
-        show_stacked_bar_graph()
+    toon_profiling_panel()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,361 @@
+import json
+import sqlite3
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from factuurcontrole_kpi import calculate_kpi_scores_batch, afwijking_naam, AFWIJKING_TYPES, BASIS_KOLOMMEN, KPI_ALIASSEN
+from factuurcontrole_migraties import FILTER_DIMENSIES, AGGREGAAT_KOLOMMEN, migreer, zet_pragmas
+
+# === Configuratie ===
+DB_FILE = "factuurcontrole.db"
+
+# Maximaal aantal parameters per IN (...) lijst
+IN_CHUNK_SIZE = 500
+
+# Compacte dtypes voor geladen facturen: per sessie blijft dit frame in het geheugen
+TELLING_KOLOMMEN = list(BASIS_KOLOMMEN.values()) + AFWIJKING_TYPES
+FACTUUR_DTYPES = {
+    'jaar': 'int16',
+    'maand': 'int8',
+    'perceel': 'category',
+    'vervoerder': 'category',
+    **{kolom: 'uint32' for kolom in TELLING_KOLOMMEN}
+}
+
+# Facturen met hun afwijkingen als kolommen (ontbrekend = 0)
+FACTUUR_QUERY = f"""
+SELECT f.*,
+       {', '.join(f'COALESCE(a.{afwijking_type}, 0) as {afwijking_type}' for afwijking_type in AFWIJKING_TYPES)}
+FROM facturen f
+LEFT JOIN afwijkingen a ON f.id = a.factuur_id
+"""
+
+# Kolommen van kpi_scores (en kpi_scores_nieuw) in volgorde
+KPI_SCORE_KOLOMMEN = "factuur_id, afwijking_type, naam, aantal, basis, percentage, doel, status, score"
+
+_geinitialiseerd = set()
+
+# === Schema ===
+def init_db(db_file=DB_FILE):
+    """Breng het schema op de laatste versie en vul ontbrekende KPI scores (eenmalig per proces)"""
+    if db_file in _geinitialiseerd:
+        return
+    with connect(db_file) as conn:
+        migreer(conn)
+        if canonicaliseer_kpi_parameters(conn):
+            refresh_kpi_scores(conn)
+        refresh_missing_kpi_scores(conn)
+        conn.commit()
+    _geinitialiseerd.add(db_file)
+
+def connect(db_file=DB_FILE, timeout=5.0):
+    """Open een verbinding met de standaard PRAGMAs (zie factuurcontrole_migraties)"""
+    conn = sqlite3.connect(db_file, timeout=timeout)
+    zet_pragmas(conn)
+    return conn
+
+def connect_readonly(db_file=DB_FILE):
+    """Open een alleen-lezen verbinding; neemt nooit de schrijflock"""
+    conn = sqlite3.connect(f"{Path(db_file).resolve().as_uri()}?mode=ro", uri=True)
+    zet_pragmas(conn)
+    return conn
+
+# === Dataversie ===
+def get_data_version(db_file=DB_FILE):
+    """Huidige dataversie, of None als de database nog niet geïnitialiseerd is"""
+    try:
+        with connect_readonly(db_file) as conn:
+            row = conn.execute("SELECT versie FROM data_versie WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+def bump_data_version(conn):
+    """Hoog de dataversie op voor schrijfacties die niet via de triggers lopen"""
+    conn.execute("UPDATE data_versie SET versie = versie + 1 WHERE id = 1")
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+# === Filters ===
+def normalize_filters(filters):
+    """Zet een filter dict om in een hashbare, gesorteerde tuple (bruikbaar als cache key)"""
+    if filters is None:
+        return None
+    return tuple((dimensie, tuple(sorted(filters[dimensie])))
+                 for dimensie in FILTER_DIMENSIES if filters.get(dimensie) is not None)
+
+def filter_clause(filters, alias='f'):
+    """Parameterized WHERE clause voor de geselecteerde dimensiewaarden.
+
+    filters is een dict dimensie -> lijst waarden; None of een ontbrekende
+    dimensie filtert niet, een lege lijst selecteert niets.
+    """
+    voorwaarden, params = [], []
+    for dimensie, waarden in (normalize_filters(filters) or ()):
+        if not waarden:
+            return " WHERE 0", []
+        voorwaarden.append(f"{alias}.{dimensie} IN ({','.join('?' * len(waarden))})")
+        params.extend(waarden)
+    if not voorwaarden:
+        return "", []
+    return " WHERE " + " AND ".join(voorwaarden), params
+
+def compacte_dtypes(df, categorieen=True):
+    """Zet de kolommen van een facturen frame in-place om naar FACTUUR_DTYPES.
+
+    Kolommen met NULLs, niet-gehele getallen of waarden buiten het bereik van
+    het kleinere type blijven ongewijzigd. categorieen=False laat perceel en vervoerder staan
+    (bijv. voor een data editor waarin nieuwe waarden ingevoerd worden).
+    """
+    for kolom, dtype in FACTUUR_DTYPES.items():
+        if kolom not in df.columns:
+            continue
+        if dtype == 'category':
+            if categorieen:
+                df[kolom] = df[kolom].astype(dtype)
+            continue
+        waarden = df[kolom]
+        if waarden.dtype.kind not in 'iu':
+            continue  # NULLs (float) of geen gehele getallen
+        bereik = np.iinfo(dtype)
+        if not waarden.empty and (waarden.min() < bereik.min or waarden.max() > bereik.max):
+            continue
+        df[kolom] = waarden.astype(dtype)
+    return df
+
+def load_facturen(conn, filters=None):
+    """Laad alleen de facturen (met afwijkingen) die aan de filters voldoen, met compacte dtypes"""
+    where, params = filter_clause(filters)
+    return compacte_dtypes(pd.read_sql_query(FACTUUR_QUERY + where, conn, params=params))
+
+def load_filter_opties(conn):
+    """Beschikbare waarden per filterdimensie met het aantal facturen per waarde.
+
+    Geeft een dict dimensie -> Series (waarde -> aantal) terug.
+    """
+    opties = {}
+    for dimensie in FILTER_DIMENSIES:
+        df = pd.read_sql_query(f"""
+            SELECT {dimensie} AS waarde, COUNT(*) AS aantal
+            FROM facturen
+            WHERE {dimensie} IS NOT NULL
+            GROUP BY {dimensie}
+            ORDER BY {dimensie}
+        """, conn)
+        opties[dimensie] = pd.Series(df['aantal'].tolist(), index=df['waarde'].tolist(), dtype='int64')
+    return opties
+
+def load_maand_aggregaten(conn, filters=None):
+    """Laad de voorberekende maandtotalen die aan de filters voldoen"""
+    where, params = filter_clause(filters, alias='m')
+    return pd.read_sql_query(
+        "SELECT * FROM maand_aggregaten m" + where + " ORDER BY m.jaar, m.maand",
+        conn, params=params
+    )
+
+# === KPI scores ===
+def load_facturen_by_id(conn, factuur_ids=None):
+    """Laad facturen met afwijkingen, optioneel alleen de opgegeven ids"""
+    if factuur_ids is None:
+        return pd.read_sql_query(FACTUUR_QUERY, conn)
+    delen = [
+        pd.read_sql_query(
+            FACTUUR_QUERY + f" WHERE f.id IN ({','.join('?' * len(chunk))})",
+            conn, params=chunk
+        )
+        for chunk in _chunks(factuur_ids)
+    ]
+    return pd.concat(delen, ignore_index=True) if delen else pd.read_sql_query(FACTUUR_QUERY + " WHERE 0", conn)
+
+def schrijf_berekende_kpi_scores(conn, tabel='kpi_scores', where="", params=(), view='kpi_scores_actief'):
+    """Schrijf scores uit view (alias s) naar tabel, volledig in SQLite.
+
+    kpi_scores_actief scoort met de parameters van de opgeslagen scores,
+    kpi_scores_berekend met de huidige kpi_parameters (zie migratie 7).
+    where beperkt de facturen via s.factuur_id, bijv. "WHERE s.factuur_id IN (?, ?)".
+    In kpi_scores wordt ook kpi_totaalscores bijgewerkt. Geeft het aantal
+    geschreven rijen terug.
+    """
+    # De leesbare naam is Python logica: eenmalig per type als VALUES lijst
+    typen = [rij[0] for rij in conn.execute(
+        "SELECT afwijking_type FROM kpi_parameters UNION SELECT afwijking_type FROM kpi_parameters_actief"
+    )]
+    if not typen:
+        return 0
+    conn.execute(f"""
+        WITH namen (afwijking_type, naam) AS (VALUES {', '.join('(?, ?)' for _ in typen)})
+        INSERT OR REPLACE INTO {tabel} ({KPI_SCORE_KOLOMMEN})
+        SELECT s.factuur_id, s.afwijking_type, n.naam, s.aantal, s.basis,
+               s.percentage, s.doel, s.status, s.score
+        FROM {view} s
+        JOIN namen n ON n.afwijking_type = s.afwijking_type
+        {where}
+    """, [waarde for t in typen for waarde in (t, afwijking_naam(t))] + list(params))
+    # cursor.rowcount is -1 voor statements die met WITH beginnen
+    aantal = conn.execute("SELECT changes()").fetchone()[0]
+    if tabel == 'kpi_scores':
+        conn.execute(f"""
+            INSERT OR REPLACE INTO kpi_totaalscores (factuur_id, score)
+            SELECT s.factuur_id, AVG(s.score) FROM kpi_scores s {where} GROUP BY s.factuur_id
+        """, list(params))
+    return aantal
+
+def refresh_kpi_scores(conn, factuur_ids=None):
+    """Herbereken en bewaar de KPI scores van de opgegeven facturen (None = alle).
+
+    Commit niet; de aanroeper bepaalt de transactie.
+    """
+    cursor = conn.cursor()
+    if factuur_ids is None:
+        cursor.execute("DELETE FROM kpi_scores")
+        return schrijf_berekende_kpi_scores(conn)
+
+    factuur_ids = [int(i) for i in factuur_ids]
+    aantal = 0
+    for chunk in _chunks(factuur_ids):
+        plaatshouders = ','.join('?' * len(chunk))
+        cursor.execute(f"DELETE FROM kpi_scores WHERE factuur_id IN ({plaatshouders})", chunk)
+        aantal += schrijf_berekende_kpi_scores(conn, where=f"WHERE s.factuur_id IN ({plaatshouders})", params=chunk)
+    return aantal
+
+def canonicaliseer_kpi_parameters(conn):
+    """Zet kpi_parameters onder een oude naam (KPI_ALIASSEN) om naar de afwijkingskolom.
+
+    De meest recent bijgewerkte rij wint. Geeft True terug als er iets veranderd is.
+    """
+    gewijzigd = False
+    for alias, canoniek in KPI_ALIASSEN.items():
+        rij = conn.execute(
+            "SELECT percentage, berekenings_basis, updated_at FROM kpi_parameters WHERE afwijking_type = ?",
+            (alias,)
+        ).fetchone()
+        if rij is None:
+            continue
+        conn.execute("""
+            INSERT INTO kpi_parameters (afwijking_type, percentage, berekenings_basis, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(afwijking_type) DO UPDATE SET
+                percentage = excluded.percentage,
+                berekenings_basis = excluded.berekenings_basis,
+                updated_at = excluded.updated_at
+            WHERE kpi_parameters.updated_at IS NULL OR excluded.updated_at >= kpi_parameters.updated_at
+        """, (canoniek, *rij))
+        conn.execute("DELETE FROM kpi_parameters WHERE afwijking_type = ?", (alias,))
+        gewijzigd = True
+    return gewijzigd
+
+def refresh_missing_kpi_scores(conn):
+    """Bereken scores voor facturen die nog geen opgeslagen scores hebben"""
+    missing = [row[0] for row in conn.execute("""
+        SELECT f.id FROM facturen f
+        WHERE NOT EXISTS (SELECT 1 FROM kpi_scores s WHERE s.factuur_id = f.id)
+    """)]
+    return refresh_kpi_scores(conn, missing) if missing else 0
+
+def load_kpi_scores(conn, factuur_ids=None):
+    """Laad opgeslagen KPI scores, optioneel alleen voor de opgegeven facturen"""
+    query = """
+        SELECT factuur_id, afwijking_type AS afwijking, naam, aantal, basis,
+               percentage, doel, status, score
+        FROM kpi_scores
+    """
+    if factuur_ids is None:
+        return pd.read_sql_query(query, conn)
+    delen = [
+        pd.read_sql_query(
+            query + f" WHERE factuur_id IN ({','.join('?' * len(chunk))})",
+            conn, params=chunk
+        )
+        for chunk in _chunks(int(i) for i in factuur_ids)
+    ]
+    return pd.concat(delen, ignore_index=True) if delen else pd.read_sql_query(query + " WHERE 0", conn)
+
+def _score_facturen(data, filters):
+    """Subquery met de ids van de facturen in data, met parameters.
+
+    Met filters dezelfde WHERE als load_facturen (data is dan het resultaat
+    daarvan), anders de ids uit data als één JSON parameter.
+    """
+    if filters is None:
+        return "SELECT value FROM json_each(?)", [json.dumps(data['id'].astype('int64').tolist())]
+    where, params = filter_clause(filters)
+    return f"SELECT f.id FROM facturen f{where}", params
+
+def _lees_scores(conn, kolommen, data, filters, groepering=""):
+    """Lees kolommen (alias s) uit kpi_scores voor de facturen in data.
+
+    Facturen zonder opgeslagen scores komen uit de view kpi_scores_actief,
+    dus met dezelfde parameters, ook tijdens een herberekening.
+    """
+    facturen, params = _score_facturen(data, filters)
+    scores = pd.read_sql_query(
+        f"SELECT {kolommen} FROM kpi_scores s WHERE s.factuur_id IN ({facturen}){groepering}",
+        conn, params=params
+    )
+    ontbrekend = data.loc[~data['id'].isin(scores['factuur_id']), 'id']
+    if ontbrekend.empty:
+        return scores
+    berekend = pd.read_sql_query(
+        f"SELECT {kolommen} FROM kpi_scores_actief s "
+        f"WHERE s.factuur_id IN (SELECT value FROM json_each(?)){groepering}",
+        conn, params=[json.dumps(ontbrekend.astype('int64').tolist())]
+    )
+    return pd.concat([scores, berekend], ignore_index=True) if not berekend.empty else scores
+
+def load_overall_scores(conn, data, filters=None):
+    """Gemiddelde KPI score per factuur in data, met de index van data.
+
+    Leest het bewaarde gemiddelde uit kpi_totaalscores; voor facturen zonder
+    gemiddelde (bijv. net gewijzigd) AVG(score) GROUP BY factuur_id over hun
+    scores. filters zijn dezelfde als bij load_facturen; None leest de ids uit
+    data. Facturen zonder scores krijgen 0.0, net als in de batchberekening.
+    """
+    facturen, params = _score_facturen(data, filters)
+    gemiddelden = pd.read_sql_query(
+        f"SELECT t.factuur_id, t.score FROM kpi_totaalscores t WHERE t.factuur_id IN ({facturen})",
+        conn, params=params
+    )
+    ontbrekend = data[~data['id'].isin(gemiddelden['factuur_id'])]
+    if not ontbrekend.empty:
+        berekend = _lees_scores(
+            conn, "s.factuur_id, AVG(s.score) AS score", ontbrekend, None, " GROUP BY s.factuur_id"
+        )
+        if not berekend.empty:
+            gemiddelden = pd.concat([gemiddelden, berekend], ignore_index=True)
+    per_factuur = pd.Series(gemiddelden['score'].to_numpy(dtype=float), index=gemiddelden['factuur_id'])
+    return pd.Series(data['id'].map(per_factuur).fillna(0.0).to_numpy(dtype=float), index=data.index)
+
+def get_kpi_scores(conn, data, kpi_params, filters=None):
+    """KPI scores voor de facturen in data, uit kpi_scores waar mogelijk.
+
+    Eén query over dezelfde filters als load_facturen (None: de ids uit data);
+    facturen zonder opgeslagen scores via de view kpi_scores_actief. Geeft
+    (kpi_df, overall_scores) terug zoals calculate_kpi_scores_batch. Heb je
+    alleen de totaalscore nodig, gebruik dan load_overall_scores.
+    """
+    if data.empty:
+        return calculate_kpi_scores_batch(data, kpi_params)
+
+    kpi_df = _lees_scores(conn, """
+        s.factuur_id, s.afwijking_type AS afwijking, s.aantal, s.basis,
+        s.percentage, s.doel, s.status, s.score
+    """, data, filters)
+
+    # Koppel scores terug aan de rijen van data, per factuur in vaste volgorde
+    index_per_id = pd.Series(data.index, index=data['id'])
+    index_per_id = index_per_id[~index_per_id.index.duplicated()]
+    kpi_df.insert(0, 'index', kpi_df['factuur_id'].map(index_per_id))
+    kpi_df.insert(3, 'naam', kpi_df['afwijking'].map(afwijking_naam))
+    # Standaardtypes in vaste volgorde, extra types (alleen in kpi_parameters) daarna
+    extra = sorted(set(kpi_df['afwijking']) - set(AFWIJKING_TYPES))
+    volgorde = {t: i for i, t in enumerate(list(AFWIJKING_TYPES) + extra)}
+    kpi_df['volgorde'] = kpi_df['afwijking'].map(volgorde)
+    kpi_df = (kpi_df.dropna(subset=['index'])
+              .sort_values(['index', 'volgorde'])
+              .drop(columns=['volgorde'])
+              .reset_index(drop=True))
+    kpi_df['index'] = kpi_df['index'].astype(data.index.dtype)
+    return kpi_df, load_overall_scores(conn, data, filters)
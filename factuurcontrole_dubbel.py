@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Automatische controle "Ritten dubbel op factuur" op de ritregels.
+
+Twee gefactureerde (niet geannuleerde) ritten zijn dubbel als klant,
+herkomst en bestemming na normalisatie gelijk zijn en de ophaaltijden
+hooguit TOLERANTIE_MINUTEN uit elkaar liggen, ook over percelen en
+vervoerders heen. De ritten worden gesorteerd op (sleutel, ophaaltijd);
+daarna is elke rit alleen met zijn voorganger te vergelijken (sort-merge),
+dus O(n log n) in plaats van alle paren.
+
+Per factuur komt het aantal dubbele ritten in afwijkingen.controle_dubbel_factuur;
+de paren (rit -> de eerdere rit waarmee hij samenvalt) staan in
+dubbele_ritten. De controle draait per maand: ritten vallen op de factuur
+van hun ritdatum. Ritten van de buurmaanden die binnen de tolerantie van de
+maandgrens vallen, worden meevergeleken (23:55 op de 31e en 00:05 op de 1e);
+paren worden geschreven bij de maand van de latere rit.
+
+Gebruik:
+    python factuurcontrole_dubbel.py [--db factuurcontrole.db] [--periode 2025-03] [--tolerantie 15]
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from factuurcontrole_db import DB_FILE, init_db, connect, refresh_kpi_scores
+
+# === Configuratie ===
+# Maximaal verschil in ophaaltijd (minuten) tussen twee ritten die als dubbel tellen
+TOLERANTIE_MINUTEN = 15
+
+SLEUTEL_KOLOMMEN = ["klant", "herkomst", "bestemming"]
+
+RITTEN_QUERY = """
+    SELECT r.id, r.factuur_id, r.klant, r.herkomst, r.bestemming,
+           COALESCE(r.gepland_ophalen, r.werkelijk_ophalen, r.datum) AS ophalen
+    FROM facturen f
+    JOIN ritten r ON r.factuur_id = f.id
+    WHERE f.jaar = ? AND f.maand = ?
+      AND r.status != 'geannuleerd' AND r.klant IS NOT NULL
+"""
+
+# Ritten van een buurmaand met een ophaaldag in [van, tot]. date() leest ook een
+# datum zonder tijd of met een spatie; de exacte grens volgt na het parsen
+RAND_QUERY = f"""
+    SELECT * FROM ({RITTEN_QUERY})
+    WHERE date(ophalen) BETWEEN ? AND ?
+"""
+
+# === Detectie ===
+def _maandstart(jaar, maand, verschuiving=0):
+    """Eerste moment van de maand, verschoven met een aantal maanden"""
+    index = jaar * 12 + maand - 1 + verschuiving
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def _rand(conn, maand, van, tot):
+    """Ritten van de maand die begint op maand met een ophaaltijd in [van, tot)"""
+    ritten = pd.read_sql_query(RAND_QUERY, conn, params=(
+        maand.year, maand.month, van.date().isoformat(), tot.date().isoformat()
+    ))
+    # Als tijd vergelijken, niet als tekst: '2025-04-01' < '2025-04-01T00:00:00'
+    tijd = pd.to_datetime(ritten["ophalen"], format="ISO8601")
+    return ritten[(tijd >= van) & (tijd < tot)]
+
+def _ritten_met_rand(conn, jaar, maand, tolerantie):
+    """Ritten van de maand plus de ritten van de buurmaanden binnen de tolerantie van de maandgrens"""
+    marge = timedelta(minutes=tolerantie)
+    start, einde = _maandstart(jaar, maand), _maandstart(jaar, maand, 1)
+    delen = [
+        pd.read_sql_query(RITTEN_QUERY, conn, params=(jaar, maand)),
+        _rand(conn, _maandstart(jaar, maand, -1), start - marge, start),
+        _rand(conn, einde, einde, einde + marge + timedelta(seconds=1)),
+    ]
+    return pd.concat(delen, ignore_index=True)
+
+def normaliseer_sleutel(waarden):
+    """Hoofdletters, spaties en leestekens maken niet uit: 'Dorpsstr. 1 ' == 'dorpsstr 1'"""
+    return (waarden.astype("string").fillna("").str.lower()
+            .str.replace(r"[^0-9a-z]+", "", regex=True))
+
+def zoek_dubbele_ritten(ritten, tolerantie=TOLERANTIE_MINUTEN):
+    """Vind dubbele ritten in een DataFrame met id, factuur_id, klant, herkomst, bestemming en ophalen.
+
+    Geeft een DataFrame met rit_id, origineel_id, factuur_id en
+    verschil_minuten terug: één rij per rit die binnen de tolerantie na een
+    rit met dezelfde sleutel komt. Bij gelijke tijden is de rit met het
+    laagste id het origineel.
+    """
+    if ritten.empty:
+        return pd.DataFrame({"rit_id": [], "origineel_id": [], "factuur_id": [], "verschil_minuten": []})
+
+    groep = pd.DataFrame({k: normaliseer_sleutel(ritten[k]) for k in SLEUTEL_KOLOMMEN}).groupby(
+        SLEUTEL_KOLOMMEN, sort=False
+    ).ngroup().to_numpy()
+    tijd = pd.to_datetime(ritten["ophalen"], format="ISO8601").to_numpy(dtype="datetime64[s]")
+    ids = ritten["id"].to_numpy()
+
+    volgorde = np.lexsort((ids, tijd, groep))
+    groep, tijd, ids = groep[volgorde], tijd[volgorde], ids[volgorde]
+    verschil = (tijd[1:] - tijd[:-1]) / np.timedelta64(1, "m")
+    dubbel = (groep[1:] == groep[:-1]) & (verschil <= tolerantie)
+
+    return pd.DataFrame({
+        "rit_id": ids[1:][dubbel],
+        "origineel_id": ids[:-1][dubbel],
+        "factuur_id": ritten["factuur_id"].to_numpy()[volgorde][1:][dubbel],
+        "verschil_minuten": verschil[dubbel],
+    })
+
+def controleer_dubbele_ritten(conn, perioden=None, tolerantie=TOLERANTIE_MINUTEN):
+    """Zoek dubbele ritten per maand en schrijf dubbele_ritten en controle_dubbel_factuur.
+
+    perioden is een lijst (jaar, maand); None = alle maanden met ritten.
+    Alleen facturen met ritten worden bijgewerkt; handmatig ingevoerde
+    aantallen van facturen zonder ritlijst blijven staan. Commit niet;
+    geeft een dict met 'ritten', 'dubbel' en 'facturen' (bijgewerkte ids) terug.
+    """
+    if perioden is None:
+        perioden = conn.execute("""
+            SELECT DISTINCT f.jaar, f.maand FROM facturen f
+            WHERE EXISTS (SELECT 1 FROM ritten r WHERE r.factuur_id = f.id)
+            ORDER BY f.jaar, f.maand
+        """).fetchall()
+
+    resultaat = {"ritten": 0, "dubbel": 0, "facturen": []}
+    for jaar, maand in perioden:
+        factuur_ids = [rij[0] for rij in conn.execute("""
+            SELECT f.id FROM facturen f
+            WHERE f.jaar = ? AND f.maand = ?
+              AND EXISTS (SELECT 1 FROM ritten r WHERE r.factuur_id = f.id)
+        """, (jaar, maand))]
+        if not factuur_ids:
+            continue
+
+        ritten = _ritten_met_rand(conn, jaar, maand, tolerantie)
+        paren = zoek_dubbele_ritten(ritten, tolerantie)
+        # Paren van een latere rit in een buurmaand horen bij die maand
+        paren = paren[paren["factuur_id"].isin(factuur_ids)]
+        aantallen = paren["factuur_id"].value_counts()
+
+        for start in range(0, len(factuur_ids), 500):
+            chunk = factuur_ids[start:start + 500]
+            conn.execute(f"DELETE FROM dubbele_ritten WHERE factuur_id IN ({','.join('?' * len(chunk))})", chunk)
+        conn.executemany(
+            "INSERT INTO dubbele_ritten (rit_id, origineel_id, factuur_id, verschil_minuten) VALUES (?, ?, ?, ?)",
+            paren.astype(object).itertuples(index=False, name=None)
+        )
+        # Alleen echte wijzigingen schrijven: elke update zet de KPI triggers in gang
+        conn.executemany(
+            "UPDATE afwijkingen SET controle_dubbel_factuur = ? WHERE factuur_id = ? AND controle_dubbel_factuur IS NOT ?",
+            ((int(aantallen.get(i, 0)), i, int(aantallen.get(i, 0))) for i in factuur_ids)
+        )
+        refresh_kpi_scores(conn, factuur_ids)
+
+        resultaat["ritten"] += int(ritten["factuur_id"].isin(factuur_ids).sum())
+        resultaat["dubbel"] += len(paren)
+        resultaat["facturen"].extend(factuur_ids)
+    return resultaat
+
+# === Drill-down ===
+def load_dubbele_ritten(conn, factuur_id):
+    """Dubbele ritten van een factuur naast de rit waarmee ze samenvallen"""
+    return pd.read_sql_query("""
+        SELECT r.ritnummer, r.datum, r.klant, r.herkomst, r.bestemming,
+               COALESCE(r.gepland_ophalen, r.werkelijk_ophalen) AS ophalen,
+               o.ritnummer AS origineel_ritnummer,
+               COALESCE(o.gepland_ophalen, o.werkelijk_ophalen) AS origineel_ophalen,
+               f.perceel AS origineel_perceel, f.vervoerder AS origineel_vervoerder,
+               d.verschil_minuten
+        FROM dubbele_ritten d
+        JOIN ritten r ON r.id = d.rit_id
+        JOIN ritten o ON o.id = d.origineel_id
+        JOIN facturen f ON f.id = o.factuur_id
+        WHERE d.factuur_id = ?
+        ORDER BY r.datum, ophalen
+    """, conn, params=(int(factuur_id),))
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Zoek dubbele ritten op de facturen")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database (standaard: %(default)s)")
+    parser.add_argument("--periode", action="append", help="Maand als JJJJ-MM (herhaalbaar, standaard alle maanden)")
+    parser.add_argument("--tolerantie", type=float, default=TOLERANTIE_MINUTEN,
+                        help="Maximaal verschil in ophaaltijd in minuten (standaard: %(default)s)")
+    args = parser.parse_args(argv)
+
+    perioden = [tuple(int(deel) for deel in p.split("-")) for p in args.periode] if args.periode else None
+    init_db(args.db)
+    with connect(args.db) as conn:
+        resultaat = controleer_dubbele_ritten(conn, perioden, args.tolerantie)
+        conn.commit()
+    print(f"🔁 {resultaat['ritten']} ritten gecontroleerd, {resultaat['dubbel']} dubbel "
+          f"op {len(resultaat['facturen'])} facturen")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
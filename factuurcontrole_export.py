@@ -0,0 +1,88 @@
+import importlib.util
+import io
+import tempfile
+
+# === Configuratie ===
+# Rijen per geschreven blok
+EXPORT_CHUNK_SIZE = 50_000
+# Exports groter dan dit worden naar een tijdelijk bestand op schijf geschreven
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+# Formaat -> (extensie, mime type, benodigde module)
+EXPORT_FORMATEN = {
+    "CSV": ("csv", "text/csv", None),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", "pyarrow"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "openpyxl"),
+}
+
+def beschikbare_formaten():
+    """Exportformaten waarvan de benodigde module geïnstalleerd is"""
+    return {
+        formaat: (extensie, mime)
+        for formaat, (extensie, mime, module) in EXPORT_FORMATEN.items()
+        if module is None or importlib.util.find_spec(module) is not None
+    }
+
+# === Schrijvers ===
+def schrijf_csv(df, bestand, chunk_size=EXPORT_CHUNK_SIZE):
+    """Schrijf df als CSV (utf-8) naar een binair bestand, blok voor blok"""
+    tekst = io.TextIOWrapper(bestand, encoding="utf-8", newline="")
+    try:
+        df.iloc[:0].to_csv(tekst, index=False)
+        for start in range(0, len(df), chunk_size):
+            df.iloc[start:start + chunk_size].to_csv(tekst, header=False, index=False)
+        tekst.flush()
+    finally:
+        # Het onderliggende bestand blijft open voor de aanroeper
+        tekst.detach()
+
+def schrijf_parquet(df, bestand, chunk_size=EXPORT_CHUNK_SIZE, compression="zstd"):
+    """Schrijf df als gecomprimeerde Parquet, één row group per blok"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(bestand, schema, compression=compression) as writer:
+        for start in range(0, max(len(df), 1), chunk_size):
+            writer.write_table(pa.Table.from_pandas(
+                df.iloc[start:start + chunk_size], schema=schema, preserve_index=False
+            ))
+
+def schrijf_xlsx(df, bestand, chunk_size=EXPORT_CHUNK_SIZE):
+    """Schrijf df als xlsx met een write-only werkboek (rij voor rij)"""
+    import openpyxl
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Export")
+    sheet.append([str(kolom) for kolom in df.columns])
+    for start in range(0, len(df), chunk_size):
+        for rij in df.iloc[start:start + chunk_size].itertuples(index=False, name=None):
+            sheet.append([waarde.item() if hasattr(waarde, "item") else waarde for waarde in rij])
+    workbook.save(bestand)
+
+SCHRIJVERS = {
+    "CSV": schrijf_csv,
+    "Parquet": schrijf_parquet,
+    "Excel": schrijf_xlsx,
+}
+
+def exporteer(df, formaat="CSV"):
+    """Exporteer df naar een tijdelijk bestandsobject, klaar om te lezen.
+
+    Kleine exports blijven in het geheugen; grote worden naar schijf
+    geschreven zodat ze het geheugengebruik van het proces niet verdubbelen.
+    De aanroeper sluit het bestand (bij voorkeur met 'with').
+    """
+    bestand = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    SCHRIJVERS[formaat](df, bestand)
+    bestand.seek(0)
+    return bestand
+
+def exporteer_bytes(df, formaat="CSV"):
+    """Exporteer df als bytes, bijv. voor st.download_button.
+
+    Streamlit bewaart een download altijd als bytes; het tijdelijke bestand
+    wordt direct na het lezen gesloten (en van schijf verwijderd).
+    """
+    with exporteer(df, formaat) as bestand:
+        return bestand.read()
@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from factuurcontrole_db import (DB_FILE, KPI_SCORE_KOLOMMEN, connect, connect_readonly,
+                                bump_data_version, schrijf_berekende_kpi_scores)
+
+# === Configuratie ===
+# Facturen per chunk; na elke chunk wordt de voortgang vastgelegd
+CHUNK_SIZE = 5_000
+
+# Hoe lang een schrijfactie op de database lock wacht (seconden)
+LOCK_TIMEOUT = 30
+
+# Eén worker: herberekeningen lopen na elkaar, in volgorde van aanmaken
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kpi_herberekening")
+_lock = threading.Lock()
+_hervat = set()
+
+# === Wachtrij ===
+def plan_herberekening(db_file=DB_FILE, wijzigingen=None):
+    """Zet een herberekening van alle KPI scores in de wachtrij en geef het job id terug.
+
+    wijzigingen(conn) schrijft de nieuwe kpi_parameters, in dezelfde transactie
+    en ná de job: kpi_parameters_actief houdt dan de vorige parameters vast en
+    het dashboard blijft de huidige scores tonen totdat de job klaar is.
+    """
+    with connect(db_file, timeout=LOCK_TIMEOUT) as conn:
+        job_id = conn.execute(
+            "INSERT INTO kpi_herberekeningen (status) VALUES ('wachtrij')"
+        ).lastrowid
+        if wijzigingen is not None:
+            wijzigingen(conn)
+        conn.commit()
+    _executor.submit(herbereken_kpi_scores, db_file, job_id)
+    return job_id
+
+def hervat_herberekening(db_file=DB_FILE):
+    """Zet een onderbroken herberekening (bijv. na een herstart) opnieuw in de wachtrij (eenmalig per proces)"""
+    with _lock:
+        if db_file in _hervat:
+            return None
+        _hervat.add(db_file)
+    status = herberekening_status(db_file)
+    if status is None or status['status'] not in ('wachtrij', 'bezig'):
+        return None
+    _executor.submit(herbereken_kpi_scores, db_file, status['id'])
+    return status['id']
+
+def herberekening_status(db_file=DB_FILE):
+    """Status van de laatste herberekening als dict, of None als er nog geen is"""
+    try:
+        with connect_readonly(db_file) as conn:
+            conn.row_factory = sqlite3.Row
+            rij = conn.execute(
+                "SELECT * FROM kpi_herberekeningen ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return dict(rij) if rij else None
+
+# === Job ===
+def _vervangen(conn, job_id):
+    """Is er na deze job een nieuwere herberekening gepland?"""
+    nieuwste = conn.execute("SELECT MAX(id) FROM kpi_herberekeningen").fetchone()[0]
+    if nieuwste == job_id:
+        return False
+    conn.execute("UPDATE kpi_herberekeningen SET status = 'vervangen' WHERE id = ?", (job_id,))
+    conn.commit()
+    return True
+
+def herbereken_kpi_scores(db_file, job_id, chunk_size=CHUNK_SIZE):
+    """Bereken alle scores in chunks in kpi_scores_nieuw en wissel ze in één transactie met kpi_scores.
+
+    Een nieuwere job in de wachtrij vervangt deze; het werk wordt dan afgebroken.
+    """
+    conn = connect(db_file, timeout=LOCK_TIMEOUT)
+    try:
+        if _vervangen(conn, job_id):
+            return False
+
+        # Vanaf 'bezig' houden de triggers bij welke facturen schrijvers intussen (opnieuw) scoren
+        conn.execute("DELETE FROM kpi_scores_nieuw")
+        conn.execute("DELETE FROM kpi_scores_gewijzigd")
+        conn.execute(
+            "UPDATE kpi_herberekeningen SET status = 'bezig', verwerkt = 0 WHERE id = ?", (job_id,)
+        )
+        conn.commit()
+
+        factuur_ids = [rij[0] for rij in conn.execute("SELECT id FROM facturen ORDER BY id")]
+        conn.execute("UPDATE kpi_herberekeningen SET totaal = ? WHERE id = ?", (len(factuur_ids), job_id))
+        conn.commit()
+
+        verwerkt = 0
+        for start in range(0, len(factuur_ids), chunk_size):
+            chunk = factuur_ids[start:start + chunk_size]
+            # Ids zijn oplopend: een bereik laat SQLite de facturen via de primary key lezen
+            schrijf_berekende_kpi_scores(
+                conn, 'kpi_scores_nieuw', "WHERE s.factuur_id BETWEEN ? AND ?", (chunk[0], chunk[-1]),
+                view='kpi_scores_berekend'
+            )
+            verwerkt += len(chunk)
+            conn.execute("UPDATE kpi_herberekeningen SET verwerkt = ? WHERE id = ?", (verwerkt, job_id))
+            conn.commit()
+            if _vervangen(conn, job_id):
+                return False
+
+        _wissel_kpi_scores(conn, job_id)
+        return True
+    except Exception as e:
+        conn.rollback()
+        conn.execute(
+            "UPDATE kpi_herberekeningen SET status = 'fout', fout = ? WHERE id = ?", (str(e), job_id)
+        )
+        conn.commit()
+        raise
+    finally:
+        conn.close()
+
+def _wissel_kpi_scores(conn, job_id):
+    """Vervang kpi_scores door kpi_scores_nieuw en neem de nieuwe parameters over.
+
+    Facturen die tijdens de job gewijzigd zijn, zijn intussen met de vorige
+    parameters gescoord; die worden hier opnieuw berekend.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    if conn.execute("SELECT MAX(id) FROM kpi_herberekeningen").fetchone()[0] != job_id:
+        conn.rollback()
+        _vervangen(conn, job_id)
+        return
+    # Eerst de status wijzigen: het wisselen zelf hoeft niet bijgehouden te worden
+    conn.execute("UPDATE kpi_herberekeningen SET status = 'wisselen' WHERE id = ?", (job_id,))
+    conn.execute("DELETE FROM kpi_parameters_actief")
+    conn.execute("""
+        INSERT INTO kpi_parameters_actief
+        SELECT id, afwijking_type, percentage, berekenings_basis, updated_at FROM kpi_parameters
+    """)
+    conn.execute("DELETE FROM kpi_scores")
+    conn.execute(f"""
+        INSERT INTO kpi_scores ({KPI_SCORE_KOLOMMEN})
+        SELECT {KPI_SCORE_KOLOMMEN} FROM kpi_scores_nieuw n
+        WHERE n.factuur_id NOT IN (SELECT factuur_id FROM kpi_scores_gewijzigd)
+          AND EXISTS (SELECT 1 FROM facturen f WHERE f.id = n.factuur_id)
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO kpi_totaalscores (factuur_id, score)
+        SELECT factuur_id, AVG(score) FROM kpi_scores GROUP BY factuur_id
+    """)
+    schrijf_berekende_kpi_scores(
+        conn, where="WHERE s.factuur_id IN (SELECT factuur_id FROM kpi_scores_gewijzigd)"
+    )
+    conn.execute("DELETE FROM kpi_scores_nieuw")
+    conn.execute("DELETE FROM kpi_scores_gewijzigd")
+    conn.execute(
+        "UPDATE kpi_herberekeningen SET status = 'klaar', klaar_op = CURRENT_TIMESTAMP WHERE id = ?",
+        (job_id,)
+    )
+    # De nieuwe scores zijn nu zichtbaar: caches moeten opnieuw laden
+    bump_data_version(conn)
+    conn.commit()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Bulk import van facturen uit Excel (xlsx) of CSV.
+
+Leest het bestand in chunks, valideert elke chunk met kolomoperaties en
+schrijft de geldige rijen per chunk met executemany in één transactie.
+Afgewezen rijen worden met rijnummer en reden teruggegeven.
+
+Gebruik:
+    python factuurcontrole_import.py facturen.xlsx [--db factuurcontrole.db] [--chunk-size 5000]
+"""
+
+import argparse
+import csv
+import re
+import sys
+import numpy as np
+import pandas as pd
+from factuurcontrole_db import DB_FILE, init_db, connect, refresh_kpi_scores
+from factuurcontrole_kpi import AFWIJKING_TYPES, BASIS_KOLOMMEN
+
+# === Configuratie ===
+CHUNK_SIZE = 5000
+
+# Kolommen afgeleid uit factuurcontrole_kpi: een nieuw controletype of
+# nieuwe grondslag wordt zonder wijziging hier ook geïmporteerd
+TELLING_KOLOMMEN = list(BASIS_KOLOMMEN.values())
+KOSTEN_KOLOMMEN = ["vaste_kosten", "variabele_kosten"]
+FACTUUR_KOLOMMEN = ["jaar", "maand", "perceel", "vervoerder"] + KOSTEN_KOLOMMEN + TELLING_KOLOMMEN
+AFWIJKING_KOLOMMEN = list(AFWIJKING_TYPES)
+
+# Kolomnamen (genormaliseerd) -> kolom in facturen/afwijkingen. Naast de eigen
+# kolomnamen wordt de indeling van Factuurcontrole_Perceelrapportage.xlsx herkend.
+KOLOM_ALIASSEN = {
+    "variable_kosten": "variabele_kosten",
+    "ritten": "ritten_uitgevoerd",
+    "bestelling_ook_in_sw_afwijking": "controle_bestelling_sw",
+    "controle_levering_data_adwijking": "controle_gegevens_levering",
+    "controle_levering_data_afwijking": "controle_gegevens_levering",
+    "controle_stiptheid_realisatie_tijden_afwijking": "controle_stiptheid",
+    "indicatie_controle_afwijking": "controle_indicaties",
+    "overschrijden_reistijd_afwijking": "controle_reistijd",
+    "ritten_dubbel_op_factuur_afwijking": "controle_dubbel_factuur",
+    "routes_zonder_reizigers_afwijking": "controle_lege_routes",
+    "tijdig_afwezig_gemeld_afwijking": "controle_afwezig_melding",
+}
+
+def normaliseer_kolomnaam(naam):
+    """'Variable kosten ' -> 'variable_kosten'"""
+    return re.sub(r"[^0-9a-z]+", "_", str(naam).strip().lower()).strip("_")
+
+# === Inlezen in chunks ===
+def _csv_scheidingsteken(bron):
+    """Bepaal ',' of ';' aan de hand van het begin van het bestand"""
+    if hasattr(bron, "read"):
+        begin = bron.read(4096)
+        bron.seek(0)
+    else:
+        with open(bron, "rb") as f:
+            begin = f.read(4096)
+    if isinstance(begin, bytes):
+        begin = begin.decode("utf-8", errors="ignore")
+    try:
+        return csv.Sniffer().sniff(begin, delimiters=",;\t").delimiter
+    except csv.Error:
+        return ","
+
+def lees_chunks(bron, chunk_size=CHUNK_SIZE, bestandstype=None, blad=None):
+    """Lees een xlsx- of csv-bestand als reeks DataFrames van maximaal chunk_size rijen.
+
+    bron is een pad of een bestandsobject (bijv. een Streamlit upload). Het
+    bestand wordt nooit in zijn geheel in het geheugen geladen.
+    """
+    if bestandstype is None:
+        naam = getattr(bron, "name", str(bron))
+        bestandstype = "xlsx" if naam.lower().endswith((".xlsx", ".xlsm")) else "csv"
+
+    if bestandstype == "csv":
+        for chunk in pd.read_csv(bron, sep=_csv_scheidingsteken(bron), chunksize=chunk_size, dtype=str):
+            yield chunk
+        return
+
+    import openpyxl  # alleen nodig voor xlsx
+    workbook = openpyxl.load_workbook(bron, read_only=True, data_only=True)
+    try:
+        sheet = workbook[blad] if blad else workbook.worksheets[0]
+        rijen = sheet.iter_rows(values_only=True)
+        header = next(rijen, None)
+        if header is None:
+            return
+        header = [h if h is not None else f"kolom_{i}" for i, h in enumerate(header)]
+        buffer = []
+        for rij in rijen:
+            buffer.append(rij[:len(header)])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=header)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header)
+    finally:
+        workbook.close()
+
+# === Validatie ===
+def valideer_chunk(chunk, eerste_rij):
+    """Valideer een chunk met kolomoperaties.
+
+    eerste_rij is het rijnummer in het bestand van de eerste rij in de chunk
+    (de kopregel is rij 1). Geeft (geldig, afgewezen) terug: geldig bevat de
+    kolommen van facturen plus eventuele afwijkingskolommen, afgewezen de
+    kolommen 'rij' en 'reden'.
+    """
+    chunk = chunk.copy()
+    chunk.columns = [normaliseer_kolomnaam(k) for k in chunk.columns]
+    chunk = chunk.rename(columns={k: v for k, v in KOLOM_ALIASSEN.items() if v not in chunk.columns})
+    chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+    rijnummers = pd.Series(np.arange(eerste_rij, eerste_rij + len(chunk)), index=chunk.index)
+
+    # Volledig lege rijen (bijv. onderaan een spreadsheet) overslaan
+    leeg = chunk.isna() | chunk.astype(str).apply(lambda kolom: kolom.str.strip() == "")
+    chunk = chunk[~leeg.all(axis=1)]
+    rijnummers = rijnummers[chunk.index]
+
+    # Periode (JJJJMM) splitsen in jaar en maand
+    if "periode" in chunk.columns and "jaar" not in chunk.columns:
+        periode = pd.to_numeric(chunk["periode"], errors="coerce")
+        chunk["jaar"] = periode // 100
+        chunk["maand"] = periode % 100
+
+    redenen = pd.Series("", index=chunk.index)
+
+    def afwijzen(masker, reden):
+        redenen[masker & (redenen == "")] = reden
+
+    for kolom in ["jaar", "maand", "perceel", "vervoerder"]:
+        if kolom not in chunk.columns:
+            afwijzen(pd.Series(True, index=chunk.index), f"kolom '{kolom}' ontbreekt")
+            chunk[kolom] = np.nan
+
+    numeriek = {}
+    for kolom in ["jaar", "maand", "perceel"] + TELLING_KOLOMMEN + KOSTEN_KOLOMMEN + AFWIJKING_KOLOMMEN:
+        if kolom in chunk.columns:
+            waarden = chunk[kolom]
+            if not pd.api.types.is_numeric_dtype(waarden):
+                waarden = waarden.astype(str).str.strip().str.replace(",", ".", regex=False)
+            numeriek[kolom] = pd.to_numeric(waarden, errors="coerce")
+            afwijzen(chunk[kolom].notna() & numeriek[kolom].isna(), f"'{kolom}' is geen getal")
+        elif kolom not in ["jaar", "maand", "perceel"]:
+            numeriek[kolom] = pd.Series(0, index=chunk.index)
+
+    afwijzen(numeriek["jaar"].isna() | ~numeriek["jaar"].between(2000, 2100), "ongeldig jaar")
+    afwijzen(numeriek["maand"].isna() | ~numeriek["maand"].between(1, 12), "ongeldige maand")
+    afwijzen(numeriek["perceel"].isna() | (numeriek["perceel"] <= 0), "ongeldig perceel")
+    vervoerder = chunk["vervoerder"].astype("string").str.strip()
+    afwijzen(vervoerder.isna() | (vervoerder == ""), "vervoerder ontbreekt")
+
+    for kolom in TELLING_KOLOMMEN + AFWIJKING_KOLOMMEN + ["jaar", "maand", "perceel"]:
+        waarden = numeriek[kolom].fillna(0)
+        afwijzen((waarden < 0) | (waarden != np.floor(waarden)), f"'{kolom}' moet een geheel getal >= 0 zijn")
+    for kolom in KOSTEN_KOLOMMEN:
+        afwijzen(numeriek[kolom].fillna(0) < 0, f"'{kolom}' is negatief")
+
+    geldig_masker = redenen == ""
+    geldig = pd.DataFrame(index=chunk.index[geldig_masker])
+    for kolom in FACTUUR_KOLOMMEN:
+        if kolom == "vervoerder":
+            geldig[kolom] = vervoerder[geldig_masker].astype(object)
+        elif kolom in KOSTEN_KOLOMMEN:
+            geldig[kolom] = numeriek[kolom][geldig_masker].fillna(0).astype(float)
+        else:
+            geldig[kolom] = numeriek[kolom][geldig_masker].fillna(0).astype("int64")
+    for kolom in AFWIJKING_KOLOMMEN:
+        if kolom in chunk.columns:
+            geldig[kolom] = numeriek[kolom][geldig_masker].fillna(0).astype("int64")
+    geldig["rij"] = rijnummers[geldig_masker]
+
+    afgewezen = pd.DataFrame({
+        "rij": rijnummers[~geldig_masker],
+        "reden": redenen[~geldig_masker]
+    })
+    return geldig, afgewezen
+
+def _bestaande_sleutels(conn, geldig):
+    """Facturen (jaar, maand, perceel, vervoerder) die al in de database staan"""
+    jaren = sorted(int(j) for j in geldig["jaar"].unique())
+    return pd.read_sql_query(
+        f"SELECT DISTINCT jaar, maand, perceel, vervoerder FROM facturen WHERE jaar IN ({','.join('?' * len(jaren))})",
+        conn, params=jaren
+    )
+
+# === Import ===
+def importeer_facturen(bron, db_file=DB_FILE, chunk_size=CHUNK_SIZE, bestandstype=None, blad=None):
+    """Importeer facturen (en optioneel afwijkingen) uit een xlsx- of csv-bestand.
+
+    Elke chunk wordt in één transactie geschreven. Rijen voor een factuur
+    (jaar, maand, perceel, vervoerder) die al bestaat of eerder in het
+    bestand voorkomt, worden afgewezen. Geeft een dict terug met
+    'gelezen', 'geimporteerd' en 'afgewezen' (DataFrame met rij en reden).
+    """
+    init_db(db_file)
+    gelezen, geimporteerd = 0, 0
+    afgewezen_delen = []
+    sleutel = ["jaar", "maand", "perceel", "vervoerder"]
+    gezien = set()
+
+    with connect(db_file) as conn:
+        cursor = conn.cursor()
+        eerste_rij = 2
+        for chunk in lees_chunks(bron, chunk_size, bestandstype, blad):
+            gelezen += len(chunk)
+            geldig, afgewezen = valideer_chunk(chunk, eerste_rij)
+            eerste_rij += len(chunk)
+
+            if not geldig.empty:
+                # Schrijflock vóór de controle op dubbele facturen en MAX(id): anders kan een
+                # andere sessie ertussen facturen toevoegen die als deze import meetellen
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                # Dubbele facturen: al in de database, eerder in het bestand of binnen de chunk
+                sleutels = pd.MultiIndex.from_frame(geldig[sleutel])
+                bekend = set(_bestaande_sleutels(conn, geldig).itertuples(index=False, name=None)) | gezien
+                dubbel = sleutels.isin(bekend) | sleutels.duplicated()
+                if dubbel.any():
+                    afgewezen = pd.concat([afgewezen, pd.DataFrame({
+                        "rij": geldig["rij"][dubbel],
+                        "reden": "factuur bestaat al"
+                    })])
+                    geldig = geldig[~dubbel]
+                gezien.update(sleutels[~dubbel])
+
+            afgewezen_delen.append(afgewezen)
+            if geldig.empty:
+                continue
+
+            max_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM facturen").fetchone()[0]
+            cursor.executemany(f"""
+                INSERT INTO facturen ({', '.join(FACTUUR_KOLOMMEN)})
+                VALUES ({', '.join('?' * len(FACTUUR_KOLOMMEN))})
+            """, geldig[FACTUUR_KOLOMMEN].itertuples(index=False, name=None))
+            # Ids zijn oplopend in volgorde van invoegen; de schrijflock houdt andere sessies buiten
+            nieuwe_ids = [row[0] for row in cursor.execute(
+                "SELECT id FROM facturen WHERE id > ? ORDER BY id", (max_id,)
+            )]
+
+            afwijking_kolommen = [k for k in AFWIJKING_KOLOMMEN if k in geldig.columns]
+            if afwijking_kolommen:
+                # De afwijkingen rij is door de trigger op facturen al aangemaakt
+                params = geldig[afwijking_kolommen].assign(factuur_id=nieuwe_ids)
+                cursor.executemany(
+                    f"UPDATE afwijkingen SET {', '.join(f'{k} = ?' for k in afwijking_kolommen)} WHERE factuur_id = ?",
+                    params.itertuples(index=False, name=None)
+                )
+
+            refresh_kpi_scores(conn, nieuwe_ids)
+            conn.commit()
+            geimporteerd += len(nieuwe_ids)
+
+    afgewezen = (pd.concat(afgewezen_delen, ignore_index=True).sort_values("rij").reset_index(drop=True)
+                 if afgewezen_delen else pd.DataFrame(columns=["rij", "reden"]))
+    return {"gelezen": gelezen, "geimporteerd": geimporteerd, "afgewezen": afgewezen}
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importeer facturen uit een xlsx- of csv-bestand")
+    parser.add_argument("bestand", help="Pad naar het xlsx- of csv-bestand")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database (standaard: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rijen per chunk/transactie")
+    parser.add_argument("--blad", help="Naam van het werkblad (xlsx, standaard het eerste)")
+    parser.add_argument("--afgewezen", help="Schrijf afgewezen rijen naar dit csv-bestand")
+    args = parser.parse_args(argv)
+
+    resultaat = importeer_facturen(args.bestand, args.db, args.chunk_size, blad=args.blad)
+    afgewezen = resultaat["afgewezen"]
+    print(f"📥 {resultaat['gelezen']} rijen gelezen, {resultaat['geimporteerd']} facturen geïmporteerd, "
+          f"{len(afgewezen)} afgewezen")
+    if not afgewezen.empty:
+        if args.afgewezen:
+            afgewezen.to_csv(args.afgewezen, index=False)
+            print(f"❌ Afgewezen rijen geschreven naar {args.afgewezen}")
+        else:
+            print(afgewezen.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
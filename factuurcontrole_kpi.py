@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+
+# === KPI configuratie ===
+# Afwijkingskolommen in de factuurdata, in vaste volgorde
+AFWIJKING_TYPES = [
+    'controle_bestelling_sw',
+    'controle_gegevens_levering',
+    'controle_stiptheid',
+    'controle_indicaties',
+    'controle_reistijd',
+    'controle_dubbel_factuur',
+    'controle_lege_routes',
+    'controle_afwezig_melding'
+]
+
+# Berekeningsgrondslag -> kolom in de factuurdata
+BASIS_KOLOMMEN = {
+    "Ritten besteld": 'ritten_besteld',
+    "Ritten uitgevoerd": 'ritten_uitgevoerd',
+    "Ritten geannuleerd": 'ritten_geannuleerd',
+    "Ritten loos": 'ritten_loos',
+    "Routes": 'routes'
+}
+
+# Oude namen in kpi_parameters -> afwijkingskolom (het app formulier sloeg
+# 'controle_gegevens_levering' op als 'controle_levering')
+KPI_ALIASSEN = {
+    'controle_levering': 'controle_gegevens_levering'
+}
+
+def afwijking_naam(afwijking_type):
+    """Leesbare naam van een afwijking, bijv. 'Bestelling Sw'"""
+    return afwijking_type.replace('_', ' ').replace('controle ', '').title()
+
+# === Parameters ===
+def compileer_kpi_parameters(kpi_params):
+    """Zet de kpi_parameters rijen één keer om in een opzoektabel.
+
+    Geeft een dict afwijking_type -> (doel, basis_kolom) in volgorde van
+    AFWIJKING_TYPES; basis_kolom is None bij een onbekende grondslag (telt als 1).
+    Per type wint de eerste rij; een rij onder de canonieke naam gaat voor een
+    alias. Een al gecompileerde dict wordt ongewijzigd teruggegeven.
+    """
+    if isinstance(kpi_params, dict):
+        return kpi_params
+    if isinstance(kpi_params, list):
+        kpi_params = pd.DataFrame(kpi_params)
+    if kpi_params.empty:
+        return {}
+
+    gevonden = {}
+    for afwijking_type, doel, basis_type in zip(
+        kpi_params['afwijking_type'], kpi_params['percentage'], kpi_params['berekenings_basis']
+    ):
+        canoniek = KPI_ALIASSEN.get(afwijking_type, afwijking_type)
+        is_alias = canoniek != afwijking_type
+        if canoniek not in gevonden or (gevonden[canoniek][2] and not is_alias):
+            gevonden[canoniek] = (doel, BASIS_KOLOMMEN.get(basis_type), is_alias)
+
+    return {
+        afwijking_type: gevonden[afwijking_type][:2]
+        for afwijking_type in AFWIJKING_TYPES if afwijking_type in gevonden
+    }
+
+# === KPI berekening per factuur ===
+def calculate_kpi_scores(factuur_data, kpi_params):
+    """Bereken KPI scores voor een factuur (Series of dict met factuur- en afwijkingskolommen).
+
+    kpi_params mag een DataFrame, een lijst rijen of het resultaat van
+    compileer_kpi_parameters zijn; compileer vooraf als je veel facturen scoort.
+    """
+    kpi_results = []
+    for afwijking_type, (doel, basis_kolom) in compileer_kpi_parameters(kpi_params).items():
+        afwijking_count = factuur_data.get(afwijking_type, 0)
+        basis_count = 1 if basis_kolom is None else factuur_data.get(basis_kolom, 0)
+
+        actual_percentage = (afwijking_count / basis_count * 100) if basis_count > 0 else 0
+        meets_target = actual_percentage <= doel
+
+        kpi_results.append({
+            'afwijking': afwijking_type,
+            'naam': afwijking_naam(afwijking_type),
+            'aantal': afwijking_count,
+            'basis': basis_count,
+            'percentage': actual_percentage,
+            'doel': doel,
+            'status': 'GOED' if meets_target else 'AFWIJKING',
+            'score': 100 if meets_target else max(0, 100 - (actual_percentage - doel) * 10)
+        })
+    return kpi_results
+
+# === Batch KPI berekening ===
+def calculate_kpi_scores_batch(data, kpi_params):
+    """Bereken KPI scores voor alle facturen in één keer.
+
+    Geeft een tuple (kpi_df, overall_scores) terug:
+    - kpi_df: één rij per factuur x afwijking met de kolommen van
+      calculate_kpi_scores plus 'index' (index van de factuur in data)
+      en 'factuur_id'
+    - overall_scores: gemiddelde score per factuur, met dezelfde index als data
+    """
+    parameters = compileer_kpi_parameters(kpi_params)
+
+    n = len(data)
+    kolommen = ['index', 'factuur_id', 'afwijking', 'naam', 'aantal', 'basis',
+                'percentage', 'doel', 'status', 'score']
+    if n == 0 or not parameters:
+        return pd.DataFrame(columns=kolommen), pd.Series(0.0, index=data.index)
+
+    factuur_ids = data['id'].to_numpy() if 'id' in data.columns else data.index.to_numpy()
+    delen = []
+
+    for afwijking_type, (doel, basis_kolom) in parameters.items():
+        # Aantallen; ontbrekende kolommen tellen als 0, onbekende grondslag als 1
+        if afwijking_type in data.columns:
+            aantal = data[afwijking_type].to_numpy()
+        else:
+            aantal = np.zeros(n, dtype=np.int64)
+        if basis_kolom is None:
+            basis = np.ones(n, dtype=np.int64)
+        elif basis_kolom in data.columns:
+            basis = data[basis_kolom].to_numpy()
+        else:
+            basis = np.zeros(n, dtype=np.int64)
+
+        aantal_f = aantal.astype(float)
+        basis_f = basis.astype(float)
+        positief = basis_f > 0
+        percentage = np.where(positief, aantal_f / np.where(positief, basis_f, 1.0) * 100, 0.0)
+        voldoet = percentage <= doel
+        score = np.where(voldoet, 100.0, 100 - (percentage - doel) * 10)
+        # Zelfde gedrag als max(0, x): NaN en negatieve waarden worden 0
+        score = np.where(score > 0, score, 0.0)
+
+        delen.append(pd.DataFrame({
+            'index': data.index.to_numpy(),
+            'factuur_id': factuur_ids,
+            'afwijking': afwijking_type,
+            'naam': afwijking_naam(afwijking_type),
+            'aantal': aantal,
+            'basis': basis,
+            'percentage': percentage,
+            'doel': doel,
+            'status': np.where(voldoet, 'GOED', 'AFWIJKING'),
+            'score': score
+        }))
+
+    scores = np.column_stack([deel['score'].to_numpy() for deel in delen])
+    overall_scores = pd.Series(scores.mean(axis=1), index=data.index)
+
+    # Sorteer per factuur, daarbinnen in volgorde van AFWIJKING_TYPES
+    kpi_df = pd.concat(delen, ignore_index=True)
+    volgorde = np.arange(len(kpi_df)).reshape(len(delen), n).T.ravel()
+    kpi_df = kpi_df.iloc[volgorde].reset_index(drop=True)
+
+    return kpi_df, overall_scores
+
+def overall_status(score):
+    """Status van de totaalscore ('GOED', 'AANDACHT' of 'ACTIE'), ook voor Series"""
+    if isinstance(score, pd.Series):
+        return pd.Series(
+            np.select([score >= 90, score >= 70], ['GOED', 'AANDACHT'], 'ACTIE'),
+            index=score.index
+        )
+    return 'GOED' if score >= 90 else 'AANDACHT' if score >= 70 else 'ACTIE'
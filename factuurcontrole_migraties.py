@@ -0,0 +1,642 @@
+import sqlite3
+from factuurcontrole_kpi import AFWIJKING_TYPES, BASIS_KOLOMMEN, KPI_ALIASSEN
+
+# === Configuratie ===
+# PRAGMAs voor elke verbinding. journal_mode = WAL wordt eenmalig in het
+# databasebestand gezet (zie migreer); daarmee is synchronous = NORMAL veilig.
+PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # negatief: in KiB, dus 64 MB
+}
+
+# Dimensies waarop de dashboards filteren, in volgorde van de samengestelde index
+FILTER_DIMENSIES = ['jaar', 'maand', 'perceel', 'vervoerder']
+
+# Gesommeerde kolommen in maand_aggregaten
+AGGREGAAT_KOLOMMEN = [
+    'vaste_kosten', 'variabele_kosten', 'ritten_besteld', 'ritten_geannuleerd',
+    'ritten_loos', 'ritten_uitgevoerd', 'routes'
+] + AFWIJKING_TYPES
+
+# === SQL hulpfuncties ===
+def _maand_aggregaat_sql(sleutel):
+    """Statements die de maand_aggregaten rij(en) voor één sleutel opnieuw opbouwen.
+
+    sleutel is een subquery met de kolommen jaar, maand, perceel en vervoerder.
+    """
+    sommen = ",\n".join(
+        f"COALESCE(SUM({'a' if kolom in AFWIJKING_TYPES else 'f'}.{kolom}), 0)"
+        for kolom in AGGREGAAT_KOLOMMEN
+    )
+    gelijk = " AND ".join(f"f.{d} IS k.{d}" for d in FILTER_DIMENSIES)
+    return f"""
+        DELETE FROM maand_aggregaten WHERE EXISTS (
+            SELECT 1 FROM {sleutel} k
+            WHERE {" AND ".join(f"k.{d} IS maand_aggregaten.{d}" for d in FILTER_DIMENSIES)}
+        );
+        INSERT INTO maand_aggregaten (perceel, vervoerder, jaar, maand, aantal_facturen, {', '.join(AGGREGAAT_KOLOMMEN)})
+        SELECT f.perceel, f.vervoerder, f.jaar, f.maand, COUNT(*),
+        {sommen}
+        FROM {sleutel} k
+        JOIN facturen f ON {gelijk}
+        LEFT JOIN afwijkingen a ON a.factuur_id = f.id
+        GROUP BY f.perceel, f.vervoerder, f.jaar, f.maand;
+    """
+
+def _tellingen_sql(rij):
+    """Statements die de tellingen van de afwijkingenkolommen van één rij overnemen (alleen aantallen != 0)"""
+    return f"""
+        DELETE FROM afwijking_tellingen
+        WHERE factuur_id = {rij}.factuur_id AND afwijking_type IN ({', '.join(f"'{t}'" for t in AFWIJKING_TYPES)});
+        INSERT INTO afwijking_tellingen (factuur_id, afwijking_type, aantal)
+        SELECT factuur_id, afwijking_type, aantal FROM (
+            {' UNION ALL '.join(f"SELECT {rij}.factuur_id AS factuur_id, '{t}' AS afwijking_type, {rij}.{t} AS aantal" for t in AFWIJKING_TYPES)}
+        ) WHERE aantal != 0;
+    """
+
+def _kpi_scores_view(naam, parameters):
+    """View met de KPI scores van elke factuur x elk type uit de tabel parameters"""
+    return f"""
+    CREATE VIEW {naam} AS
+    WITH basis AS (
+        SELECT f.id AS factuur_id,
+               p.afwijking_type,
+               COALESCE(t.aantal, 0) AS aantal,
+               CASE p.berekenings_basis
+                   {' '.join(f"WHEN '{basis}' THEN f.{kolom}" for basis, kolom in BASIS_KOLOMMEN.items())}
+                   ELSE 1
+               END AS basis,
+               p.percentage AS doel
+        FROM facturen f
+        CROSS JOIN {parameters} p
+        LEFT JOIN afwijking_tellingen t ON t.factuur_id = f.id AND t.afwijking_type = p.afwijking_type
+        WHERE p.afwijking_type NOT IN ({', '.join(f"'{alias}'" for alias in KPI_ALIASSEN)})
+    ),
+    percentages AS (
+        SELECT factuur_id, afwijking_type, aantal, basis, doel,
+               CASE WHEN basis > 0 THEN CAST(aantal AS REAL) / basis * 100 ELSE 0.0 END AS percentage
+        FROM basis
+    )
+    SELECT factuur_id, afwijking_type, aantal, basis, percentage, doel,
+           CASE WHEN percentage <= doel THEN 'GOED' ELSE 'AFWIJKING' END AS status,
+           CASE WHEN percentage <= doel THEN 100.0
+                WHEN 100 - (percentage - doel) * 10 > 0 THEN 100 - (percentage - doel) * 10
+                ELSE 0.0
+           END AS score
+    FROM percentages
+    """
+
+def _factuur_sleutel(rij):
+    return f"(SELECT {', '.join(f'{rij}.{d} AS {d}' for d in FILTER_DIMENSIES)})"
+
+def _afwijking_sleutel(rij):
+    return f"(SELECT {', '.join(FILTER_DIMENSIES)} FROM facturen WHERE id = {rij}.factuur_id)"
+
+# === Schema ===
+# Basistabellen; een bulk load (testdata) vult deze vóór de migraties
+TABELLEN = [
+    """
+    CREATE TABLE IF NOT EXISTS facturen (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        jaar INTEGER,
+        maand INTEGER,
+        perceel INTEGER,
+        vervoerder TEXT,
+        vaste_kosten REAL,
+        variabele_kosten REAL,
+        ritten_besteld INTEGER,
+        ritten_geannuleerd INTEGER,
+        ritten_loos INTEGER,
+        ritten_uitgevoerd INTEGER,
+        routes INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS afwijkingen (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        factuur_id INTEGER UNIQUE,
+        controle_bestelling_sw INTEGER,
+        controle_gegevens_levering INTEGER,
+        controle_stiptheid INTEGER,
+        controle_indicaties INTEGER,
+        controle_reistijd INTEGER,
+        controle_dubbel_factuur INTEGER,
+        controle_lege_routes INTEGER,
+        controle_afwezig_melding INTEGER,
+        FOREIGN KEY (factuur_id) REFERENCES facturen(id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS kpi_parameters (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        afwijking_type TEXT UNIQUE,
+        percentage REAL,
+        berekenings_basis TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+BASISSCHEMA = TABELLEN + [
+    # Samengestelde index voor de dashboardfilters en SELECT DISTINCT opties
+    "CREATE INDEX IF NOT EXISTS idx_facturen_dimensies ON facturen (jaar, maand, perceel, vervoerder)",
+    # Opgeslagen KPI scores per factuur en afwijking
+    """
+    CREATE TABLE IF NOT EXISTS kpi_scores (
+        factuur_id INTEGER NOT NULL,
+        afwijking_type TEXT NOT NULL,
+        naam TEXT,
+        aantal INTEGER,
+        basis INTEGER,
+        percentage REAL,
+        doel REAL,
+        status TEXT,
+        score REAL,
+        PRIMARY KEY (factuur_id, afwijking_type)
+    )
+    """,
+    # Scores van een gewijzigde factuur zijn verouderd: verwijder ze, zodat
+    # ze opnieuw berekend worden (door de schrijver of in het geheugen)
+    """
+    CREATE TRIGGER IF NOT EXISTS kpi_scores_factuur_update
+    AFTER UPDATE ON facturen
+    BEGIN
+        DELETE FROM kpi_scores WHERE factuur_id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS kpi_scores_factuur_delete
+    AFTER DELETE ON facturen
+    BEGIN
+        DELETE FROM kpi_scores WHERE factuur_id = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS kpi_scores_afwijkingen_insert
+    AFTER INSERT ON afwijkingen
+    BEGIN
+        DELETE FROM kpi_scores WHERE factuur_id = NEW.factuur_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS kpi_scores_afwijkingen_update
+    AFTER UPDATE ON afwijkingen
+    BEGIN
+        DELETE FROM kpi_scores WHERE factuur_id = OLD.factuur_id;
+        DELETE FROM kpi_scores WHERE factuur_id = NEW.factuur_id;
+    END
+    """,
+    # Achtergrond herberekening van alle scores na een parameterwijziging
+    # (factuurcontrole_herberekening): de nieuwe scores komen eerst in
+    # kpi_scores_nieuw en vervangen kpi_scores pas als alles berekend is
+    """
+    CREATE TABLE IF NOT EXISTS kpi_herberekeningen (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status TEXT NOT NULL,
+        totaal INTEGER,
+        verwerkt INTEGER NOT NULL DEFAULT 0,
+        fout TEXT,
+        aangemaakt_op TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        klaar_op TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS kpi_scores_nieuw (
+        factuur_id INTEGER NOT NULL,
+        afwijking_type TEXT NOT NULL,
+        naam TEXT,
+        aantal INTEGER,
+        basis INTEGER,
+        percentage REAL,
+        doel REAL,
+        status TEXT,
+        score REAL,
+        PRIMARY KEY (factuur_id, afwijking_type)
+    )
+    """,
+    # Facturen waarvan de scores tijdens een herberekening door een schrijver
+    # zijn vervangen of verwijderd; die houden bij het wisselen hun huidige scores
+    """
+    CREATE TABLE IF NOT EXISTS kpi_scores_gewijzigd (
+        factuur_id INTEGER PRIMARY KEY
+    )
+    """,
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS kpi_scores_{actie.lower()}_tijdens_herberekening
+    AFTER {actie} ON kpi_scores
+    WHEN EXISTS (SELECT 1 FROM kpi_herberekeningen WHERE status = 'bezig')
+    BEGIN
+        INSERT OR IGNORE INTO kpi_scores_gewijzigd (factuur_id) VALUES ({rij}.factuur_id);
+    END
+    """
+    for actie, rij in (('INSERT', 'NEW'), ('DELETE', 'OLD'))
+] + [
+    # Elke factuur heeft een afwijkingen rij: bij het invoeren aanmaken met
+    # nullen, en eenmalig aanvullen voor bestaande facturen
+    """
+    CREATE TRIGGER IF NOT EXISTS afwijkingen_nieuwe_factuur
+    AFTER INSERT ON facturen
+    BEGIN
+        INSERT INTO afwijkingen (factuur_id, controle_bestelling_sw, controle_gegevens_levering,
+        controle_stiptheid, controle_indicaties, controle_reistijd, controle_dubbel_factuur,
+        controle_lege_routes, controle_afwezig_melding)
+        SELECT NEW.id, 0, 0, 0, 0, 0, 0, 0, 0
+        WHERE NOT EXISTS (SELECT 1 FROM afwijkingen a WHERE a.factuur_id = NEW.id);
+    END
+    """,
+    """
+    INSERT INTO afwijkingen (factuur_id, controle_bestelling_sw, controle_gegevens_levering,
+    controle_stiptheid, controle_indicaties, controle_reistijd, controle_dubbel_factuur,
+    controle_lege_routes, controle_afwezig_melding)
+    SELECT f.id, 0, 0, 0, 0, 0, 0, 0, 0
+    FROM facturen f
+    WHERE NOT EXISTS (SELECT 1 FROM afwijkingen a WHERE a.factuur_id = f.id)
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_afwijkingen_factuur ON afwijkingen (factuur_id)",
+    # Maandtotalen per perceel en vervoerder voor de stacked bar grafieken,
+    # bijgehouden door de triggers hieronder
+    f"""
+    CREATE TABLE IF NOT EXISTS maand_aggregaten (
+        perceel INTEGER,
+        vervoerder TEXT,
+        jaar INTEGER,
+        maand INTEGER,
+        aantal_facturen INTEGER,
+        {', '.join(f'{kolom} REAL' if 'kosten' in kolom else f'{kolom} INTEGER' for kolom in AGGREGAAT_KOLOMMEN)},
+        UNIQUE (perceel, vervoerder, jaar, maand)
+    )
+    """,
+    f"""
+    INSERT INTO maand_aggregaten (perceel, vervoerder, jaar, maand, aantal_facturen, {', '.join(AGGREGAAT_KOLOMMEN)})
+    SELECT f.perceel, f.vervoerder, f.jaar, f.maand, COUNT(*),
+    {', '.join(f"COALESCE(SUM({'a' if kolom in AFWIJKING_TYPES else 'f'}.{kolom}), 0)" for kolom in AGGREGAAT_KOLOMMEN)}
+    FROM facturen f
+    LEFT JOIN afwijkingen a ON a.factuur_id = f.id
+    WHERE NOT EXISTS (SELECT 1 FROM maand_aggregaten)
+    GROUP BY f.perceel, f.vervoerder, f.jaar, f.maand
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maand_aggregaten_factuur_insert
+    AFTER INSERT ON facturen
+    BEGIN
+        {_maand_aggregaat_sql(_factuur_sleutel('NEW'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maand_aggregaten_factuur_update
+    AFTER UPDATE ON facturen
+    BEGIN
+        {_maand_aggregaat_sql(_factuur_sleutel('OLD'))}
+        {_maand_aggregaat_sql(_factuur_sleutel('NEW'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maand_aggregaten_factuur_delete
+    AFTER DELETE ON facturen
+    BEGIN
+        {_maand_aggregaat_sql(_factuur_sleutel('OLD'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maand_aggregaten_afwijkingen_insert
+    AFTER INSERT ON afwijkingen
+    BEGIN
+        {_maand_aggregaat_sql(_afwijking_sleutel('NEW'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maand_aggregaten_afwijkingen_update
+    AFTER UPDATE ON afwijkingen
+    BEGIN
+        {_maand_aggregaat_sql(_afwijking_sleutel('OLD'))}
+        {_maand_aggregaat_sql(_afwijking_sleutel('NEW'))}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS maand_aggregaten_afwijkingen_delete
+    AFTER DELETE ON afwijkingen
+    BEGIN
+        {_maand_aggregaat_sql(_afwijking_sleutel('OLD'))}
+    END
+    """,
+    # Dataversie: wordt bij elke schrijfactie opgehoogd zodat caches weten
+    # wanneer ze opnieuw moeten laden
+    """
+    CREATE TABLE IF NOT EXISTS data_versie (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        versie INTEGER NOT NULL
+    )
+    """,
+    "INSERT OR IGNORE INTO data_versie (id, versie) VALUES (1, 0)"
+] + [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS data_versie_{tabel}_{actie.lower()}
+    AFTER {actie} ON {tabel}
+    BEGIN
+        UPDATE data_versie SET versie = versie + 1 WHERE id = 1;
+    END
+    """
+    for tabel in ('facturen', 'afwijkingen', 'kpi_parameters')
+    for actie in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+# Afwijkingen in long-format: één rij per factuur en afwijkingstype (alleen
+# aantallen != 0). Nieuwe controletypes hebben alleen een kpi_parameters rij
+# nodig. De kolommen van afwijkingen blijven de invoer; triggers houden de
+# tellingen gelijk.
+AFWIJKING_TELLINGEN = [
+    """
+    CREATE TABLE afwijking_tellingen (
+        factuur_id INTEGER NOT NULL,
+        afwijking_type TEXT NOT NULL,
+        aantal INTEGER NOT NULL,
+        PRIMARY KEY (factuur_id, afwijking_type)
+    ) WITHOUT ROWID
+    """,
+    f"""
+    INSERT INTO afwijking_tellingen (factuur_id, afwijking_type, aantal)
+    {' UNION ALL '.join(
+        f"SELECT factuur_id, '{t}', {t} FROM afwijkingen WHERE factuur_id IS NOT NULL AND {t} != 0"
+        for t in AFWIJKING_TYPES
+    )}
+    """,
+    f"""
+    CREATE TRIGGER afwijking_tellingen_afwijkingen_insert
+    AFTER INSERT ON afwijkingen
+    BEGIN
+        {_tellingen_sql('NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER afwijking_tellingen_afwijkingen_update
+    AFTER UPDATE ON afwijkingen
+    BEGIN
+        DELETE FROM afwijking_tellingen
+        WHERE factuur_id = OLD.factuur_id AND afwijking_type IN ({', '.join(f"'{t}'" for t in AFWIJKING_TYPES)});
+        {_tellingen_sql('NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER afwijking_tellingen_afwijkingen_delete
+    AFTER DELETE ON afwijkingen
+    BEGIN
+        DELETE FROM afwijking_tellingen
+        WHERE factuur_id = OLD.factuur_id AND afwijking_type IN ({', '.join(f"'{t}'" for t in AFWIJKING_TYPES)});
+    END
+    """,
+] + [
+    # Rechtstreekse schrijfacties (nieuwe controletypes): opgeslagen scores
+    # zijn verouderd en caches moeten opnieuw laden
+    f"""
+    CREATE TRIGGER afwijking_tellingen_{actie.lower()}
+    AFTER {actie} ON afwijking_tellingen
+    BEGIN
+        {' '.join(f"DELETE FROM kpi_scores WHERE factuur_id = {rij}.factuur_id;" for rij in rijen)}
+        UPDATE data_versie SET versie = versie + 1 WHERE id = 1;
+    END
+    """
+    for actie, rijen in (('INSERT', ['NEW']), ('UPDATE', ['OLD', 'NEW']), ('DELETE', ['OLD']))
+] + [
+    # KPI scores in SQL: elke factuur x elk KPI type (behalve oude aliassen),
+    # met dezelfde regels als calculate_kpi_scores_batch
+    _kpi_scores_view('kpi_scores_berekend', 'kpi_parameters'),
+]
+
+# Ritregels uit de ritlijsten van de vervoerders; de ritten_* en routes
+# tellingen van facturen worden hieruit afgeleid (factuurcontrole_ritten).
+# Tijdstippen als ISO tekst (JJJJ-MM-DDTUU:MM:SS), directe_reistijd in minuten.
+RITTEN = [
+    """
+    CREATE TABLE ritten (
+        id INTEGER PRIMARY KEY,
+        factuur_id INTEGER NOT NULL REFERENCES facturen(id),
+        ritnummer TEXT,
+        datum TEXT NOT NULL,
+        status TEXT NOT NULL CHECK (status IN ('uitgevoerd', 'geannuleerd', 'loos')),
+        route TEXT,
+        klant TEXT,
+        herkomst TEXT,
+        bestemming TEXT,
+        gepland_ophalen TEXT,
+        werkelijk_ophalen TEXT,
+        gepland_aankomst TEXT,
+        werkelijk_aankomst TEXT,
+        directe_reistijd REAL
+    )
+    """,
+    # Dekkende index: de tellingen per factuur lezen alleen de index
+    "CREATE INDEX idx_ritten_factuur ON ritten (factuur_id, status, route)",
+    """
+    CREATE TRIGGER ritten_factuur_delete
+    AFTER DELETE ON facturen
+    BEGIN
+        DELETE FROM ritten WHERE factuur_id = OLD.id;
+    END
+    """,
+]
+
+# Paren uit de controle op dubbele ritten (factuurcontrole_dubbel): rit_id
+# valt samen met de eerdere rit origineel_id
+DUBBELE_RITTEN = [
+    """
+    CREATE TABLE dubbele_ritten (
+        rit_id INTEGER PRIMARY KEY,
+        origineel_id INTEGER NOT NULL,
+        factuur_id INTEGER NOT NULL,
+        verschil_minuten REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX idx_dubbele_ritten_factuur ON dubbele_ritten (factuur_id)",
+    """
+    CREATE TRIGGER dubbele_ritten_factuur_delete
+    AFTER DELETE ON facturen
+    BEGIN
+        DELETE FROM dubbele_ritten WHERE factuur_id = OLD.id;
+    END
+    """,
+]
+
+# Gefactureerde ritten zonder bestelling in de export van het bestelsysteem
+# (factuurcontrole_afstemming)
+ONTBREKENDE_BESTELLINGEN = [
+    """
+    CREATE TABLE ontbrekende_bestellingen (
+        rit_id INTEGER PRIMARY KEY,
+        factuur_id INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX idx_ontbrekende_bestellingen_factuur ON ontbrekende_bestellingen (factuur_id)",
+    """
+    CREATE TRIGGER ontbrekende_bestellingen_factuur_delete
+    AFTER DELETE ON facturen
+    BEGIN
+        DELETE FROM ontbrekende_bestellingen WHERE factuur_id = OLD.id;
+    END
+    """,
+]
+
+# Resultaten op ritniveau verwijzen naar ritten; een nieuwe ritlijst vervangt
+# de ritten van een factuur, dus de verwijzingen moeten mee verdwijnen
+RITTEN_OPRUIMEN = [
+    "CREATE INDEX idx_dubbele_ritten_origineel ON dubbele_ritten (origineel_id)",
+    """
+    CREATE TRIGGER ritten_delete
+    AFTER DELETE ON ritten
+    BEGIN
+        DELETE FROM ontbrekende_bestellingen WHERE rit_id = OLD.id;
+        DELETE FROM dubbele_ritten WHERE rit_id = OLD.id;
+        DELETE FROM dubbele_ritten WHERE origineel_id = OLD.id;
+    END
+    """,
+    "DELETE FROM ontbrekende_bestellingen WHERE rit_id NOT IN (SELECT id FROM ritten)",
+    """
+    DELETE FROM dubbele_ritten
+    WHERE rit_id NOT IN (SELECT id FROM ritten) OR origineel_id NOT IN (SELECT id FROM ritten)
+    """,
+]
+
+# KPI scores met de parameters waarmee kpi_scores berekend is. Zolang een
+# herberekening in de wachtrij staat of loopt, blijft kpi_parameters_actief op
+# de vorige parameters staan en scoren schrijvers daarmee; de wissel neemt de
+# nieuwe parameters over. Anders volgt de tabel kpi_parameters direct.
+_HERBEREKENING_OPEN = "SELECT 1 FROM kpi_herberekeningen WHERE status IN ('wachtrij', 'bezig', 'wisselen')"
+
+KPI_PARAMETERS_ACTIEF = [
+    """
+    CREATE TABLE kpi_parameters_actief (
+        id INTEGER PRIMARY KEY,
+        afwijking_type TEXT UNIQUE,
+        percentage REAL,
+        berekenings_basis TEXT,
+        updated_at TIMESTAMP
+    )
+    """,
+    "INSERT INTO kpi_parameters_actief SELECT id, afwijking_type, percentage, berekenings_basis, updated_at FROM kpi_parameters",
+] + [
+    f"""
+    CREATE TRIGGER kpi_parameters_actief_{actie.lower()}
+    AFTER {actie} ON kpi_parameters
+    WHEN NOT EXISTS ({_HERBEREKENING_OPEN})
+    BEGIN
+        DELETE FROM kpi_parameters_actief;
+        INSERT INTO kpi_parameters_actief
+        SELECT id, afwijking_type, percentage, berekenings_basis, updated_at FROM kpi_parameters;
+    END
+    """
+    for actie in ('INSERT', 'UPDATE', 'DELETE')
+] + [
+    _kpi_scores_view('kpi_scores_actief', 'kpi_parameters_actief'),
+]
+
+# Gemiddelde score per factuur (AVG ... GROUP BY factuur_id over kpi_scores),
+# zodat de dashboards niet alle kpi_scores rijen hoeven te lezen. De
+# schrijvers van kpi_scores vullen de tabel; elke andere wijziging van een
+# factuur zijn scores maakt het gemiddelde ongeldig.
+KPI_TOTAALSCORES = [
+    """
+    CREATE TABLE kpi_totaalscores (
+        factuur_id INTEGER PRIMARY KEY,
+        score REAL
+    )
+    """,
+    "INSERT INTO kpi_totaalscores (factuur_id, score) SELECT factuur_id, AVG(score) FROM kpi_scores GROUP BY factuur_id",
+] + [
+    f"""
+    CREATE TRIGGER kpi_totaalscores_kpi_scores_{actie.lower()}
+    AFTER {actie} ON kpi_scores
+    BEGIN
+        DELETE FROM kpi_totaalscores WHERE factuur_id = {rij}.factuur_id;
+    END
+    """
+    for actie, rij in (('INSERT', 'NEW'), ('DELETE', 'OLD'))
+]
+
+# Versie per factuur: elke wijziging van een facturen rij hoogt die op. De data
+# editor van de app vergelijkt bij het opslaan met de versie waarmee de rij
+# geladen is, zodat wijzigingen van anderen niet ongemerkt overschreven worden.
+# Een aparte tabel: een UPDATE op facturen zelf zou alle facturen triggers
+# nogmaals laten afgaan.
+FACTUUR_VERSIES = [
+    """
+    CREATE TABLE factuur_versies (
+        factuur_id INTEGER PRIMARY KEY,
+        versie INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER factuur_versies_update
+    AFTER UPDATE ON facturen
+    BEGIN
+        INSERT INTO factuur_versies (factuur_id, versie) VALUES (NEW.id, 1)
+        ON CONFLICT (factuur_id) DO UPDATE SET versie = versie + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER factuur_versies_delete
+    AFTER DELETE ON facturen
+    BEGIN
+        DELETE FROM factuur_versies WHERE factuur_id = OLD.id;
+    END
+    """,
+]
+
+# === Migraties ===
+# (versie, beschrijving, statements). Elke migratie draait precies één keer, in
+# één transactie. Wijzig nooit een toegepaste migratie maar voeg een nieuwe toe
+# (bijv. een extra index). Migratie 1 gebruikt IF NOT EXISTS, zodat databases
+# van vóór schema_version zonder verlies overgenomen worden.
+MIGRATIES = [
+    (1, "Basisschema: facturen, afwijkingen, KPI scores, maand_aggregaten en dataversie", BASISSCHEMA),
+    (2, "Afwijkingen in long-format (afwijking_tellingen) en de view kpi_scores_berekend", AFWIJKING_TELLINGEN),
+    (3, "Ritregels (ritten) als bron voor de rittentellingen van facturen", RITTEN),
+    (4, "Paren van dubbele ritten (dubbele_ritten)", DUBBELE_RITTEN),
+    (5, "Ritten zonder bestelling in het bestelsysteem (ontbrekende_bestellingen)", ONTBREKENDE_BESTELLINGEN),
+    (6, "Resultaten op ritniveau opruimen als ritten verwijderd worden", RITTEN_OPRUIMEN),
+    (7, "Parameters van de opgeslagen KPI scores (kpi_parameters_actief) en de view kpi_scores_actief", KPI_PARAMETERS_ACTIEF),
+    (8, "Gemiddelde KPI score per factuur (kpi_totaalscores)", KPI_TOTAALSCORES),
+    (9, "Versie per factuur voor de data editor (factuur_versies)", FACTUUR_VERSIES),
+]
+
+def zet_pragmas(conn):
+    """Zet de PRAGMAs die per verbinding gelden"""
+    for naam, waarde in PRAGMAS.items():
+        conn.execute(f"PRAGMA {naam} = {waarde}")
+
+def schema_versie(conn):
+    """Hoogste toegepaste migratie; 0 als er nog geen schema_version tabel is"""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(versie), 0) FROM schema_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+def migreer(conn):
+    """Pas de openstaande migraties in volgorde toe; geeft de toegepaste versies terug"""
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            versie INTEGER PRIMARY KEY,
+            beschrijving TEXT,
+            toegepast_op TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.commit()
+
+    toegepast = []
+    for versie, beschrijving, statements in MIGRATIES:
+        if versie <= schema_versie(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        # Een ander proces kan intussen dezelfde migratie toegepast hebben
+        if versie <= schema_versie(conn):
+            conn.rollback()
+            continue
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(
+            "INSERT INTO schema_version (versie, beschrijving) VALUES (?, ?)", (versie, beschrijving)
+        )
+        conn.commit()
+        toegepast.append(versie)
+    return toegepast
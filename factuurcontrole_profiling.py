@@ -0,0 +1,152 @@
+import cProfile
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+import streamlit as st
+
+# === Configuratie ===
+# Profiling staat aan met deze omgevingsvariabele of met ?profiling=1 in de URL
+PROFILING_ENV = "FACTUURCONTROLE_PROFILING"
+
+# Map voor cProfile dumps
+PROFIEL_MAP = Path("profielen")
+
+# Metingen per rerun; Streamlit draait elke sessie in een eigen thread
+_lokaal = threading.local()
+
+def is_actief():
+    """Worden er in deze rerun metingen verzameld?"""
+    return getattr(_lokaal, 'actief', False)
+
+def profiling_gevraagd():
+    """Profiling aangezet via de omgeving of de URL"""
+    return os.environ.get(PROFILING_ENV) == "1" or st.query_params.get("profiling") == "1"
+
+# === Metingen ===
+def _aantal_rijen(resultaat):
+    if isinstance(resultaat, tuple) and resultaat:
+        resultaat = resultaat[0]
+    if isinstance(resultaat, (pd.DataFrame, pd.Series, list)):
+        return len(resultaat)
+    return None
+
+@contextmanager
+def meet(stap, rijen=None, bytes_verstuurd=None):
+    """Meet de wandkloktijd van een blok; de meting (dict) kan in het blok aangevuld worden"""
+    if not is_actief():
+        yield {}
+        return
+    meting = {'stap': stap, 'rijen': rijen, 'bytes': bytes_verstuurd}
+    start = time.perf_counter()
+    try:
+        yield meting
+    finally:
+        meting['seconden'] = time.perf_counter() - start
+        _lokaal.metingen.append(meting)
+
+def geprofileerd(stap=None):
+    """Decorator: meet tijd en aantal rijen van het resultaat als profiling aan staat"""
+    def decorator(functie):
+        naam = stap or functie.__name__
+
+        @functools.wraps(functie)
+        def wrapper(*args, **kwargs):
+            if not is_actief():
+                return functie(*args, **kwargs)
+            with meet(naam) as meting:
+                resultaat = functie(*args, **kwargs)
+                meting['rijen'] = _aantal_rijen(resultaat)
+            return resultaat
+        return wrapper
+    return decorator
+
+def _plotly_chart_omvang(fig, *args, **kwargs):
+    """Rijen (punten in alle traces) en bytes van de figuur zoals Streamlit die verstuurt"""
+    rijen = sum(len(trace.x) for trace in fig.data if trace.x is not None)
+    return rijen, len(fig.to_json())
+
+def _dataframe_omvang(df, *args, **kwargs):
+    """Rijen en Arrow bytes van een st.dataframe"""
+    from streamlit.dataframe_util import convert_anything_to_arrow_bytes
+    data = getattr(df, 'data', df)  # Styler
+    return len(data), len(convert_anything_to_arrow_bytes(df))
+
+# Streamlit functies die gemeten worden, met hoe hun omvang bepaald wordt
+ST_FUNCTIES = {
+    'plotly_chart': _plotly_chart_omvang,
+    'dataframe': _dataframe_omvang,
+}
+
+class _ModuleProxy:
+    """Geeft de attributen van een module door; aanroepen worden gemeten als profiling aan staat"""
+
+    def __init__(self, module, prefix, functies=None):
+        self._module = module
+        self._prefix = prefix
+        self._functies = functies
+
+    def __getattr__(self, naam):
+        attribuut = getattr(self._module, naam)
+        if not is_actief() or not callable(attribuut):
+            return attribuut
+        if self._functies is not None and naam not in self._functies:
+            return attribuut
+        omvang = self._functies.get(naam) if self._functies else None
+
+        @functools.wraps(attribuut)
+        def gemeten(*args, **kwargs):
+            # Omvang buiten de tijdmeting bepalen: serialiseren kost zelf ook tijd
+            rijen, bytes_verstuurd = omvang(*args, **kwargs) if omvang else (None, None)
+            with meet(f"{self._prefix}.{naam}", rijen, bytes_verstuurd):
+                return attribuut(*args, **kwargs)
+        return gemeten
+
+def instrumenteer(module, prefix, functies=None):
+    """Proxy voor module (bijv. px, go of st); functies beperkt welke aanroepen gemeten worden"""
+    return _ModuleProxy(module, prefix, functies)
+
+# === Rerun ===
+@contextmanager
+def profiling_rerun():
+    """Verzamel de metingen van één rerun, optioneel met een cProfile dump naar schijf"""
+    _lokaal.actief = profiling_gevraagd()
+    _lokaal.metingen = []
+    _lokaal.dump = None
+    profiler = None
+    if _lokaal.actief and st.session_state.get("profiling_cprofile"):
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _lokaal.totaal = time.perf_counter() - start
+        if profiler is not None:
+            profiler.disable()
+            PROFIEL_MAP.mkdir(exist_ok=True)
+            _lokaal.dump = PROFIEL_MAP / f"rerun_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.prof"
+            profiler.dump_stats(_lokaal.dump)
+
+def toon_profiling_panel():
+    """Verborgen sidebar panel met de tijden van de huidige rerun"""
+    if not is_actief():
+        return
+    with st.sidebar.expander("⏱️ Profiling (deze rerun)", expanded=True):
+        st.caption(f"Totaal: {_lokaal.totaal * 1000:.0f} ms")
+        if _lokaal.metingen:
+            overzicht = pd.DataFrame(_lokaal.metingen).groupby('stap', sort=False).agg(
+                aanroepen=('seconden', 'size'),
+                ms=('seconden', 'sum'),
+                rijen=('rijen', lambda x: x.sum(min_count=1)),
+                bytes=('bytes', lambda x: x.sum(min_count=1))
+            ).sort_values('ms', ascending=False)
+            overzicht['ms'] = (overzicht['ms'] * 1000).round(1)
+            st.dataframe(overzicht, use_container_width=True)
+        st.checkbox("cProfile dump bij elke rerun", key="profiling_cprofile")
+        if _lokaal.dump is not None:
+            st.caption(f"cProfile: {_lokaal.dump}")
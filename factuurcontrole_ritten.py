@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Import van ritregels (de ritlijst bij een factuur) uit Excel (xlsx) of CSV.
+
+Leest het bestand in chunks met constant geheugengebruik, valideert elke
+chunk met kolomoperaties en schrijft de ritten per chunk in de tabel
+ritten, in één transactie voor het hele bestand. Elke rit hoort bij de factuur (jaar, maand, perceel, vervoerder)
+van zijn ritdatum; ontbrekende facturen worden aangemaakt. Na het inlezen
+worden ritten_besteld, ritten_uitgevoerd, ritten_geannuleerd, ritten_loos
+en routes van de geraakte facturen in SQL uit de ritten geteld en
+draaien de controles op ritniveau (dubbele ritten, stiptheid en reistijd).
+
+Een ritlijst vervangt de ritten die al bij dezelfde factuur stonden, zodat
+een bestand opnieuw importeren geen dubbele ritten oplevert.
+
+Gebruik:
+    python factuurcontrole_ritten.py ritten_2025_03.csv [--db factuurcontrole.db] [--chunk-size 50000]
+"""
+
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from factuurcontrole_db import DB_FILE, init_db, connect, refresh_kpi_scores
+from factuurcontrole_dubbel import controleer_dubbele_ritten
+from factuurcontrole_stiptheid import controleer_stiptheid_reistijd
+from factuurcontrole_import import lees_chunks, normaliseer_kolomnaam
+
+# === Configuratie ===
+CHUNK_SIZE = 50_000
+
+SLEUTEL = ["jaar", "maand", "perceel", "vervoerder"]
+
+RIT_KOLOMMEN = [
+    "factuur_id", "ritnummer", "datum", "status", "route", "klant", "herkomst", "bestemming",
+    "gepland_ophalen", "werkelijk_ophalen", "gepland_aankomst", "werkelijk_aankomst",
+    "directe_reistijd"
+]
+TEKST_KOLOMMEN = ["ritnummer", "route", "klant", "herkomst", "bestemming"]
+TIJDSTIP_KOLOMMEN = ["gepland_ophalen", "werkelijk_ophalen", "gepland_aankomst", "werkelijk_aankomst"]
+
+# Kolomnamen (genormaliseerd) in de ritlijsten van vervoerders -> kolom in ritten
+KOLOM_ALIASSEN = {
+    "ritdatum": "datum",
+    "rit_id": "ritnummer",
+    "ritnr": "ritnummer",
+    "ritstatus": "status",
+    "routenummer": "route",
+    "klantnummer": "klant",
+    "reiziger": "klant",
+    "vertrekadres": "herkomst",
+    "ophaaladres": "herkomst",
+    "aankomstadres": "bestemming",
+    "bestemmingsadres": "bestemming",
+    "geplande_ophaaltijd": "gepland_ophalen",
+    "werkelijke_ophaaltijd": "werkelijk_ophalen",
+    "geplande_aankomsttijd": "gepland_aankomst",
+    "werkelijke_aankomsttijd": "werkelijk_aankomst",
+    "directe_reistijd_min": "directe_reistijd",
+}
+
+# Statuswaarden (genormaliseerd) -> status in ritten; een lege status telt als uitgevoerd
+STATUS_ALIASSEN = {
+    "uitgevoerd": "uitgevoerd",
+    "gereden": "uitgevoerd",
+    "geannuleerd": "geannuleerd",
+    "annulering": "geannuleerd",
+    "loos": "loos",
+    "loze_rit": "loos",
+    "loos_gemeld": "loos",
+}
+
+# === Validatie ===
+def lees_datum_tijd(tekst):
+    """Tekst -> datetime64: ISO (2025-03-01 07:05) of Nederlandse volgorde (01-03-2025 07:05)"""
+    iso = tekst.str.match(r"\d{4}-").fillna(False)
+    if iso.all():
+        return pd.to_datetime(tekst, errors="coerce", format="ISO8601")
+    return pd.to_datetime(tekst.where(iso), errors="coerce", format="ISO8601").where(
+        iso, pd.to_datetime(tekst.where(~iso), errors="coerce", dayfirst=True)
+    )
+
+def _tijdstippen(waarden, datum):
+    """Tijdstippen als datetime64; alleen een tijd (07:05) valt op de ritdatum"""
+    tekst = waarden.astype("string").str.strip()
+    alleen_tijd = tekst.str.fullmatch(r"\d{1,2}:\d{2}(:\d{2})?").fillna(False)
+    if not alleen_tijd.any():
+        return lees_datum_tijd(tekst)
+    tijd = tekst.where(alleen_tijd)
+    tijd = datum + pd.to_timedelta(tijd.where(tijd.str.count(":") == 2, tijd + ":00"), errors="coerce")
+    if alleen_tijd.all():
+        return tijd
+    return lees_datum_tijd(tekst.where(~alleen_tijd)).where(~alleen_tijd, tijd)
+
+def _iso(waarden, eenheid):
+    """datetime64 kolom -> ISO tekst (None voor ontbrekend), zonder Python lus per rij"""
+    tekst = np.datetime_as_string(waarden.to_numpy(dtype=f"datetime64[{eenheid}]"), unit=eenheid)
+    return pd.Series(tekst, index=waarden.index, dtype=object).where(waarden.notna(), None)
+
+def valideer_ritten(chunk, eerste_rij):
+    """Valideer een chunk ritregels met kolomoperaties.
+
+    eerste_rij is het rijnummer in het bestand van de eerste rij in de chunk
+    (de kopregel is rij 1). Geeft (geldig, afgewezen) terug: geldig bevat de
+    sleutelkolommen van de factuur plus de kolommen van ritten (behalve
+    factuur_id), afgewezen de kolommen 'rij' en 'reden'.
+    """
+    chunk = chunk.copy()
+    chunk.columns = [normaliseer_kolomnaam(k) for k in chunk.columns]
+    chunk = chunk.rename(columns={k: v for k, v in KOLOM_ALIASSEN.items() if v not in chunk.columns})
+    chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+    rijnummers = pd.Series(np.arange(eerste_rij, eerste_rij + len(chunk)), index=chunk.index)
+
+    # Volledig lege rijen (bijv. onderaan een spreadsheet) overslaan
+    leeg = chunk.isna() | chunk.astype(str).apply(lambda kolom: kolom.str.strip() == "")
+    chunk = chunk[~leeg.all(axis=1)]
+    rijnummers = rijnummers[chunk.index]
+
+    redenen = pd.Series("", index=chunk.index)
+
+    def afwijzen(masker, reden):
+        redenen[masker & (redenen == "")] = reden
+
+    for kolom in ["datum", "perceel", "vervoerder"]:
+        if kolom not in chunk.columns:
+            afwijzen(pd.Series(True, index=chunk.index), f"kolom '{kolom}' ontbreekt")
+            chunk[kolom] = np.nan
+    for kolom in TEKST_KOLOMMEN + TIJDSTIP_KOLOMMEN + ["status", "directe_reistijd"]:
+        if kolom not in chunk.columns:
+            chunk[kolom] = np.nan
+
+    datum = lees_datum_tijd(chunk["datum"].astype("string").str.strip()).dt.normalize()
+    afwijzen(datum.isna() | ~datum.dt.year.between(2000, 2100), "ongeldige datum")
+
+    perceel = pd.to_numeric(chunk["perceel"], errors="coerce")
+    afwijzen(perceel.isna() | (perceel <= 0) | (perceel != np.floor(perceel)), "ongeldig perceel")
+    vervoerder = chunk["vervoerder"].astype("string").str.strip()
+    afwijzen(vervoerder.isna() | (vervoerder == ""), "vervoerder ontbreekt")
+
+    status = chunk["status"].astype("string").str.strip().str.lower().str.replace(r"[^0-9a-z]+", "_", regex=True)
+    status = status.map(STATUS_ALIASSEN, na_action="ignore").where(status.notna() & (status != ""), "uitgevoerd")
+    afwijzen(status.isna(), "onbekende status")
+
+    tijdstippen = {}
+    for kolom in TIJDSTIP_KOLOMMEN:
+        tijdstippen[kolom] = _tijdstippen(chunk[kolom], datum)
+        afwijzen(chunk[kolom].notna() & tijdstippen[kolom].isna(), f"'{kolom}' is geen tijdstip")
+
+    reistijd = pd.to_numeric(
+        chunk["directe_reistijd"].astype("string").str.strip().str.replace(",", ".", regex=False),
+        errors="coerce"
+    )
+    afwijzen(chunk["directe_reistijd"].notna() & reistijd.isna(), "'directe_reistijd' is geen getal")
+    afwijzen(reistijd < 0, "'directe_reistijd' is negatief")
+
+    geldig_masker = redenen == ""
+    geldig = pd.DataFrame({
+        "jaar": datum.dt.year,
+        "maand": datum.dt.month,
+        "perceel": perceel,
+        "vervoerder": vervoerder.astype(object),
+    })[geldig_masker].astype({"jaar": "int64", "maand": "int64", "perceel": "int64"})
+    geldig["datum"] = _iso(datum[geldig_masker], "D")
+    geldig["status"] = status[geldig_masker].astype(object)
+    for kolom in TEKST_KOLOMMEN:
+        tekst = chunk.loc[geldig_masker, kolom].astype("string").str.strip()
+        geldig[kolom] = tekst.astype(object).where(tekst.notna() & (tekst != ""), None)
+    for kolom in TIJDSTIP_KOLOMMEN:
+        geldig[kolom] = _iso(tijdstippen[kolom][geldig_masker], "s")
+    geldig["directe_reistijd"] = reistijd[geldig_masker].astype(object).where(reistijd[geldig_masker].notna(), None)
+    geldig["rij"] = rijnummers[geldig_masker]
+
+    afgewezen = pd.DataFrame({
+        "rij": rijnummers[~geldig_masker],
+        "reden": redenen[~geldig_masker]
+    })
+    return geldig, afgewezen
+
+# === Facturen ===
+def _factuur_ids(conn, sleutels, bekend, aangemaakt):
+    """Vul bekend (sleutel -> factuur id) aan; ontbrekende facturen worden met nullen aangemaakt.
+
+    Aangemaakte facturen zijn nog niet afgestemd (controle_bestelling_sw
+    NULL); hun ids komen ook in aangemaakt. Geeft de ids terug die in deze
+    aanroep voor het eerst gezien zijn.
+    """
+    nieuw = []
+    for sleutel in sleutels:
+        if sleutel in bekend:
+            continue
+        factuur_id = conn.execute(
+            "SELECT MIN(id) FROM facturen WHERE jaar = ? AND maand = ? AND perceel = ? AND vervoerder = ?",
+            sleutel
+        ).fetchone()[0]
+        if factuur_id is None:
+            factuur_id = conn.execute("""
+                INSERT INTO facturen (jaar, maand, perceel, vervoerder, vaste_kosten, variabele_kosten,
+                ritten_besteld, ritten_geannuleerd, ritten_loos, ritten_uitgevoerd, routes)
+                VALUES (?, ?, ?, ?, 0, 0, 0, 0, 0, 0, 0)
+            """, sleutel).lastrowid
+            # Nog niet afgestemd: geen aantal, ook niet de 0 van de trigger
+            conn.execute("UPDATE afwijkingen SET controle_bestelling_sw = NULL WHERE factuur_id = ?", (factuur_id,))
+            aangemaakt.append(factuur_id)
+        bekend[sleutel] = factuur_id
+        nieuw.append(factuur_id)
+    return nieuw
+
+def tel_ritten(conn, factuur_ids):
+    """Leid de ritten- en routetellingen van facturen af uit hun ritten.
+
+    Alleen gewijzigde facturen worden bijgewerkt (de triggers op facturen
+    doen de rest). Geannuleerde ritten tellen niet mee voor routes.
+    Commit niet; geeft het aantal bijgewerkte facturen terug.
+    """
+    bijgewerkt = 0
+    factuur_ids = sorted(int(i) for i in factuur_ids)
+    for start in range(0, len(factuur_ids), 500):
+        chunk = factuur_ids[start:start + 500]
+        conn.execute(f"""
+            UPDATE facturen SET
+                ritten_besteld = t.besteld,
+                ritten_uitgevoerd = t.uitgevoerd,
+                ritten_geannuleerd = t.geannuleerd,
+                ritten_loos = t.loos,
+                routes = t.routes
+            FROM (
+                SELECT factuur_id,
+                       COUNT(*) AS besteld,
+                       SUM(status = 'uitgevoerd') AS uitgevoerd,
+                       SUM(status = 'geannuleerd') AS geannuleerd,
+                       SUM(status = 'loos') AS loos,
+                       COUNT(DISTINCT CASE WHEN status != 'geannuleerd' THEN route END) AS routes
+                FROM ritten
+                WHERE factuur_id IN ({','.join('?' * len(chunk))})
+                GROUP BY factuur_id
+            ) t
+            WHERE facturen.id = t.factuur_id
+              AND (facturen.ritten_besteld IS NOT t.besteld
+                   OR facturen.ritten_uitgevoerd IS NOT t.uitgevoerd
+                   OR facturen.ritten_geannuleerd IS NOT t.geannuleerd
+                   OR facturen.ritten_loos IS NOT t.loos
+                   OR facturen.routes IS NOT t.routes)
+        """, chunk)
+        bijgewerkt += conn.execute("SELECT changes()").fetchone()[0]
+    return bijgewerkt
+
+def reset_afstemming(conn, factuur_ids):
+    """Laat de afstemming met het bestelsysteem vervallen voor facturen die een nieuwe ritlijst krijgen.
+
+    Aanroepen vóór het verwijderen van de oude ritten: alleen facturen met
+    een afstemmingsresultaat (een aantal in controle_bestelling_sw of
+    ontbrekende_bestellingen) vervallen, en de trigger op ritten ruimt die
+    ontbrekende_bestellingen op. controle_bestelling_sw blijft NULL tot de
+    volgende afstemming. Commit niet; geeft de ids van de vervallen facturen
+    terug.
+    """
+    gereset = []
+    factuur_ids = sorted(int(i) for i in factuur_ids)
+    for start in range(0, len(factuur_ids), 500):
+        chunk = factuur_ids[start:start + 500]
+        gereset += [rij[0] for rij in conn.execute(f"""
+            UPDATE afwijkingen SET controle_bestelling_sw = NULL
+            WHERE factuur_id IN ({','.join('?' * len(chunk))})
+              AND (controle_bestelling_sw IS NOT NULL
+                   OR EXISTS (SELECT 1 FROM ontbrekende_bestellingen o WHERE o.factuur_id = afwijkingen.factuur_id))
+            RETURNING factuur_id
+        """, chunk)]
+    return sorted(gereset)
+
+# === Import ===
+def importeer_ritten(bron, db_file=DB_FILE, chunk_size=CHUNK_SIZE, bestandstype=None, blad=None):
+    """Importeer ritregels uit een xlsx- of csv-bestand en werk de tellingen van de facturen bij.
+
+    Het bestand wordt in chunks gelezen maar in één transactie geschreven:
+    het vervangen van de ritten, de tellingen, de controles en de KPI
+    scores worden samen vastgelegd, of bij een fout samen teruggedraaid. Geeft
+    een dict terug met 'gelezen', 'geimporteerd', 'facturen' (geraakte
+    factuur ids), 'nieuwe_facturen' (voor de ritten aangemaakte facturen),
+    'opnieuw_afstemmen' (bestaande facturen waarvan de afstemming met het
+    bestelsysteem vervallen is) en 'afgewezen' (DataFrame met rij en reden).
+    """
+    init_db(db_file)
+    gelezen, geimporteerd = 0, 0
+    afgewezen_delen = []
+    # Alleen de sleutels en ids van facturen blijven over chunks heen in het geheugen
+    bekend = {}
+    geraakt = []
+    aangemaakt = []
+    opnieuw_afstemmen = []
+
+    with connect(db_file) as conn:
+        # Direct de schrijflock: ritten en tellingen mogen nooit uit de pas lopen
+        conn.execute("BEGIN IMMEDIATE")
+        eerste_rij = 2
+        for chunk in lees_chunks(bron, chunk_size, bestandstype, blad):
+            gelezen += len(chunk)
+            geldig, afgewezen = valideer_ritten(chunk, eerste_rij)
+            eerste_rij += len(chunk)
+            afgewezen_delen.append(afgewezen)
+            if geldig.empty:
+                continue
+
+            sleutels = pd.MultiIndex.from_frame(geldig[SLEUTEL])
+            nieuw = _factuur_ids(conn, sleutels.unique(), bekend, aangemaakt)
+            # Nieuwe facturen zijn nooit afgestemd; van bestaande vervalt de afstemming
+            # vóór het verwijderen, want daarna zijn de ontbrekende_bestellingen weg
+            opnieuw_afstemmen += reset_afstemming(conn, set(nieuw).difference(aangemaakt))
+            # De ritlijst vervangt eerder ingelezen ritten van dezelfde factuur
+            for start in range(0, len(nieuw), 500):
+                ids = nieuw[start:start + 500]
+                conn.execute(f"DELETE FROM ritten WHERE factuur_id IN ({','.join('?' * len(ids))})", ids)
+            geraakt.extend(nieuw)
+
+            geldig["factuur_id"] = sleutels.map(bekend.__getitem__).to_numpy(dtype="int64")
+            conn.executemany(f"""
+                INSERT INTO ritten ({', '.join(RIT_KOLOMMEN)})
+                VALUES ({', '.join('?' * len(RIT_KOLOMMEN))})
+            """, geldig[RIT_KOLOMMEN].astype({"factuur_id": object}).itertuples(index=False, name=None))
+            geimporteerd += len(geldig)
+
+        tel_ritten(conn, geraakt)
+        refresh_kpi_scores(conn, geraakt)
+        # Controles op ritniveau voor de maanden van de geraakte facturen; de volgende
+        # maand ook, want daar kunnen paren naar ritten rond de maandgrens verwijzen
+        maanden = {int(jaar) * 12 + int(maand) - 1 for jaar, maand, _, _ in bekend}
+        controleer_dubbele_ritten(conn, [(m // 12, m % 12 + 1) for m in sorted(maanden | {m + 1 for m in maanden})])
+        controleer_stiptheid_reistijd(conn, geraakt)
+        conn.commit()
+
+    afgewezen = (pd.concat(afgewezen_delen, ignore_index=True).sort_values("rij").reset_index(drop=True)
+                 if afgewezen_delen else pd.DataFrame(columns=["rij", "reden"]))
+    return {"gelezen": gelezen, "geimporteerd": geimporteerd, "facturen": sorted(geraakt),
+            "nieuwe_facturen": sorted(aangemaakt), "opnieuw_afstemmen": sorted(opnieuw_afstemmen),
+            "afgewezen": afgewezen}
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importeer ritregels uit een xlsx- of csv-bestand")
+    parser.add_argument("bestand", help="Pad naar het xlsx- of csv-bestand")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database (standaard: %(default)s)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rijen per chunk")
+    parser.add_argument("--blad", help="Naam van het werkblad (xlsx, standaard het eerste)")
+    parser.add_argument("--afgewezen", help="Schrijf afgewezen rijen naar dit csv-bestand")
+    args = parser.parse_args(argv)
+
+    resultaat = importeer_ritten(args.bestand, args.db, args.chunk_size, blad=args.blad)
+    afgewezen = resultaat["afgewezen"]
+    print(f"🚐 {resultaat['gelezen']} rijen gelezen, {resultaat['geimporteerd']} ritten geïmporteerd "
+          f"voor {len(resultaat['facturen'])} facturen, {len(afgewezen)} afgewezen")
+    if resultaat["nieuwe_facturen"]:
+        print(f"🆕 {len(resultaat['nieuwe_facturen'])} facturen aangemaakt voor ritten zonder factuur; "
+              f"vul de kosten aan en stem ze af met factuurcontrole_afstemming")
+    if resultaat["opnieuw_afstemmen"]:
+        print(f"🔎 Afstemming met het bestelsysteem vervallen voor {len(resultaat['opnieuw_afstemmen'])} facturen; "
+              f"draai factuurcontrole_afstemming opnieuw")
+    if not afgewezen.empty:
+        if args.afgewezen:
+            afgewezen.to_csv(args.afgewezen, index=False)
+            print(f"❌ Afgewezen rijen geschreven naar {args.afgewezen}")
+        else:
+            print(afgewezen.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
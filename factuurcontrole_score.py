@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Headless KPI scoring van facturen, zonder Streamlit.
+
+Leest facturen in chunks uit de database, berekent de KPI scores en schrijft
+ze naar CSV of Parquet. Met --processen wordt het werk per (perceel, jaar)
+over een process pool verdeeld. --uitvoer db vernieuwt de kpi_scores tabel
+in SQL, met de view kpi_scores_actief die ook de app gebruikt.
+
+Gebruik:
+    python factuurcontrole_score.py --uitvoer scores.csv
+    python factuurcontrole_score.py --uitvoer scores.parquet --processen 8
+    python factuurcontrole_score.py --uitvoer db
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from factuurcontrole_db import (
+    DB_FILE, FACTUUR_QUERY, init_db, connect, connect_readonly, filter_clause, bump_data_version,
+    refresh_kpi_scores
+)
+from factuurcontrole_kpi import calculate_kpi_scores_batch, overall_status
+
+# === Configuratie ===
+CHUNK_SIZE = 10_000
+
+# Kolommen en types van de uitvoer, per niveau
+UITVOER_KOLOMMEN = {
+    'afwijking': {
+        'factuur_id': 'int64', 'jaar': 'Int64', 'maand': 'Int64', 'perceel': 'Int64',
+        'vervoerder': 'string', 'afwijking': 'string', 'naam': 'string', 'aantal': 'float64',
+        'basis': 'float64', 'percentage': 'float64', 'doel': 'float64', 'status': 'string',
+        'score': 'float64'
+    },
+    'factuur': {
+        'factuur_id': 'int64', 'jaar': 'Int64', 'maand': 'Int64', 'perceel': 'Int64',
+        'vervoerder': 'string', 'score': 'float64', 'status': 'string'
+    }
+}
+
+# === Scoren ===
+def score_chunk(data, kpi_params, niveau='afwijking'):
+    """Scoor een chunk facturen en geef de uitvoerrijen terug"""
+    kpi_df, overall_scores = calculate_kpi_scores_batch(data, kpi_params)
+    dimensies = data[['id', 'jaar', 'maand', 'perceel', 'vervoerder']].rename(columns={'id': 'factuur_id'})
+
+    if niveau == 'factuur':
+        uitvoer = dimensies.assign(score=overall_scores, status=overall_status(overall_scores))
+    else:
+        uitvoer = dimensies.merge(kpi_df.drop(columns=['index']), on='factuur_id', how='inner')
+    return uitvoer[list(UITVOER_KOLOMMEN[niveau])].astype(UITVOER_KOLOMMEN[niveau])
+
+def lees_facturen(conn, where="", params=(), chunk_size=CHUNK_SIZE):
+    """Lees facturen (met afwijkingen) in chunks"""
+    return pd.read_sql_query(FACTUUR_QUERY + where + " ORDER BY f.id", conn,
+                             params=list(params), chunksize=chunk_size)
+
+def score_facturen(db_file=DB_FILE, where="", params=(), chunk_size=CHUNK_SIZE, niveau='afwijking'):
+    """Scoor alle facturen die aan de WHERE clause voldoen; levert de uitvoer per chunk"""
+    with connect_readonly(db_file) as conn:
+        kpi_params = pd.read_sql_query("SELECT * FROM kpi_parameters", conn)
+        for data in lees_facturen(conn, where, params, chunk_size):
+            yield score_chunk(data, kpi_params, niveau)
+
+def _score_partitie(taak):
+    """Worker: scoor één (perceel, jaar) partitie; moet op moduleniveau staan voor pickling"""
+    db_file, perceel, jaar, chunk_size, niveau = taak
+    # IS in plaats van = zodat ook facturen zonder perceel of jaar gescoord worden
+    delen = list(score_facturen(db_file, " WHERE f.perceel IS ? AND f.jaar IS ?",
+                                (perceel, jaar), chunk_size, niveau))
+    return pd.concat(delen, ignore_index=True) if delen else None
+
+def score_facturen_parallel(db_file=DB_FILE, processen=None, chunk_size=CHUNK_SIZE, niveau='afwijking'):
+    """Scoor alle facturen met een process pool, één taak per (perceel, jaar)"""
+    with connect_readonly(db_file) as conn:
+        partities = conn.execute("""
+            SELECT DISTINCT perceel, jaar FROM facturen ORDER BY jaar, perceel
+        """).fetchall()
+    taken = [(db_file, perceel, jaar, chunk_size, niveau) for perceel, jaar in partities]
+    with ProcessPoolExecutor(max_workers=processen) as executor:
+        for resultaat in executor.map(_score_partitie, taken):
+            if resultaat is not None:
+                yield resultaat
+
+# === Uitvoer ===
+def vernieuw_scores_db(db_file=DB_FILE, where="", params=(), chunk_size=CHUNK_SIZE):
+    """Vernieuw kpi_scores voor de facturen die aan de WHERE clause voldoen.
+
+    De scores komen uit de view kpi_scores_actief (refresh_kpi_scores),
+    niet uit de batchberekening: zo zijn ze gelijk aan wat de app schrijft,
+    ook voor controletypes die alleen in kpi_parameters staan. Eén
+    transactie per chunk facturen. Geeft het aantal geschreven rijen terug.
+    """
+    aantal = 0
+    with connect(db_file) as conn:
+        factuur_ids = [rij[0] for rij in conn.execute(f"SELECT f.id FROM facturen f{where} ORDER BY f.id", params)]
+        for start in range(0, len(factuur_ids), chunk_size):
+            aantal += refresh_kpi_scores(conn, factuur_ids[start:start + chunk_size])
+            # kpi_scores heeft geen triggers: laat de dashboards opnieuw laden
+            bump_data_version(conn)
+            conn.commit()
+    return aantal
+
+def schrijf_scores(chunks, uitvoer):
+    """Schrijf de gescoorde chunks naar een .csv of .parquet bestand.
+
+    Geeft het aantal geschreven rijen terug.
+    """
+    aantal = 0
+    if uitvoer.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in chunks:
+                tabel = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(uitvoer, tabel.schema, compression='zstd')
+                writer.write_table(tabel)
+                aantal += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return aantal
+
+    with open(uitvoer, 'w', encoding='utf-8', newline='') as f:
+        for nummer, chunk in enumerate(chunks):
+            chunk.to_csv(f, header=nummer == 0, index=False)
+            aantal += len(chunk)
+    return aantal
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bereken KPI scores voor alle facturen")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database (standaard: %(default)s)")
+    parser.add_argument("--uitvoer", default="kpi_scores.csv",
+                        help="Bestand (.csv of .parquet) of 'db' voor de kpi_scores tabel")
+    parser.add_argument("--niveau", choices=["afwijking", "factuur"], default="afwijking",
+                        help="Eén rij per factuur x afwijking, of per factuur met totaalscore")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Facturen per chunk")
+    parser.add_argument("--processen", type=int, default=1,
+                        help="Aantal processen; >1 verdeelt het werk per perceel en jaar")
+    parser.add_argument("--jaar", type=int, nargs="*", help="Alleen deze jaren (alleen met 1 proces)")
+    parser.add_argument("--perceel", type=int, nargs="*", help="Alleen deze percelen (alleen met 1 proces)")
+    args = parser.parse_args(argv)
+
+    if args.uitvoer == 'db' and args.niveau != 'afwijking':
+        parser.error("--uitvoer db vereist --niveau afwijking")
+    if args.uitvoer == 'db' and args.processen > 1:
+        parser.error("--uitvoer db rekent in SQLite en kan niet gecombineerd worden met --processen")
+    if args.processen > 1 and (args.jaar or args.perceel):
+        parser.error("--jaar/--perceel kunnen niet gecombineerd worden met --processen")
+
+    init_db(args.db)
+    start = time.perf_counter()
+    where, params = filter_clause({'jaar': args.jaar, 'perceel': args.perceel})
+    if args.uitvoer == 'db':
+        aantal = vernieuw_scores_db(args.db, where, params, args.chunk_size)
+    elif args.processen > 1:
+        aantal = schrijf_scores(score_facturen_parallel(args.db, args.processen, args.chunk_size, args.niveau),
+                                args.uitvoer)
+    else:
+        aantal = schrijf_scores(score_facturen(args.db, where, params, args.chunk_size, args.niveau), args.uitvoer)
+    duur = time.perf_counter() - start
+
+    print(f"✅ {aantal} rijen geschreven naar {args.uitvoer} in {duur:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Automatische controles "stiptheid" en "overschrijden reistijd" op de ritregels.
+
+Per uitgevoerde rit:
+- te laat opgehaald: werkelijk_ophalen ligt meer dan TE_LAAT_MINUTEN na
+  gepland_ophalen;
+- reistijd overschreden: werkelijk_aankomst - werkelijk_ophalen is langer
+  dan de toegestane reistijd, REISTIJD_FACTOR x directe_reistijd maar
+  minstens directe_reistijd + REISTIJD_MARGE_MINUTEN.
+Ritten zonder de benodigde tijden tellen niet mee.
+
+De berekening is volledig gevectoriseerd (NumPy datetime64, geen Python
+per rit) en leest de ritten in chunks; de aantallen per factuur komen in
+afwijkingen.controle_stiptheid en afwijkingen.controle_reistijd.
+
+Gebruik:
+    python factuurcontrole_stiptheid.py [--db factuurcontrole.db] [--factuur 123] [--te-laat 15]
+"""
+
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from factuurcontrole_db import DB_FILE, init_db, connect, refresh_kpi_scores
+
+# === Configuratie ===
+# Contracttoleranties
+TE_LAAT_MINUTEN = 15
+REISTIJD_FACTOR = 1.5
+REISTIJD_MARGE_MINUTEN = 15
+
+# Ritten per chunk bij het lezen uit de database
+CHUNK_SIZE = 250_000
+
+RITTEN_QUERY = """
+    SELECT factuur_id, gepland_ophalen, werkelijk_ophalen, werkelijk_aankomst, directe_reistijd
+    FROM ritten
+    WHERE status = 'uitgevoerd'
+"""
+
+# === Berekening ===
+def _tijden(waarden):
+    """ISO tekst -> datetime64[s] array (NaT voor ontbrekend)"""
+    return pd.to_datetime(waarden, format="ISO8601").to_numpy(dtype="datetime64[s]")
+
+def tel_stiptheid_reistijd(ritten, te_laat=TE_LAAT_MINUTEN, reistijd_factor=REISTIJD_FACTOR,
+                           reistijd_marge=REISTIJD_MARGE_MINUTEN):
+    """Tel te late ritten en reistijdoverschrijdingen per factuur.
+
+    ritten heeft de kolommen van RITTEN_QUERY. Geeft een DataFrame met
+    index factuur_id en de kolommen controle_stiptheid en controle_reistijd.
+    """
+    minuut = np.timedelta64(60, "s")
+    ophalen = _tijden(ritten["werkelijk_ophalen"])
+    # NaT in een verschil wordt NaN, en NaN > x is False: ontbrekende tijden tellen niet mee
+    vertraging = (ophalen - _tijden(ritten["gepland_ophalen"])) / minuut
+    reistijd = (_tijden(ritten["werkelijk_aankomst"]) - ophalen) / minuut
+    direct = ritten["directe_reistijd"].to_numpy(dtype=float, na_value=np.nan)
+    toegestaan = np.maximum(direct * reistijd_factor, direct + reistijd_marge)
+
+    codes, factuur_ids = pd.factorize(ritten["factuur_id"])
+    return pd.DataFrame({
+        "controle_stiptheid": np.bincount(codes, weights=vertraging > te_laat, minlength=len(factuur_ids)),
+        "controle_reistijd": np.bincount(codes, weights=reistijd > toegestaan, minlength=len(factuur_ids)),
+    }, index=pd.Index(factuur_ids, name="factuur_id")).astype("int64")
+
+def controleer_stiptheid_reistijd(conn, factuur_ids=None, te_laat=TE_LAAT_MINUTEN,
+                                  reistijd_factor=REISTIJD_FACTOR, reistijd_marge=REISTIJD_MARGE_MINUTEN,
+                                  chunk_size=CHUNK_SIZE):
+    """Bereken stiptheid en reistijd uit de ritten en schrijf de aantallen in afwijkingen.
+
+    factuur_ids beperkt de herberekening (bijv. één factuur waarvan de
+    ritten gewijzigd zijn); None = alle facturen met ritten. Facturen
+    zonder ritlijst houden hun handmatig ingevoerde aantallen. Commit niet;
+    geeft het aantal bijgewerkte facturen terug.
+    """
+    if factuur_ids is None:
+        delen = [(RITTEN_QUERY, ())]
+        scope = [rij[0] for rij in conn.execute("SELECT DISTINCT factuur_id FROM ritten")]
+    else:
+        factuur_ids = [int(i) for i in factuur_ids]
+        delen = [
+            (RITTEN_QUERY + f" AND factuur_id IN ({','.join('?' * len(chunk))})", chunk)
+            for chunk in (factuur_ids[start:start + 500] for start in range(0, len(factuur_ids), 500))
+        ]
+        scope = [rij[0] for query, chunk in delen for rij in conn.execute(
+            f"SELECT DISTINCT factuur_id FROM ritten WHERE factuur_id IN ({','.join('?' * len(chunk))})", chunk
+        )]
+    if not scope:
+        return 0
+
+    # Aantallen zijn optelbaar: een factuur mag over meerdere chunks verdeeld zijn
+    totaal = pd.DataFrame(0, index=pd.Index(scope, name="factuur_id"),
+                          columns=["controle_stiptheid", "controle_reistijd"])
+    for query, params in delen:
+        for ritten in pd.read_sql_query(query, conn, params=params, chunksize=chunk_size):
+            aantallen = tel_stiptheid_reistijd(ritten, te_laat, reistijd_factor, reistijd_marge)
+            totaal = totaal.add(aantallen, fill_value=0)
+    totaal = totaal.astype("int64")
+
+    # Alleen echte wijzigingen schrijven: elke update zet de KPI triggers in gang
+    cursor = conn.executemany("""
+        UPDATE afwijkingen SET controle_stiptheid = ?, controle_reistijd = ?
+        WHERE factuur_id = ? AND (controle_stiptheid IS NOT ? OR controle_reistijd IS NOT ?)
+    """, ((s, r, i, s, r) for i, s, r in totaal.itertuples(name=None)))
+    refresh_kpi_scores(conn, scope)
+    return cursor.rowcount
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bereken stiptheid en reistijdoverschrijdingen uit de ritten")
+    parser.add_argument("--db", default=DB_FILE, help="SQLite database (standaard: %(default)s)")
+    parser.add_argument("--factuur", type=int, action="append", help="Factuur id (herhaalbaar, standaard alle)")
+    parser.add_argument("--te-laat", type=float, default=TE_LAAT_MINUTEN,
+                        help="Minuten na de geplande ophaaltijd (standaard: %(default)s)")
+    parser.add_argument("--reistijd-factor", type=float, default=REISTIJD_FACTOR,
+                        help="Toegestane reistijd als factor van de directe reistijd (standaard: %(default)s)")
+    parser.add_argument("--reistijd-marge", type=float, default=REISTIJD_MARGE_MINUTEN,
+                        help="Minimale marge op de directe reistijd in minuten (standaard: %(default)s)")
+    args = parser.parse_args(argv)
+
+    init_db(args.db)
+    with connect(args.db) as conn:
+        bijgewerkt = controleer_stiptheid_reistijd(
+            conn, args.factuur, args.te_laat, args.reistijd_factor, args.reistijd_marge
+        )
+        conn.commit()
+    print(f"⏱️ Stiptheid en reistijd bijgewerkt voor {bijgewerkt} facturen")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
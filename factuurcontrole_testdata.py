@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Genereer een synthetische factuurcontrole database voor performancemetingen.
+
+Vult facturen, afwijkingen en kpi_parameters met realistische verdelingen
+(vervoerders per perceel, ritten per perceel, afwijkingen rond de norm) en
+bouwt daarna indexen, maandtotalen en KPI scores op via init_db.
+
+Gebruik:
+    python factuurcontrole_testdata.py testdata_100k.db --facturen 100000
+    python factuurcontrole_testdata.py testdata_1m.db --facturen 1000000 --percelen 60 --vervoerders 40
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+import numpy as np
+from factuurcontrole_db import init_db
+from factuurcontrole_migraties import TABELLEN
+from factuurcontrole_kpi import AFWIJKING_TYPES, BASIS_KOLOMMEN
+
+# === Configuratie ===
+CHUNK_SIZE = 100_000
+
+# Vervoerders die per perceel rijden
+VERVOERDERS_PER_PERCEEL = 4
+
+# afwijking_type -> (norm percentage, berekeningsgrondslag)
+KPI_PARAMETERS = {
+    'controle_bestelling_sw': (5.0, "Ritten besteld"),
+    'controle_gegevens_levering': (3.0, "Ritten uitgevoerd"),
+    'controle_stiptheid': (2.0, "Ritten uitgevoerd"),
+    'controle_indicaties': (1.5, "Ritten besteld"),
+    'controle_reistijd': (2.5, "Ritten uitgevoerd"),
+    'controle_dubbel_factuur': (1.0, "Ritten uitgevoerd"),
+    'controle_lege_routes': (0.5, "Routes"),
+    'controle_afwezig_melding': (1.0, "Ritten uitgevoerd")
+}
+
+FACTUUR_KOLOMMEN = [
+    'id', 'jaar', 'maand', 'perceel', 'vervoerder', 'vaste_kosten', 'variabele_kosten',
+    'ritten_besteld', 'ritten_geannuleerd', 'ritten_loos', 'ritten_uitgevoerd', 'routes'
+]
+
+# === Generator ===
+def genereer_chunk(rng, start_id, aantal, profiel, van_jaar, jaren):
+    """Genereer facturen en afwijkingen voor één chunk als dicts kolom -> array"""
+    perceel_index = rng.integers(0, len(profiel['ritten']), aantal)
+    keuze = rng.integers(0, profiel['vervoerders'].shape[1], aantal)
+    vervoerder_index = profiel['vervoerders'][perceel_index, keuze]
+    maand_index = rng.integers(0, jaren * 12, aantal)
+
+    besteld = rng.poisson(profiel['ritten'][perceel_index])
+    geannuleerd = rng.binomial(besteld, 0.08)
+    loos = rng.binomial(besteld - geannuleerd, 0.04)
+    uitgevoerd = besteld - geannuleerd - loos
+
+    facturen = {
+        'id': np.arange(start_id, start_id + aantal),
+        'jaar': van_jaar + maand_index // 12,
+        'maand': maand_index % 12 + 1,
+        'perceel': perceel_index + 1,
+        'vervoerder': profiel['namen'][vervoerder_index],
+        'vaste_kosten': np.round(rng.normal(10_000, 1_500, aantal).clip(0), 2),
+        'variabele_kosten': np.round(uitgevoerd * rng.uniform(1.0, 2.0, aantal), 2),
+        'ritten_besteld': besteld,
+        'ritten_geannuleerd': geannuleerd,
+        'ritten_loos': loos,
+        'ritten_uitgevoerd': uitgevoerd,
+        'routes': rng.binomial(uitgevoerd, 0.25)
+    }
+
+    # Afwijkingen rond de norm; sommige vervoerders structureel beter of slechter
+    afwijkingen = {'factuur_id': facturen['id']}
+    for afwijking_type, (percentage, basis) in KPI_PARAMETERS.items():
+        kans = (percentage / 100 * profiel['kwaliteit'][vervoerder_index]).clip(0, 1)
+        afwijkingen[afwijking_type] = rng.binomial(facturen[BASIS_KOLOMMEN[basis]], kans)
+    return facturen, afwijkingen
+
+def _rijen(kolommen):
+    """Rijen als tuples van Python waarden (sqlite3 kent geen numpy types)"""
+    return zip(*(waarden.tolist() for waarden in kolommen.values()))
+
+def genereer_testdata(db_file, facturen, percelen=20, vervoerders=12, jaren=3, van_jaar=2023,
+                      seed=42, chunk_size=CHUNK_SIZE):
+    """Vul een nieuwe database met synthetische facturen; geeft het aantal facturen terug"""
+    rng = np.random.default_rng(seed)
+    per_perceel = min(VERVOERDERS_PER_PERCEEL, vervoerders)
+    profiel = {
+        'ritten': rng.uniform(200, 1_500, percelen),
+        'vervoerders': np.argsort(rng.random((percelen, vervoerders)), axis=1)[:, :per_perceel],
+        'namen': np.array([f"Vervoerder {i + 1:03d}" for i in range(vervoerders)], dtype=object),
+        'kwaliteit': rng.lognormal(0, 0.5, vervoerders)
+    }
+
+    with sqlite3.connect(db_file) as conn:
+        # Eerst de basistabellen vullen; triggers en indexen volgen in init_db
+        for statement in TABELLEN:
+            conn.execute(statement)
+        conn.executemany(
+            "INSERT INTO kpi_parameters (afwijking_type, percentage, berekenings_basis) VALUES (?, ?, ?)",
+            [(afwijking_type, percentage, basis) for afwijking_type, (percentage, basis) in KPI_PARAMETERS.items()]
+        )
+        for start in range(0, facturen, chunk_size):
+            factuur_chunk, afwijking_chunk = genereer_chunk(
+                rng, start + 1, min(chunk_size, facturen - start), profiel, van_jaar, jaren
+            )
+            conn.executemany(
+                f"INSERT INTO facturen ({', '.join(FACTUUR_KOLOMMEN)}) "
+                f"VALUES ({', '.join('?' * len(FACTUUR_KOLOMMEN))})",
+                _rijen(factuur_chunk)
+            )
+            conn.executemany(
+                f"INSERT INTO afwijkingen (factuur_id, {', '.join(AFWIJKING_TYPES)}) "
+                f"VALUES ({', '.join('?' * (len(AFWIJKING_TYPES) + 1))})",
+                _rijen(afwijking_chunk)
+            )
+        conn.commit()
+
+    init_db(db_file)
+    return facturen
+
+# === CLI ===
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genereer een synthetische factuurcontrole database")
+    parser.add_argument("db", help="Nieuw database bestand")
+    parser.add_argument("--facturen", type=int, default=10_000, help="Aantal facturen (standaard: %(default)s)")
+    parser.add_argument("--percelen", type=int, default=20, help="Aantal percelen (standaard: %(default)s)")
+    parser.add_argument("--vervoerders", type=int, default=12, help="Aantal vervoerders (standaard: %(default)s)")
+    parser.add_argument("--jaren", type=int, default=3, help="Aantal jaren (standaard: %(default)s)")
+    parser.add_argument("--van-jaar", type=int, default=2023, help="Eerste jaar (standaard: %(default)s)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed voor reproduceerbare data")
+    parser.add_argument("--overschrijf", action="store_true", help="Bestaand bestand vervangen")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        if not args.overschrijf:
+            parser.error(f"{args.db} bestaat al (gebruik --overschrijf)")
+        os.remove(args.db)
+
+    start = time.perf_counter()
+    aantal = genereer_testdata(args.db, args.facturen, args.percelen, args.vervoerders,
+                               args.jaren, args.van_jaar, args.seed)
+    print(f"✅ {aantal} facturen gegenereerd in {args.db} ({time.perf_counter() - start:.1f}s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())